@@ -1,6 +1,6 @@
 "use client";
 
-import { useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { Upload, Brain, Activity, AlertCircle, CheckCircle, FileText } from "lucide-react";
 
 const getAnalysisDetails = (scanType) => {
@@ -65,12 +65,59 @@ const getAnalysisDetails = (scanType) => {
   return details[scanType] || [];
 };
 
+const SCANS_API = 'http://localhost:5003';
+
+// Analyses run as jobs so long inferences never hold a proxied request open.
+// Polls start quickly and back off; a job that outlives the timeout, or that
+// the service no longer knows (e.g. after a restart), ends as an error.
+const POLL_INITIAL_MS = 250;
+const POLL_MAX_MS = 3000;
+const POLL_TIMEOUT_MS = 5 * 60 * 1000;
+
+const readJson = async (response) => {
+  try {
+    return await response.json();
+  } catch {
+    return { error: `Unexpected response from the scan analyzer (HTTP ${response.status})` };
+  }
+};
+
+const sleep = (ms, signal) => new Promise((resolve, reject) => {
+  const timer = setTimeout(resolve, ms);
+  signal.addEventListener('abort', () => {
+    clearTimeout(timer);
+    reject(new DOMException('Aborted', 'AbortError'));
+  }, { once: true });
+});
+
+const waitForJob = async (statusUrl, signal) => {
+  const deadline = Date.now() + POLL_TIMEOUT_MS;
+  let delay = POLL_INITIAL_MS;
+  while (Date.now() < deadline) {
+    await sleep(delay, signal);
+    const response = await fetch(`${SCANS_API}${statusUrl}`, { signal });
+    if (response.status === 404) {
+      return { error: "The analysis was lost, possibly because the service restarted. Please try again." };
+    }
+    const job = await readJson(response);
+    if (job.status === 'done') return job.result;
+    if (job.status === 'failed') return { error: job.error || "Analysis failed" };
+    if (!response.ok) return { error: job.error || `Scan analyzer error (HTTP ${response.status})` };
+    delay = Math.min(delay * 2, POLL_MAX_MS);
+  }
+  return { error: "The analysis is taking too long. Please try again later." };
+};
+
 export default function ScanAnalyzer({ scanType, title, description, iconName }) {
   const [file, setFile] = useState(null);
   const [loading, setLoading] = useState(false);
   const [result, setResult] = useState(null);
   const [error, setError] = useState("");
   const [analysisProgress, setAnalysisProgress] = useState(0);
+  const pollRef = useRef(null);
+
+  // Stop polling when the page is left
+  useEffect(() => () => pollRef.current?.abort(), []);
 
   const handleFileUpload = (e) => {
     const selectedFile = e.target.files[0];
@@ -89,6 +136,10 @@ export default function ScanAnalyzer({ scanType, title, description, iconName })
     setResult(null);
     setAnalysisProgress(0);
 
+    pollRef.current?.abort();
+    const controller = new AbortController();
+    pollRef.current = controller;
+
     // Simulate real-time progress
     const progressInterval = setInterval(() => {
       setAnalysisProgress(prev => {
@@ -105,12 +156,14 @@ export default function ScanAnalyzer({ scanType, title, description, iconName })
       formData.append('file', file);
       formData.append('scan_type', scanType);
 
-      const response = await fetch('http://localhost:5003/analyze', {
+      // Queue the analysis, then poll the job until it finishes
+      const submitted = await fetch(`${SCANS_API}/jobs`, {
         method: 'POST',
-        body: formData
+        body: formData,
+        signal: controller.signal
       });
-
-      const data = await response.json();
+      const job = await readJson(submitted);
+      const data = job.error ? job : await waitForJob(job.status_url, controller.signal);
 
       clearInterval(progressInterval);
       setAnalysisProgress(100);
@@ -125,6 +178,7 @@ export default function ScanAnalyzer({ scanType, title, description, iconName })
       }
     } catch (err) {
       clearInterval(progressInterval);
+      if (err.name === 'AbortError') return;
       setError("Failed to analyze scan. Please ensure the scan analyzer service is running.");
     } finally {
       setTimeout(() => {
@@ -189,7 +243,7 @@ export default function ScanAnalyzer({ scanType, title, description, iconName })
             
             <input
               type="file"
-              accept="image/*"
+              accept="image/*,.dcm,application/dicom"
               onChange={handleFileUpload}
               className="hidden"
               id="file-upload"
@@ -0,0 +1,193 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from metrics import ADMISSIONS
+
+# Admission limits for synchronous analyses, per scan type. Each accepts a
+# default plus per-type overrides, e.g. SCANS_ADMISSION_CONCURRENCY="2,skin=1":
+#   SCANS_ADMISSION_CONCURRENCY - analyses running at once (0 = no admission control)
+#   SCANS_ADMISSION_QUEUE       - analyses waiting for a slot before new ones get 429
+#   SCANS_ADMISSION_DEADLINE    - seconds a request may wait for a slot before it gets 503
+# The limits apply per process, so per gunicorn worker.
+ADMISSION_CONCURRENCY = os.environ.get('SCANS_ADMISSION_CONCURRENCY', '2')
+ADMISSION_QUEUE = os.environ.get('SCANS_ADMISSION_QUEUE', '8')
+ADMISSION_DEADLINE = os.environ.get('SCANS_ADMISSION_DEADLINE', '10')
+
+# Service time assumed for a scan type before any analysis of it has finished
+INITIAL_SERVICE_SECONDS = 1.0
+
+# Weight of the latest analysis in the moving average of service times
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+def per_type_limits(value, cast):
+    """Parse "default,type=value,..." into (default, {scan_type: value})"""
+    default, overrides = None, {}
+    for part in str(value).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '=' in part:
+            scan_type, limit = part.split('=', 1)
+            overrides[scan_type.strip()] = cast(limit)
+        else:
+            default = cast(part)
+    return default, overrides
+
+
+class Overloaded(Exception):
+    """Raised when an analysis is refused; carries the HTTP status and Retry-After seconds"""
+
+    def __init__(self, message, reason, status, retry_after):
+        super().__init__(message)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Lane:
+    """Admission state of one scan type"""
+
+    def __init__(self, concurrency, queue_size, deadline):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self.running = 0
+        self.waiting = deque()  # tickets, first come first served
+        self.service_seconds = INITIAL_SERVICE_SECONDS
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'deadline': 0}
+
+    def expected_wait(self, ahead):
+        """Seconds until a request with `ahead` requests queued before it gets a slot"""
+        if self.running < self.concurrency and ahead == 0:
+            return 0.0
+        return (ahead + 1) * self.service_seconds / self.concurrency
+
+
+class AdmissionController:
+    """Bounded per-scan-type queues in front of synchronous analyses.
+
+    Up to `concurrency` analyses of a scan type run at once and up to
+    `queue_size` more wait for a slot in arrival order. Past that a request
+    is refused straight away with 429, so a burst gets fast "try later"
+    answers instead of every request slowing down. A queued request that
+    cannot get a slot within the deadline, or that is expected not to from
+    the recent service times, is refused with 503. Both carry a Retry-After
+    estimated from the queue ahead.
+    """
+
+    def __init__(self, scan_types, concurrency=ADMISSION_CONCURRENCY, queue_size=ADMISSION_QUEUE,
+                 deadline=ADMISSION_DEADLINE):
+        default_concurrency, concurrency_overrides = per_type_limits(concurrency, int)
+        default_queue, queue_overrides = per_type_limits(queue_size, int)
+        default_deadline, deadline_overrides = per_type_limits(deadline, float)
+        self._cond = threading.Condition()
+        self._tickets = 0
+        self._lanes = {
+            scan_type: _Lane(
+                concurrency_overrides.get(scan_type, default_concurrency or 0),
+                queue_overrides.get(scan_type, default_queue or 0),
+                deadline_overrides.get(scan_type, default_deadline or 0)
+            )
+            for scan_type in scan_types
+        }
+
+    @contextmanager
+    def admit(self, scan_type):
+        """Hold an analysis slot for the block, or raise Overloaded"""
+        lane = self._lanes.get(scan_type)
+        if lane is None or lane.concurrency <= 0:
+            yield
+            return
+
+        with self._cond:
+            try:
+                self._wait_for_slot(lane)
+            except Overloaded as e:
+                ADMISSIONS.inc(scan_type=scan_type, result=e.reason)
+                raise
+            lane.running += 1
+            lane.admitted += 1
+        ADMISSIONS.inc(scan_type=scan_type, result='admitted')
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                lane.running -= 1
+                lane.service_seconds += SERVICE_TIME_SMOOTHING * (elapsed - lane.service_seconds)
+                self._cond.notify_all()
+
+    def _wait_for_slot(self, lane):
+        # Called with self._cond held
+        if lane.running < lane.concurrency and not lane.waiting:
+            return
+        if len(lane.waiting) >= lane.queue_size:
+            lane.rejected['queue_full'] += 1
+            raise Overloaded(
+                f"Too many scans of this type in progress ({lane.queue_size} waiting)",
+                'queue_full', 429, self._retry_after(lane, len(lane.waiting))
+            )
+        if lane.deadline > 0 and lane.expected_wait(len(lane.waiting)) > lane.deadline:
+            lane.rejected['deadline'] += 1
+            raise Overloaded(
+                "Server is saturated; the scan would not start in time",
+                'deadline', 503, self._retry_after(lane, len(lane.waiting))
+            )
+
+        self._tickets += 1
+        ticket = self._tickets
+        lane.waiting.append(ticket)
+        give_up_at = time.monotonic() + lane.deadline if lane.deadline > 0 else None
+        try:
+            while lane.waiting[0] != ticket or lane.running >= lane.concurrency:
+                remaining = None if give_up_at is None else give_up_at - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    lane.rejected['deadline'] += 1
+                    raise Overloaded(
+                        f"Timed out after {lane.deadline:g}s waiting for an analysis slot",
+                        'deadline', 503, self._retry_after(lane, lane.waiting.index(ticket))
+                    )
+                self._cond.wait(remaining)
+        finally:
+            lane.waiting.remove(ticket)
+            # The next ticket may now be at the head of the queue
+            self._cond.notify_all()
+
+    def _retry_after(self, lane, ahead):
+        return max(1, math.ceil(lane.expected_wait(ahead)))
+
+    def queue_depth(self):
+        with self._cond:
+            return sum(len(lane.waiting) for lane in self._lanes.values())
+
+    def saturated(self):
+        """Scan types whose queue is full, i.e. new requests for them get 429"""
+        with self._cond:
+            return [
+                scan_type for scan_type, lane in self._lanes.items()
+                if lane.concurrency > 0 and lane.running >= lane.concurrency and len(lane.waiting) >= lane.queue_size
+            ]
+
+    def stats(self):
+        with self._cond:
+            return {
+                scan_type: {
+                    'running': lane.running,
+                    'queued': len(lane.waiting),
+                    'concurrency': lane.concurrency,
+                    'queue_size': lane.queue_size,
+                    'deadline_s': lane.deadline,
+                    'service_ms': round(lane.service_seconds * 1000, 1),
+                    'admitted': lane.admitted,
+                    'rejected': dict(lane.rejected)
+                }
+                for scan_type, lane in self._lanes.items()
+                if lane.concurrency > 0
+            }
@@ -1,5 +1,6 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context, url_for
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import cv2
 import numpy as np
 import json
@@ -7,17 +8,58 @@ from PIL import Image
 import io
 import base64
 import os
+import queue
+import threading
+import time
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 import torch
 from transformers import pipeline, AutoImageProcessor, AutoModelForImageClassification
-import pytesseract
 import requests
 from torchvision import transforms
+from model_registry import ModelRegistry, PRELOAD_MODELS
+from result_cache import ResultCache, image_digest, result_cache_key
+from phash import NearDuplicateIndex, NEAR_DUPLICATE_CACHE
+from similarity import SimilarityIndex, cv_embedding, model_embedding, new_scan_id, SIMILAR_DEFAULT_K, SIMILAR_MAX_K
+from ocr import OCREngine
+from per_process import PerProcess
+from scheduler import scheduler
+from scan_context import ScanContext, preprocess_gray
+from decoding import decode_image
+from batch import BatchRunner, BatchError, read_uploads, MAX_BATCH_BYTES
+from sniffing import UploadRejected, read_upload, MAX_UPLOAD_BYTES
+from jobs import JobManager, JobQueueFull
+from admission import AdmissionController, Overloaded
+from warmup import WarmUp, WARMUP_MODE
+from tiling import analyze_tiled, ANALYSIS_MODES, TILED_SCAN_TYPES, TILE_SIZE, TILE_OVERLAP, TILE_DECODE_MIN_SIDE
+import metrics
+from metrics import ERRORS, REQUESTS, RESULT_CACHE, RESPONSE_TIMINGS, observe_timings
 
 app = Flask(__name__)
 CORS(app)
 
+# Whole-request caps, enforced by Werkzeug while the body streams in. Only
+# /analyze-batch takes the large one; every other route is held to a single
+# upload plus room for the form fields and multipart framing.
+MAX_REQUEST_BYTES = int(os.environ.get('SCANS_MAX_REQUEST_BYTES', max(MAX_BATCH_BYTES, MAX_UPLOAD_BYTES) + 1024 * 1024))
+MAX_SINGLE_REQUEST_BYTES = MAX_UPLOAD_BYTES + 1024 * 1024
+LARGE_REQUEST_ENDPOINTS = ('analyze_batch',)
+app.config['MAX_CONTENT_LENGTH'] = MAX_SINGLE_REQUEST_BYTES
+
+# How scan-type validation runs relative to analysis:
+#   parallel - alongside analysis, result waited for (default)
+#   async    - alongside analysis, included only if finished by then
+#   serial   - before analysis
+#   skip     - not at all
+VALIDATION_MODES = ('parallel', 'async', 'serial', 'skip')
+VALIDATION_MODE = os.environ.get('SCANS_VALIDATION_MODE', 'parallel')
+VALIDATION_WORKERS = int(os.environ.get('SCANS_VALIDATION_WORKERS', 4))
+
+# Streamed responses: newline-delimited JSON or server-sent events
+STREAM_FORMATS = ('ndjson', 'sse')
+
 class ScansAnalyzer:
-    def __init__(self):
+    def __init__(self, model_specs=None, preload=True):
         self.scan_types = {
             'mri': 'MRI Brain Scan',
             'xray': 'X-Ray Analysis', 
@@ -27,77 +69,57 @@ class ScansAnalyzer:
             'skin': 'Skin Analysis',
             'liver': 'Liver Scan'
         }
-        self.models = {}
-        self.load_models()
+        self.models = ModelRegistry(specs=model_specs)
+        self.result_cache = ResultCache()
+        self.near_duplicates = NearDuplicateIndex()
+        self.similarity = SimilarityIndex()
+        self.ocr = OCREngine()
+        self._validation_executor = PerProcess(lambda: ThreadPoolExecutor(
+            max_workers=VALIDATION_WORKERS,
+            thread_name_prefix='validate'
+        ))
+        if preload:
+            self.load_models()
     
     def load_models(self):
-        """Load working Hugging Face models"""
-        print("\n🤖 Loading AI Models for Medical Scan Analysis...")
+        """Preload the configured hot models; the rest load on first use"""
+        print("\n🤖 Preparing AI Models for Medical Scan Analysis...")
         print("=" * 60)
         
         try:
-            # Working Chest X-Ray Pneumonia Detection
-            try:
-                print("👨‍⚕️ Loading Chest X-Ray Pneumonia Detection Model...")
-                self.models['chest'] = pipeline(
-                    "image-classification",
-                    model="Borjamg/pneumonia_model",
-                    device=-1
-                )
-                print("✅ Chest X-Ray Model: LOADED (Pneumonia Detection)")
-            except Exception as e:
-                print(f"❌ Chest X-Ray Model: FAILED - {e}")
-            
-            # Working Skin Lesion Classification
-            try:
-                print("🔍 Loading Skin Lesion Classification Model...")
-                self.models['skin'] = pipeline(
-                    "image-classification",
-                    model="actavkid/vit-large-patch32-384-finetuned-skin-lesion-classification",
-                    device=-1
-                )
-                print("✅ Skin Analysis Model: LOADED (12 Lesion Types)")
-            except Exception as e:
-                print(f"❌ Skin Analysis Model: FAILED - {e}")
-            
-            # Try alternative brain models
-            brain_models = [
-                "microsoft/resnet-50",  # General vision model for brain analysis
-                "google/vit-base-patch16-224"  # Vision transformer
-            ]
-            
-            for model_name in brain_models:
-                try:
-                    print(f"🧠 Loading Brain MRI Model: {model_name}...")
-                    self.models['mri'] = pipeline(
-                        "image-classification",
-                        model=model_name,
-                        device=-1
-                    )
-                    print(f"✅ Brain MRI Model: LOADED ({model_name})")
-                    break
-                except Exception as e:
-                    print(f"❌ Brain MRI Model {model_name}: FAILED - {e}")
-                    continue
+            self.models.preload(PRELOAD_MODELS)
             
             print("=" * 60)
-            print(f"🎆 MODEL LOADING COMPLETE: {len(self.models)}/7 AI models loaded")
-            print(f"📊 Loaded Models: {list(self.models.keys())}")
+            print(f"🎆 MODEL PRELOAD COMPLETE: {len(self.models)}/{len(self.models.specs)} AI models loaded")
+            print(f"📊 Loaded Models: {self.models.keys()}")
+            print(f"💤 Lazy Models: {[t for t in self.models.specs if t not in self.models.keys()]}")
             print(f"🛠️ Fallback: Advanced Computer Vision for remaining scan types")
             print("=" * 60)
             
         except Exception as e:
-            print(f"❌ Critical Error loading models: {e}")
-            self.models = {}
+            print(f"❌ Critical Error preloading models: {e}")
     
     def validate_scan_type(self, image, scan_type):
         """Validate if uploaded image matches the expected scan type using OCR and image analysis"""
+        is_valid, validation_msg, _ = self.checked_validation(image, scan_type)
+        return is_valid, validation_msg
+    
+    def checked_validation(self, image, scan_type):
+        """validate_scan_type plus whether validation completed.
+        
+        A validation that fails to run (OCR timeout, tesseract missing) lets
+        the scan through with a warning; its result must not be cached.
+        """
         try:
-            # Convert to grayscale for OCR
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            context = ScanContext.of(image, scan_type)
+            image = context.image
+            
+            # Grayscale for OCR, shared with preprocessing
+            gray = context.gray
             
-            # Extract text using OCR
-            text = pytesseract.image_to_string(gray).lower()
+            # Extract text using the persistent OCR engine (downscaled, with timeout)
+            with context.stage('ocr'):
+                text = self.ocr.image_to_string(gray).lower()
             
             # Define keywords for each scan type
             keywords = {
@@ -116,41 +138,31 @@ class ScansAnalyzer:
             
             # Basic validation based on image characteristics
             if scan_type == 'chest' and (aspect_ratio < 0.8 or aspect_ratio > 1.5):
-                return False, "Image dimensions don't match typical chest X-ray format"
+                return False, "Image dimensions don't match typical chest X-ray format", True
             
             # Check for relevant keywords
             scan_keywords = keywords.get(scan_type, [])
             found_keywords = [kw for kw in scan_keywords if kw in text]
             
             if len(found_keywords) > 0:
-                return True, f"Validated: Found relevant keywords {found_keywords}"
+                return True, f"Validated: Found relevant keywords {found_keywords}", True
             
             # If no keywords found, still allow but with warning
-            return True, "No specific keywords found, proceeding with analysis"
+            return True, "No specific keywords found, proceeding with analysis", True
             
         except Exception as e:
-            return True, f"Validation warning: {str(e)}"
+            ERRORS.inc(scan_type=scan_type, stage='validation')
+            return True, f"Validation warning: {str(e)}", False
         
     def preprocess_image(self, image, scan_type):
         """Preprocess image based on scan type"""
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        if scan_type in ['chest', 'xray']:
-            # CLAHE for chest/xray contrast enhancement
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            gray = clahe.apply(gray)
-        
-        # Resize to standard size
-        resized = cv2.resize(gray, (224, 224))
-        
-        # Normalize
-        normalized = resized / 255.0
-        
-        return normalized
+        if isinstance(image, ScanContext):
+            return ScanContext.of(image, scan_type).processed
+        return preprocess_gray(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), scan_type)
     
     def analyze_mri(self, image):
         """Analyze MRI brain scan using AI model + computer vision"""
-        processed = self.preprocess_image(image, 'mri')
+        context = ScanContext.of(image, 'mri')
         
         findings = []
         confidence_scores = {}
@@ -158,40 +170,34 @@ class ScansAnalyzer:
         # Use AI model if available
         if 'mri' in self.models:
             try:
-                pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-                predictions = self.models['mri'](pil_image)
+                with context.stage('inference'), self.models.lease('mri') as model:
+                    # None when no candidate checkpoint loads; the CV analysis still runs
+                    predictions = model(context.rgb_pil) if model is not None else []
                 
                 for pred in predictions:
                     if pred['score'] > 0.4:
                         findings.append(f"AI Detection: {pred['label']}")
                         confidence_scores[f"AI_{pred['label']}"] = pred['score']
             except Exception as e:
+                ERRORS.inc(scan_type='mri', stage='inference')
                 print(f"MRI AI model error: {e}")
         
         # Advanced image analysis for MRI
         # Detect potential tumor regions using edge detection and contour analysis
-        edges = cv2.Canny((processed * 255).astype(np.uint8), 30, 100)
-        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contours = context.edge_contours(30, 100)
         
-        # Analyze brain symmetry
-        height, width = processed.shape
-        left_half = processed[:, :width//2]
-        right_half = np.fliplr(processed[:, width//2:])
+        # Region statistics (brain symmetry, intensities), shared with the vectorized batch path
+        features = context.features
         
         # Calculate symmetry score
-        symmetry_diff = np.mean(np.abs(left_half - right_half))
+        symmetry_diff = features['symmetry_diff']
         
         if symmetry_diff > 0.15:
             findings.append("Brain asymmetry detected - possible mass effect")
             confidence_scores["Asymmetry"] = min(0.95, symmetry_diff * 5)
         
-        # Detect abnormal intensity regions
-        mean_intensity = np.mean(processed)
-        std_intensity = np.std(processed)
-        
-        # Find regions with abnormal intensity
-        abnormal_regions = np.where(processed > mean_intensity + 2*std_intensity)
-        if len(abnormal_regions[0]) > 100:
+        # Find regions with abnormal intensity (above mean + 2 std)
+        if features['abnormal_pixels'] > 100:
             findings.append("Hyperintense lesions detected")
             confidence_scores["Hyperintense Lesions"] = 0.78
         
@@ -202,8 +208,7 @@ class ScansAnalyzer:
             confidence_scores["Multiple Lesions"] = 0.82
         
         # Ventricular analysis
-        center_region = processed[height//3:2*height//3, width//3:2*width//3]
-        if np.mean(center_region) < 0.2:  # Dark regions indicating enlarged ventricles
+        if features['center_mean'] < 0.2:  # Dark regions indicating enlarged ventricles
             findings.append("Possible ventricular enlargement")
             confidence_scores["Ventricular Enlargement"] = 0.71
         
@@ -220,14 +225,15 @@ class ScansAnalyzer:
     
     def analyze_xray(self, image):
         """Analyze X-Ray using advanced computer vision"""
-        processed = self.preprocess_image(image, 'xray')
+        context = ScanContext.of(image, 'xray')
+        processed = context.processed
         
         findings = []
         confidence_scores = {}
         
         # Advanced fracture detection
         # Apply Gaussian blur to reduce noise
-        blurred = cv2.GaussianBlur((processed * 255).astype(np.uint8), (5, 5), 0)
+        blurred = cv2.GaussianBlur(context.processed_u8, (5, 5), 0)
         
         # Multiple edge detection techniques
         edges_canny = cv2.Canny(blurred, 50, 150)
@@ -287,7 +293,8 @@ class ScansAnalyzer:
     
     def analyze_chest(self, image):
         """Analyze Chest scan using Hugging Face model and advanced CV"""
-        processed = self.preprocess_image(image, 'chest')
+        context = ScanContext.of(image, 'chest')
+        processed = context.processed
         
         findings = []
         confidence_scores = {}
@@ -295,12 +302,10 @@ class ScansAnalyzer:
         # Use Hugging Face model if available
         if 'chest' in self.models:
             try:
-                # Convert processed image back to PIL for HF model
-                pil_image = Image.fromarray((processed * 255).astype(np.uint8))
-                pil_image = pil_image.convert('RGB')
-                
-                # Get prediction from HF model
-                predictions = self.models['chest'](pil_image)
+                # Get prediction from HF model on the preprocessed image
+                with context.stage('inference'), self.models.lease('chest') as model:
+                    # None when no candidate checkpoint loads; the CV analysis still runs
+                    predictions = model(context.processed_pil) if model is not None else []
                 
                 for pred in predictions:
                     if pred['score'] > 0.5:
@@ -311,34 +316,28 @@ class ScansAnalyzer:
                             findings.append(f"Abnormality detected - {pred['label']}")
                             confidence_scores[pred['label']] = pred['score']
             except Exception as e:
+                ERRORS.inc(scan_type='chest', stage='inference')
                 print(f"HF model error: {e}")
         
-        # Advanced lung field analysis
-        height, width = processed.shape
-        
-        # Define lung regions more accurately
-        left_lung = processed[height//4:3*height//4, width//8:width//2-width//8]
-        right_lung = processed[height//4:3*height//4, width//2+width//8:7*width//8]
+        # Advanced lung field analysis; region statistics shared with the vectorized batch path
+        width = processed.shape[1]
+        features = context.features
         
         # Lung opacity analysis
-        left_opacity = np.mean(left_lung)
-        right_opacity = np.mean(right_lung)
+        left_opacity = features['left_opacity']
+        right_opacity = features['right_opacity']
         
         if abs(left_opacity - right_opacity) > 0.2:
             findings.append("Significant lung field asymmetry")
             confidence_scores["Lung Asymmetry"] = min(0.95, abs(left_opacity - right_opacity) * 4)
         
-        # Detect consolidations (high opacity regions)
-        consolidation_threshold = np.mean(processed) + 2 * np.std(processed)
-        consolidations = np.where(processed > consolidation_threshold)
-        
-        if len(consolidations[0]) > 200:
+        # Detect consolidations (high opacity regions, above mean + 2 std)
+        if features['consolidation_pixels'] > 200:
             findings.append("Pulmonary consolidation detected")
             confidence_scores["Consolidation"] = 0.82
         
         # Heart size analysis (cardiothoracic ratio)
-        heart_region = processed[height//3:2*height//3, 2*width//5:3*width//5]
-        heart_width = np.sum(np.max(heart_region, axis=0) > 0.6)
+        heart_width = features['heart_width']
         chest_width = width
         
         cardiothoracic_ratio = heart_width / chest_width
@@ -347,14 +346,12 @@ class ScansAnalyzer:
             confidence_scores["Cardiomegaly"] = min(0.95, cardiothoracic_ratio * 1.5)
         
         # Pleural effusion detection
-        lower_chest = processed[2*height//3:, :]
-        if np.mean(lower_chest) > 0.7:
+        if features['lower_chest_mean'] > 0.7:
             findings.append("Possible pleural effusion")
             confidence_scores["Pleural Effusion"] = 0.74
         
         # Pneumothorax detection (abnormal air spaces)
-        air_spaces = np.where(processed < 0.1)
-        if len(air_spaces[0]) > 500:
+        if features['air_pixels'] > 500:
             findings.append("Possible pneumothorax")
             confidence_scores["Pneumothorax"] = 0.69
         
@@ -370,20 +367,20 @@ class ScansAnalyzer:
     
     def analyze_kidney(self, image):
         """Analyze Kidney scan"""
-        processed = self.preprocess_image(image, 'kidney')
+        context = ScanContext.of(image, 'kidney')
         
         findings = []
         confidence_scores = {}
         
         # Kidney contour analysis
-        contours, _ = cv2.findContours((processed * 255).astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contours = context.contours
         
         if len(contours) > 5:
             findings.append("Multiple cystic lesions detected")
             confidence_scores["Cysts"] = 0.73
         
         # Size analysis
-        kidney_area = np.sum(processed > 0.3)
+        kidney_area = context.features['kidney_area']
         if kidney_area < 5000:
             findings.append("Possible kidney atrophy")
             confidence_scores["Atrophy"] = 0.69
@@ -400,21 +397,20 @@ class ScansAnalyzer:
     
     def analyze_heart(self, image):
         """Analyze Heart scan"""
-        processed = self.preprocess_image(image, 'heart')
+        features = ScanContext.of(image, 'heart').features
         
         findings = []
         confidence_scores = {}
         
         # Heart size analysis
-        heart_region = processed[80:144, 80:144]
-        heart_area = np.sum(heart_region > 0.4)
+        heart_area = features['heart_area']
         
         if heart_area > 2000:
             findings.append("Cardiomegaly detected")
             confidence_scores["Cardiomegaly"] = 0.81
         
         # Wall thickness analysis
-        wall_thickness = np.mean(heart_region[20:44, 20:44])
+        wall_thickness = features['wall_thickness']
         if wall_thickness > 0.7:
             findings.append("Possible ventricular hypertrophy")
             confidence_scores["Hypertrophy"] = 0.74
@@ -431,7 +427,9 @@ class ScansAnalyzer:
     
     def analyze_skin(self, image):
         """Analyze Skin lesion using Hugging Face model and ABCDE criteria"""
-        processed = self.preprocess_image(image, 'skin')
+        context = ScanContext.of(image, 'skin')
+        image = context.image
+        processed = context.processed
         
         findings = []
         confidence_scores = {}
@@ -439,11 +437,10 @@ class ScansAnalyzer:
         # Use Hugging Face model if available
         if 'skin' in self.models:
             try:
-                # Convert to RGB PIL image for HF model
-                pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-                
-                # Get prediction from HF model
-                predictions = self.models['skin'](pil_image)
+                # Get prediction from HF model on the RGB image
+                with context.stage('inference'), self.models.lease('skin') as model:
+                    # None when no candidate checkpoint loads; the CV analysis still runs
+                    predictions = model(context.rgb_pil) if model is not None else []
                 
                 for pred in predictions:
                     if pred['score'] > 0.3:
@@ -455,6 +452,7 @@ class ScansAnalyzer:
                             findings.append("HIGH RISK: Malignant lesion detected")
                             confidence_scores["Malignancy Risk"] = pred['score']
             except Exception as e:
+                ERRORS.inc(scan_type='skin', stage='inference')
                 print(f"HF skin model error: {e}")
         
         # ABCDE Analysis (Asymmetry, Border, Color, Diameter, Evolution)
@@ -465,7 +463,7 @@ class ScansAnalyzer:
             processed = cv2.cvtColor(processed, cv2.COLOR_BGR2GRAY)
         
         # Find lesion contour
-        _, binary = cv2.threshold((processed * 255).astype(np.uint8), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        _, binary = cv2.threshold(context.processed_u8, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
         if contours:
@@ -497,7 +495,7 @@ class ScansAnalyzer:
                     confidence_scores["Asymmetry"] = min(0.95, asymmetry_score * 2)
         
         # B - Border Irregularity
-        edges = cv2.Canny((processed * 255).astype(np.uint8), 50, 150)
+        edges = context.edges(50, 150)
         border_complexity = np.sum(edges > 0) / (np.sum(processed < 0.8) + 1)  # Avoid division by zero
         
         if border_complexity > 0.1:
@@ -526,13 +524,13 @@ class ScansAnalyzer:
                 confidence_scores["Large Diameter"] = min(0.95, estimated_diameter_pixels / 100)
         
         # Additional risk factors
-        mean_intensity = np.mean(processed)
+        mean_intensity = context.mean
         if mean_intensity < 0.3:  # Very dark lesions
             findings.append("Very dark pigmentation - monitor closely")
             confidence_scores["Dark Pigmentation"] = 0.75
         
         # Texture analysis
-        texture_variance = np.var(processed)
+        texture_variance = context.var
         if texture_variance > 0.05:
             findings.append("Heterogeneous texture detected")
             confidence_scores["Texture Heterogeneity"] = min(0.95, texture_variance * 15)
@@ -553,25 +551,25 @@ class ScansAnalyzer:
     
     def analyze_liver(self, image):
         """Analyze Liver scan"""
-        processed = self.preprocess_image(image, 'liver')
+        context = ScanContext.of(image, 'liver')
         
         findings = []
         confidence_scores = {}
         
         # Liver density analysis
-        liver_density = np.mean(processed)
+        liver_density = context.features['density']
         if liver_density > 0.6:
             findings.append("Increased liver density - possible fatty liver")
             confidence_scores["Fatty Liver"] = 0.77
         
         # Texture analysis
-        texture_variance = np.var(processed)
+        texture_variance = context.features['texture_variance']
         if texture_variance > 0.05:
             findings.append("Heterogeneous liver texture")
             confidence_scores["Texture Abnormality"] = 0.71
         
         # Nodule detection
-        contours, _ = cv2.findContours((processed * 255).astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contours = context.contours
         if len(contours) > 8:
             findings.append("Multiple nodular lesions")
             confidence_scores["Nodules"] = 0.69
@@ -586,8 +584,21 @@ class ScansAnalyzer:
             "recommendations": ["Hepatologist consultation"] if findings else ["Regular liver function monitoring"]
         }
     
-    def analyze_scan(self, image, scan_type):
-        """Main analysis function"""
+    def validation_pool(self):
+        return self._validation_executor.get()
+    
+    def timed_validation(self, context, scan_type):
+        with context.stage('validation'):
+            return self.checked_validation(context, scan_type)
+    
+    def analyze_scan(self, image, scan_type, validation_mode=None, include_timings=False, analysis_mode=None,
+                     near_duplicates=None, on_heuristics=None):
+        """Main analysis function; image may be a BGR array or a ScanContext.
+        
+        on_heuristics, if given, is called with the CV-only findings before
+        the AI model runs, for scan types that have one (progressive mode).
+        """
+        started = time.perf_counter()
         analyzers = {
             'mri': self.analyze_mri,
             'xray': self.analyze_xray,
@@ -601,16 +612,144 @@ class ScansAnalyzer:
         if scan_type not in analyzers:
             return {"error": "Unsupported scan type"}
         
-        # Validate scan type
-        is_valid, validation_msg = self.validate_scan_type(image, scan_type)
+        # One context per request, so validation and analysis share derived images
+        context = ScanContext.of(image, scan_type)
+        image = context.image
+        
+        # Serve repeated uploads of the same scan from the result cache, keyed by
+        # the checkpoint that actually loads (a fallback candidate has its own id)
+        model_id = self.models.resolved_id(scan_type) or 'cv'
+        embedder = model_id
+        tiled = analysis_mode == 'tiled' and scan_type in TILED_SCAN_TYPES
+        if tiled:
+            model_id += f":tiled-{TILE_SIZE}-{TILE_OVERLAP}"
+        cache_key = result_cache_key(image_digest(image), scan_type, model_id)
+        cached = self.result_cache.get(cache_key)
+        RESULT_CACHE.inc(scan_type=scan_type, result='miss' if cached is None else 'hit')
+        if cached is not None:
+            REQUESTS.inc(scan_type=scan_type, outcome='cached')
+            return self._finish_timings(cached, context, started, include_timings)
+        
+        # Then re-encoded or resized copies of a recent scan, by perceptual hash
+        namespace = f"{scan_type}:{model_id}"
+        if NEAR_DUPLICATE_CACHE if near_duplicates is None else near_duplicates:
+            cached = self.near_duplicate_result(context, namespace)
+            if cached is not None:
+                REQUESTS.inc(scan_type=scan_type, outcome='cached')
+                return self._finish_timings(cached, context, started, include_timings)
+        
+        # Validate scan type; OpenCV, tesseract and torch release the GIL,
+        # so running validation beside the analysis costs max() not sum()
+        mode = validation_mode or VALIDATION_MODE
+        validation = None
+        pending = None
+        if mode == 'serial':
+            validation = self.timed_validation(context, scan_type)
+        elif mode in ('parallel', 'async'):
+            pending = self.validation_pool().submit(self.timed_validation, context, scan_type)
+        
+        try:
+            if on_heuristics is not None and not tiled and scan_type in self.models:
+                with context.stage('heuristics'):
+                    with self.models.cv_only():
+                        heuristics = analyzers[scan_type](context)
+                on_heuristics(heuristics)
+            # Drop features left over from an earlier call on this thread
+            self.models.take_embedding(scan_type)
+            with context.stage('analysis'):
+                result = analyzers[scan_type](context)
+            features = self.models.take_embedding(scan_type)
+            if tiled:
+                with context.stage('tiling'), self.models.lease(scan_type) as model:
+                    result = analyze_tiled(context, result, model)
+        except Exception:
+            ERRORS.inc(scan_type=scan_type, stage='analysis')
+            REQUESTS.inc(scan_type=scan_type, outcome='error')
+            raise
+        
+        if pending is not None and (mode == 'parallel' or pending.done()):
+            validation = pending.result()
+        
+        validated = False
+        if validation is not None:
+            is_valid, validation_msg, validated = validation
+        elif mode == 'skip':
+            is_valid, validation_msg = None, "Validation skipped"
+        else:
+            is_valid, validation_msg = None, "Validation still running, not included in this result"
         
-        result = analyzers[scan_type](image)
         result["validation_message"] = validation_msg
         result["image_validated"] = is_valid
-        
+        # Cached repeats keep the id, so they point at the same indexed scan
+        result["scan_id"] = new_scan_id()
+        
+        # Index the scan for similar-case retrieval; the embedding comes from the
+        # model's forward pass above, or from the image when no model ran
+        if self.similarity.enabled and is_valid is not False:
+            if features is None:
+                embedder, vector = 'cv', cv_embedding(context.processed)
+            else:
+                vector = model_embedding(features)
+            self.similarity.add(scan_type, embedder, result["scan_id"], vector)
+        
+        # Only fully validated (and, when tiled, fully tiled) results are cached;
+        # skipped, still-running and failed validations would stick for the TTL
+        if validated and result.get('tiling', {}).get('complete', True):
+            self.result_cache.put(cache_key, result)
+            self.near_duplicates.add(namespace, context.perceptual_hash, cache_key)
+        REQUESTS.inc(scan_type=scan_type, outcome='success')
+        return self._finish_timings(result, context, started, include_timings)
+    
+    def near_duplicate_result(self, context, namespace):
+        """Cached result of a recent scan perceptually identical to this one, or None.
+        
+        The result was not computed from this upload, so it says so: it has
+        no scan_id of its own, and near_duplicate names the scan it came from.
+        """
+        match = self.near_duplicates.find(namespace, context.perceptual_hash)
+        if match is None:
+            return None
+        key, distance = match
+        cached = self.result_cache.peek(key)
+        RESULT_CACHE.inc(scan_type=context.scan_type, result='near_miss' if cached is None else 'near_hit')
+        if cached is not None:
+            cached['near_duplicate'] = {
+                'matched': True,
+                'source_scan_id': cached.pop('scan_id', None),
+                'distance_bits': distance,
+                'threshold_bits': self.near_duplicates.threshold
+            }
+        return cached
+    
+    def _finish_timings(self, result, context, started, include_timings):
+        # Copy first: async validation may still be adding stages
+        timings = dict(context.timings)
+        timings['total'] = timings.get('decode', 0.0) + (time.perf_counter() - started) * 1000
+        observe_timings(context.scan_type, timings)
+        if include_timings:
+            result['timings'] = {stage: round(elapsed_ms, 2) for stage, elapsed_ms in timings.items()}
         return result
 
-analyzer = ScansAnalyzer()
+# Batch decode workers import the main module again (batch.decode_process_context);
+# under `python app.py` that is this file, and they must not load or warm models
+DECODE_WORKER = __name__ == '__mp_main__'
+
+analyzer = ScansAnalyzer(preload=not DECODE_WORKER)
+batch_runner = BatchRunner(analyzer)
+job_manager = JobManager(analyzer)
+admission = AdmissionController(analyzer.scan_types)
+warmup = WarmUp(analyzer)
+warmup.start('off' if DECODE_WORKER else WARMUP_MODE)
+
+@app.before_request
+def limit_request_size():
+    # Per-request limits need Flask 3.1+
+    if request.endpoint in LARGE_REQUEST_ENDPOINTS:
+        request.max_content_length = MAX_REQUEST_BYTES
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f"Request exceeds {request.max_content_length // (1024 * 1024)} MB"}), 413
 
 @app.route('/')
 def index():
@@ -675,7 +814,7 @@ def index():
         </div>
         
         <div class="upload-area">
-            <input type="file" id="fileInput" accept="image/*" style="display: none;">
+            <input type="file" id="fileInput" accept="image/*,.dcm,application/dicom" style="display: none;">
             <button onclick="document.getElementById('fileInput').click()">Upload Scan Image</button>
             <p>Selected scan type: <span id="selectedType">None</span></p>
             <p>Supports: JPG, PNG, DICOM images</p>
@@ -753,6 +892,42 @@ def index():
     </html>
     ''')
 
+def wants_timings():
+    """Per-request 'timings' flag (query or form), else the SCANS_RESPONSE_TIMINGS default"""
+    value = request.args.get('timings') or request.form.get('timings')
+    if value is None:
+        return RESPONSE_TIMINGS
+    return value.lower() in ('1', 'true', 'yes')
+
+def wants_near_duplicates():
+    """Per-request 'near_duplicates' flag, else None for the SCANS_NEAR_DUPLICATE_CACHE default"""
+    value = request.args.get('near_duplicates') or request.form.get('near_duplicates')
+    if value is None:
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+def requested_analysis_mode(scan_type):
+    """The 'mode' form field, validated: (mode, error message)"""
+    mode = request.form.get('mode') or 'standard'
+    if mode not in ANALYSIS_MODES:
+        return None, f"Analysis mode must be one of {list(ANALYSIS_MODES)}"
+    if mode == 'tiled' and scan_type not in TILED_SCAN_TYPES:
+        return None, f"Tiled analysis is only available for {list(TILED_SCAN_TYPES)} scans"
+    return mode, None
+
+def decode_upload(image_bytes, scan_type, analysis_mode=None):
+    """Decode a checked upload into a ScanContext, or None if it is not an image"""
+    # Tiled analysis keeps more of the original resolution
+    decode_started = time.perf_counter()
+    min_side = TILE_DECODE_MIN_SIDE if analysis_mode == 'tiled' else None
+    image = decode_image(image_bytes, scan_type, min_side)
+    if image is None:
+        ERRORS.inc(scan_type=scan_type, stage='decode')
+        return None
+    context = ScanContext(image, scan_type)
+    context.timings['decode'] = (time.perf_counter() - decode_started) * 1000
+    return context
+
 @app.route('/analyze', methods=['POST'])
 def analyze_scan():
     try:
@@ -765,19 +940,45 @@ def analyze_scan():
         if not scan_type:
             return jsonify({'error': 'Scan type not specified'}), 400
         
+        if scan_type not in analyzer.scan_types:
+            return jsonify({'error': 'Unsupported scan type'}), 400
+        
+        validation_mode = request.form.get('validation')
+        if validation_mode and validation_mode not in VALIDATION_MODES:
+            return jsonify({'error': f"Validation mode must be one of {list(VALIDATION_MODES)}"}), 400
+        
+        analysis_mode, error = requested_analysis_mode(scan_type)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Progressive mode: CV heuristics first, then the full result
+        stream_format = request.args.get('stream') or request.form.get('stream')
+        if stream_format and stream_format not in STREAM_FORMATS:
+            return jsonify({'error': f"Stream format must be one of {list(STREAM_FORMATS)}"}), 400
+        
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        # Read image
-        image_bytes = file.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Size and header checks, so bad uploads never reach the decoder
+        image_bytes, _ = read_upload(file)
+        options = {
+            'validation_mode': validation_mode,
+            'include_timings': wants_timings(),
+            'analysis_mode': analysis_mode,
+            'near_duplicates': wants_near_duplicates()
+        }
         
-        if image is None:
-            return jsonify({'error': 'Invalid image format'}), 400
+        if stream_format:
+            return stream_analysis(image_bytes, file.filename, scan_type, options, stream_format)
         
-        # Analyze scan
-        result = analyzer.analyze_scan(image, scan_type)
+        # Decoding and analysis only start once the scan type has a free slot
+        with admission.admit(scan_type):
+            context = decode_upload(image_bytes, scan_type, analysis_mode)
+            if context is None:
+                return jsonify({'error': 'Invalid image format'}), 400
+            
+            # Analyze scan
+            result = analyzer.analyze_scan(context, scan_type, **options)
         
         return jsonify({
             'success': True,
@@ -785,23 +986,287 @@ def analyze_scan():
             **result
         })
         
+    except UploadRejected as e:
+        ERRORS.inc(scan_type=scan_type, stage='upload')
+        return jsonify({'error': str(e)}), e.status
+    except Overloaded as e:
+        return jsonify({'error': str(e), 'retry_after': e.retry_after}), e.status, {'Retry-After': str(e.retry_after)}
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/analyze-batch', methods=['POST'])
+def analyze_batch():
+    try:
+        files = request.files.getlist('files') + request.files.getlist('file')
+        files = [f for f in files if f.filename != '']
+        if not files:
+            return jsonify({'error': 'No files uploaded'}), 400
+        
+        scan_type = request.form.get('scan_type')
+        if not scan_type:
+            return jsonify({'error': 'Scan type not specified'}), 400
+        
+        if scan_type not in analyzer.scan_types:
+            return jsonify({'error': 'Unsupported scan type'}), 400
+        
+        validation_mode = request.form.get('validation')
+        if validation_mode and validation_mode not in VALIDATION_MODES:
+            return jsonify({'error': f"Validation mode must be one of {list(VALIDATION_MODES)}"}), 400
+        
+        # Multiple files and/or ZIP archives of scans
+        uploads = read_uploads(files)
+        
+        stream_format = request.args.get('stream') or request.form.get('stream')
+        if stream_format:
+            if stream_format not in STREAM_FORMATS:
+                return jsonify({'error': f"Stream format must be one of {list(STREAM_FORMATS)}"}), 400
+            return stream_batch(uploads, scan_type, validation_mode, stream_format)
+        
+        results = batch_runner.run(uploads, scan_type, validation_mode)
+        
+        return jsonify({
+            'success': True,
+            'scan_type': scan_type,
+            'total': len(results),
+            'results': results
+        })
+        
+    except BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue an analysis and return its job id; poll GET /jobs/<id> for the result"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file uploaded'}), 400
+        
+        file = request.files['file']
+        scan_type = request.form.get('scan_type')
+        
+        if not scan_type:
+            return jsonify({'error': 'Scan type not specified'}), 400
+        
+        if scan_type not in analyzer.scan_types:
+            return jsonify({'error': 'Unsupported scan type'}), 400
+        
+        validation_mode = request.form.get('validation')
+        if validation_mode and validation_mode not in VALIDATION_MODES:
+            return jsonify({'error': f"Validation mode must be one of {list(VALIDATION_MODES)}"}), 400
+        
+        analysis_mode, error = requested_analysis_mode(scan_type)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+        
+        image_bytes, _ = read_upload(file)
+        job_id = job_manager.submit(image_bytes, file.filename, scan_type, validation_mode, analysis_mode)
+        status_url = url_for('job_status', job_id=job_id)
+        
+        response = jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': status_url
+        })
+        return response, 202, {'Location': status_url}
+        
+    except UploadRejected as e:
+        ERRORS.inc(scan_type=scan_type, stage='upload')
+        return jsonify({'error': str(e)}), e.status
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(job)
+
+@app.route('/similar')
+def similar_scans():
+    """Most similar earlier scans of the same type to an analyzed scan, by its scan_id"""
+    scan_type = request.args.get('scan_type')
+    scan_id = request.args.get('scan_id')
+    if scan_type not in analyzer.scan_types:
+        return jsonify({'error': 'Unsupported scan type'}), 400
+    if not scan_id:
+        return jsonify({'error': 'scan_id not specified'}), 400
+    if not analyzer.similarity.enabled:
+        return jsonify({'error': 'Similarity index is disabled'}), 404
+    try:
+        k = min(int(request.args.get('k', SIMILAR_DEFAULT_K)), SIMILAR_MAX_K)
+    except ValueError:
+        return jsonify({'error': 'k must be an integer'}), 400
+    if k < 1:
+        return jsonify({'error': 'k must be at least 1'}), 400
+
+    started = time.perf_counter()
+    found = analyzer.similarity.similar(scan_type, scan_id, k)
+    if found is None:
+        return jsonify({'error': 'Scan not found in the similarity index'}), 404
+    embedder, results = found
+    return jsonify({
+        'scan_id': scan_id,
+        'scan_type': scan_type,
+        'embedder': embedder,
+        'similar': [{'scan_id': match, 'similarity': round(score, 4)} for match, score in results],
+        'search_ms': round((time.perf_counter() - started) * 1000, 2)
+    })
+
+def stream_event(stream_format, event, payload):
+    data = json.dumps({'event': event, **payload}, default=float)
+    if stream_format == 'sse':
+        return f"event: {event}\ndata: {data}\n\n"
+    return data + "\n"
+
+def stream_response(events, stream_format):
+    mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(events),
+        mimetype=mimetype,
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def stream_batch(uploads, scan_type, validation_mode, stream_format):
+    """Stream one event per file as soon as it is analyzed, as NDJSON or SSE"""
+    def encode(event, payload):
+        return stream_event(stream_format, event, payload)
+    
+    def generate():
+        started = time.perf_counter()
+        total = len(uploads)
+        yield encode('start', {'scan_type': scan_type, 'total': total})
+        
+        completed = 0
+        try:
+            for index, result, timing in batch_runner.iter_results(uploads, scan_type, validation_mode):
+                completed += 1
+                yield encode('result', {
+                    'index': index,
+                    'filename': result.get('filename'),
+                    'completed': completed,
+                    'total': total,
+                    'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+                    'timing': timing,
+                    'result': result
+                })
+        except Exception as e:
+            yield encode('error', {'error': str(e), 'completed': completed, 'total': total})
+            return
+        
+        yield encode('done', {
+            'completed': completed,
+            'total': total,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        })
+    
+    return stream_response(generate(), stream_format)
+
+def stream_analysis(image_bytes, filename, scan_type, options, stream_format):
+    """Stream one scan's CV heuristics as soon as they are ready, then the full result.
+    
+    Events: 'start'; 'heuristics' with the CV-only findings, for scan types
+    with an AI model; then 'result' with the AI findings merged in, exactly
+    as /analyze returns it (or 'error'). The analysis runs on its own thread
+    holding the admission slot, so it finishes even if the client leaves.
+    """
+    # Refused before any bytes are streamed, so the client still gets 429/503
+    slot = ExitStack()
+    slot.enter_context(admission.admit(scan_type))
+    events = queue.Queue()
+    
+    def analyze():
+        try:
+            context = decode_upload(image_bytes, scan_type, options['analysis_mode'])
+            if context is None:
+                events.put(('error', {'error': 'Invalid image format'}))
+                return
+            result = analyzer.analyze_scan(
+                context, scan_type, **options,
+                on_heuristics=lambda heuristics: events.put(('heuristics', {'ai_pending': True, 'result': heuristics}))
+            )
+            events.put(('result', {'result': {'success': True, 'filename': filename, **result}}))
+        except Exception as e:
+            events.put(('error', {'error': str(e)}))
+        finally:
+            slot.close()
+            events.put(None)
+    
+    threading.Thread(target=analyze, name='progressive-analysis', daemon=True).start()
+    
+    def generate():
+        started = time.perf_counter()
+        yield stream_event(stream_format, 'start', {'scan_type': scan_type, 'filename': filename})
+        while True:
+            item = events.get()
+            if item is None:
+                return
+            event, payload = item
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+            yield stream_event(stream_format, event, {'elapsed_ms': elapsed_ms, **payload})
+    
+    return stream_response(generate(), stream_format)
+
 @app.route('/health')
 def health():
+    jobs = job_manager.stats()
     return jsonify({
         'status': 'healthy', 
         'service': 'scans-analyzer',
-        'loaded_models': list(analyzer.models.keys()),
+        'loaded_models': analyzer.models.keys(),
         'total_models': len(analyzer.models),
+        'model_memory_mb': round(analyzer.models.memory_usage_mb(), 1),
+        'inference_backend': analyzer.models.backend,
+        'inference_scheduler': scheduler.stats(),
+        'result_cache': analyzer.result_cache.stats(),
+        'near_duplicates': analyzer.near_duplicates.stats(),
+        'similarity_index': analyzer.similarity.stats(),
+        'jobs': jobs,
+        # Analyses waiting for a slot, synchronous and queued jobs, for load balancers
+        'queue_depth': admission.queue_depth() + jobs['queued'],
+        'saturated_scan_types': admission.saturated(),
+        'admission': admission.stats(),
         'supported_scans': list(analyzer.scan_types.keys())
     })
 
+@app.route('/ready')
+def ready():
+    """Readiness: 200 once warm-up has finished, 503 while it is running"""
+    report = warmup.report()
+    return jsonify({'service': 'scans-analyzer', **report}), 200 if report['ready'] else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Point-in-time gauges are sampled at scrape time
+    inference = scheduler.stats()
+    metrics.MODELS_LOADED.set(len(analyzer.models))
+    metrics.MODEL_MEMORY.set(int(analyzer.models.memory_usage_mb() * 1024 * 1024))
+    metrics.INFERENCES_RUNNING.set(sum(inference['running'].values()))
+    metrics.INFERENCES_WAITING.set(inference['waiting'])
+    for scan_type, lane in admission.stats().items():
+        metrics.ADMISSION_QUEUED.set(lane['queued'], scan_type=scan_type)
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/models')
 def models_status():
     return jsonify({
-        'loaded_ai_models': list(analyzer.models.keys()),
+        'loaded_ai_models': analyzer.models.keys(),
+        # Checkpoint and the backend it actually loaded on (ONNX falls back to torch)
+        'loaded_model_ids': {scan_type: analyzer.models.model_id(scan_type) for scan_type in analyzer.models.keys()},
         'total_ai_models': len(analyzer.models),
         'scan_types': analyzer.scan_types,
         'model_details': {
@@ -0,0 +1,101 @@
+import os
+import numpy as np
+from transformers import pipeline, AutoConfig, AutoImageProcessor
+from model_store import store, checked_revision, load_snapshot_pipeline, MODELS_OFFLINE
+
+try:
+    import onnxruntime
+except ImportError:  # only the torch backend is available
+    onnxruntime = None
+
+# torch (fp32 pipeline), onnx (exported fp32 graph) or onnx-int8 (dynamically quantized graph)
+INFERENCE_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+INFERENCE_BACKEND = os.environ.get('SCANS_INFERENCE_BACKEND', 'torch')
+ONNX_MODEL_DIR = os.environ.get('SCANS_ONNX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'onnx'))
+ONNX_THREADS = int(os.environ.get('SCANS_ONNX_THREADS', 0))  # 0 = onnxruntime default
+
+# Same default as the transformers image-classification pipeline
+TOP_K = 5
+
+
+def onnx_export_dir(model_name):
+    """Directory holding the ONNX export of a Hugging Face checkpoint"""
+    return os.path.join(ONNX_MODEL_DIR, model_name.strip('/').replace('/', '__'))
+
+
+def onnx_model_path(model_name, quantized=False):
+    return os.path.join(onnx_export_dir(model_name), 'model.int8.onnx' if quantized else 'model.onnx')
+
+
+def load_backend(model_name, backend=INFERENCE_BACKEND):
+    """Load an image classifier that is call-compatible with the HF pipeline.
+
+    Returns (classifier, backend that loaded); an ONNX backend whose export
+    or runtime is missing falls back to torch and reports 'torch'.
+    """
+    if backend in ('onnx', 'onnx-int8'):
+        quantized = backend == 'onnx-int8'
+        path = onnx_model_path(model_name, quantized)
+        if onnxruntime is None:
+            print(f"⚠️ {backend} backend requested but onnxruntime is not installed, using torch")
+        elif not os.path.exists(path):
+            print(f"⚠️ No {backend} export at {path} (run export_onnx.py), using torch")
+        else:
+            return OnnxClassifier(model_name, path), backend
+
+    # Pinned local snapshot first; the Hub only when allowed
+    revision = checked_revision(model_name)
+    snapshot = store.snapshot(model_name)
+    if snapshot is not None:
+        return load_snapshot_pipeline(snapshot), 'torch'
+    if MODELS_OFFLINE:
+        raise FileNotFoundError(f"No local snapshot of {model_name} (run download_models.py)")
+
+    return pipeline(
+        "image-classification",
+        model=model_name,
+        revision=revision,
+        device=-1
+    ), 'torch'
+
+
+class OnnxClassifier:
+    """Image classifier running an exported ONNX graph on onnxruntime.
+
+    Accepts a PIL image or a list of them and returns predictions in the
+    same shape as the transformers image-classification pipeline.
+    """
+
+    def __init__(self, model_name, path):
+        export_dir = os.path.dirname(path)
+        self.model_name = model_name
+        self.path = path
+        self.model_bytes = os.path.getsize(path)
+        self.processor = AutoImageProcessor.from_pretrained(export_dir)
+        config = AutoConfig.from_pretrained(export_dir)
+        self.id2label = {int(i): label for i, label in config.id2label.items()}
+        self.multi_label = config.problem_type == 'multi_label_classification' or config.num_labels == 1
+
+        options = onnxruntime.SessionOptions()
+        if ONNX_THREADS > 0:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def __call__(self, images, batch_size=None, top_k=TOP_K):
+        single = not isinstance(images, list)
+        batch = [images] if single else images
+
+        inputs = self.processor(images=batch, return_tensors='np')
+        logits = self.session.run(['logits'], {'pixel_values': inputs['pixel_values'].astype(np.float32)})[0]
+        if self.multi_label:
+            scores = 1 / (1 + np.exp(-logits))
+        else:
+            shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+            scores = shifted / shifted.sum(axis=-1, keepdims=True)
+
+        k = min(top_k, scores.shape[-1])
+        results = []
+        for row in scores:
+            top = np.argsort(-row, kind='stable')[:k]
+            results.append([{'label': self.id2label[int(i)], 'score': float(row[i])} for i in top])
+        return results[0] if single else results
@@ -0,0 +1,219 @@
+import io
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import cv2
+from decoding import decode_image
+from per_process import PerProcess
+from scan_context import ScanContext
+from sniffing import UploadRejected, check_upload
+from vectorized import attach_features
+
+BATCH_DECODE_WORKERS = int(os.environ.get('SCANS_BATCH_DECODE_WORKERS', min(4, os.cpu_count() or 1)))  # 0 = decode in-process
+BATCH_ANALYSIS_WORKERS = int(os.environ.get('SCANS_BATCH_ANALYSIS_WORKERS', 8))
+MAX_BATCH_FILES = int(os.environ.get('SCANS_MAX_BATCH_FILES', 200))
+MAX_BATCH_BYTES = int(os.environ.get('SCANS_MAX_BATCH_BYTES', 512 * 1024 * 1024))
+
+
+class BatchError(Exception):
+    """Raised when a batch upload is malformed or over its limits"""
+
+
+def read_uploads(files):
+    """Read uploaded files into (filename, bytes) pairs, expanding ZIP archives"""
+    uploads = []
+    total_bytes = 0
+    for file in files:
+        data = file.read()
+        if zipfile.is_zipfile(io.BytesIO(data)):
+            entries = _zip_entries(data)
+        else:
+            entries = [(file.filename, data)]
+
+        for filename, content in entries:
+            uploads.append((filename, content))
+            total_bytes += len(content)
+            if len(uploads) > MAX_BATCH_FILES:
+                raise BatchError(f"Batch exceeds {MAX_BATCH_FILES} files")
+            if total_bytes > MAX_BATCH_BYTES:
+                raise BatchError(f"Batch exceeds {MAX_BATCH_BYTES // (1024 * 1024)} MB")
+    return uploads
+
+
+def _zip_entries(data):
+    entries = []
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+            and not os.path.basename(info.filename).startswith('.')
+        ]
+        # Check declared sizes before inflating anything
+        if len(members) > MAX_BATCH_FILES:
+            raise BatchError(f"Batch exceeds {MAX_BATCH_FILES} files")
+        if sum(info.file_size for info in members) > MAX_BATCH_BYTES:
+            raise BatchError(f"Batch exceeds {MAX_BATCH_BYTES // (1024 * 1024)} MB")
+        for info in members:
+            entries.append((info.filename, archive.read(info)))
+    return entries
+
+
+def prepare_scan(item):
+    """Decode and preprocess one upload; runs in the decode process pool.
+
+    Returns (filename, context, error); the context is None if the upload
+    was rejected or could not be decoded.
+    """
+    filename, data, scan_type = item
+    try:
+        check_upload(data)
+        image = decode_image(data, scan_type)
+        if image is None:
+            return filename, None, 'Invalid image format'
+        context = ScanContext(image, scan_type)
+        context.processed  # memoized, travels back with the context
+        return filename, context, None
+    except UploadRejected as e:
+        return filename, None, str(e)
+    except Exception as e:
+        print(f"Batch decode error for {filename}: {e}")
+        return filename, None, 'Invalid image format'
+
+
+def _init_decode_worker():
+    # One OpenCV thread per process; the pool itself provides the parallelism
+    cv2.setNumThreads(1)
+
+
+def decode_process_context():
+    """Start method for the decode pool.
+
+    The pool starts lazily inside a running server whose batching, executor
+    and torch threads may hold locks at that moment; a fork()ed child would
+    inherit them held and can deadlock. Workers instead come from a fork
+    server, a fresh single-threaded process that preloads only this module,
+    or are spawned where there is none. Like any non-fork pool, the workers
+    import the parent's __main__ first; app.py skips model loading and
+    warm-up when it is imported that way.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+class BatchRunner:
+    """Analyze many scans with the same semantics as ScansAnalyzer.analyze_scan.
+
+    Decoding and preprocessing run in a process pool. Analyses run on a
+    thread pool so concurrent model calls are coalesced by BatchedPipeline
+    into batched forward passes.
+    """
+
+    def __init__(self, analyzer, decode_workers=BATCH_DECODE_WORKERS, analysis_workers=BATCH_ANALYSIS_WORKERS):
+        self.analyzer = analyzer
+        self.decode_workers = decode_workers
+        self.analysis_workers = max(1, analysis_workers)
+        self._executors = PerProcess(self._create_pools)
+
+    def run(self, uploads, scan_type, validation_mode=None):
+        """Analyze (filename, bytes) uploads and return per-file results in input order"""
+        results = [None] * len(uploads)
+        for index, result, _ in self.iter_results(uploads, scan_type, validation_mode):
+            results[index] = result
+        return results
+
+    def iter_results(self, uploads, scan_type, validation_mode=None):
+        """Yield (index, result, timing) for each upload as soon as it is analyzed.
+
+        Only a window of scans is decoded or analyzed at any time, so memory
+        stays bounded however large the batch is. Scans whose decodes finish
+        together get their heuristic statistics in one vectorized pass.
+        """
+        decode_pool, analysis_pool = self._executors.get()
+        window = self.analysis_workers + max(1, self.decode_workers)
+        remaining = iter(enumerate(uploads))
+        decoding = {}  # future -> (index, filename, started)
+        analyzing = {}  # future -> index
+
+        def decode_next():
+            for index, (filename, data) in remaining:
+                # Without a decode pool, decode on the analysis threads
+                pool = decode_pool if decode_pool is not None else analysis_pool
+                future = pool.submit(prepare_scan, (filename, data, scan_type))
+                decoding[future] = (index, filename, time.perf_counter())
+                return
+
+        for _ in range(window):
+            decode_next()
+
+        while decoding or analyzing:
+            done, _ = wait(list(decoding) + list(analyzing), return_when=FIRST_COMPLETED)
+            decoded = []
+            finished = []
+            for future in done:
+                if future in decoding:
+                    index, filename, started = decoding.pop(future)
+                    context, error = self._decoded(future)
+                    decoded.append((index, filename, context, error, started, time.perf_counter()))
+                else:
+                    finished.append((analyzing.pop(future), *future.result()))
+
+            attach_features([context for _, _, context, _, _, _ in decoded if context is not None])
+            for index, filename, context, error, started, decoded_at in decoded:
+                future = analysis_pool.submit(
+                    self._analyze, filename, context, error, scan_type, validation_mode, started, decoded_at
+                )
+                analyzing[future] = index
+
+            for index, result, timing in finished:
+                decode_next()
+                yield index, result, timing
+
+    def _decoded(self, future):
+        try:
+            _, context, error = future.result()
+            return context, error
+        except BrokenProcessPool:
+            # A decode worker died; start fresh pools for the next batch
+            self._executors.reset()
+            raise
+
+    def _analyze(self, filename, context, error, scan_type, validation_mode, started, decoded):
+        if context is None:
+            result = {'filename': filename, 'error': error}
+        else:
+            try:
+                result = self.analyzer.analyze_scan(context, scan_type, validation_mode)
+                if 'error' in result:
+                    result = {'filename': filename, **result}
+                else:
+                    result = {'success': True, 'filename': filename, **result}
+            except Exception as e:
+                result = {'filename': filename, 'error': str(e)}
+        finished = time.perf_counter()
+
+        timing = {
+            'decode_ms': round((decoded - started) * 1000, 2),
+            'analysis_ms': round((finished - decoded) * 1000, 2),
+            'total_ms': round((finished - started) * 1000, 2)
+        }
+        return result, timing
+
+    def _create_pools(self):
+        decode_executor = None
+        if self.decode_workers > 0:
+            decode_executor = ProcessPoolExecutor(
+                max_workers=self.decode_workers,
+                mp_context=decode_process_context(),
+                initializer=_init_decode_worker
+            )
+        analysis_executor = ThreadPoolExecutor(
+            max_workers=self.analysis_workers,
+            thread_name_prefix='batch-analyze'
+        )
+        return decode_executor, analysis_executor
@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from queue import Queue, Empty
+import numpy as np
+import torch
+from per_process import PerProcess
+from scheduler import scheduler as default_scheduler
+
+# Micro-batching window and size, shared by every scan type
+BATCH_WINDOW_MS = float(os.environ.get('SCANS_BATCH_WINDOW_MS', 10))
+MAX_BATCH_SIZE = int(os.environ.get('SCANS_MAX_BATCH_SIZE', 8))
+
+# Longest a caller waits for its batched result, queueing included (0 = no limit)
+BATCH_TIMEOUT = float(os.environ.get('SCANS_BATCH_TIMEOUT', 300))
+
+
+class PipelineClosed(RuntimeError):
+    """Raised when a pipeline is called after close(), e.g. once its model is unloaded"""
+
+
+class BatchedPipeline:
+    """Coalesce concurrent single-image calls into one batched pipeline call.
+
+    Callers use it exactly like the wrapped Hugging Face pipeline
+    (``predictions = batched(pil_image)``). Requests arriving within
+    ``window_ms`` of the first queued one, up to ``max_batch_size``, are run
+    as a single forward pass and the results are fanned back out. Every
+    forward pass runs inside a scheduler slot for its scan type.
+
+    The input of a torch model's classifier head (its pooled backbone
+    features) is captured during the same forward pass, and the calling
+    thread can collect its image's row with ``take_embedding()``.
+    """
+
+    def __init__(self, pipe, name, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE, scheduler=None,
+                 timeout=BATCH_TIMEOUT):
+        self.pipe = pipe
+        self.name = name
+        self.scheduler = scheduler or default_scheduler
+        self.window = max(0.0, window_ms / 1000.0)
+        self.max_batch_size = max(1, max_batch_size)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._closed = False
+        self._worker = PerProcess(self._start_worker)  # the worker's queue
+        self._local = threading.local()
+        self._hooked = None
+
+    def __getattr__(self, attr):
+        # Expose model/processor attributes of the wrapped pipeline
+        return getattr(self.pipe, attr)
+
+    def __call__(self, image):
+        self._local.embedding = None
+        future = self._submit(image)
+        if future is None:
+            with self.scheduler.slot(self.name), self._capturing() as capture:
+                predictions = self.pipe(image)
+            features = capture.features(1)
+            self._local.embedding = None if features is None else features[0]
+            return predictions
+
+        try:
+            predictions, self._local.embedding = future.result(timeout=self.timeout if self.timeout > 0 else None)
+        except FutureTimeout:
+            # The worker skips images whose callers have given up
+            future.cancel()
+            raise TimeoutError(f"{self.name} inference timed out after {self.timeout:g}s")
+        return predictions
+
+    def take_embedding(self):
+        """Pooled features from the calling thread's last call, or None; cleared once taken"""
+        embedding = getattr(self._local, 'embedding', None)
+        self._local.embedding = None
+        return embedding
+
+    def predict_batch(self, images):
+        """Run a caller-assembled list of images as one forward pass"""
+        if self._closed:
+            raise PipelineClosed(f"{self.name} model has been unloaded")
+        with self.scheduler.slot(self.name):
+            return self.pipe(images, batch_size=len(images))
+
+    def close(self):
+        """Stop the batching worker once it has run the queued calls; later calls raise PipelineClosed"""
+        with self._lock:
+            self._closed = True
+            queue = self._worker.reset()
+            if queue is not None:
+                queue.put((None, None))
+
+    def _submit(self, image):
+        """Queue an image for the batching worker; None if it should run unbatched"""
+        with self._lock:
+            if self._closed:
+                raise PipelineClosed(f"{self.name} model has been unloaded")
+            if self.window <= 0 or self.max_batch_size <= 1:
+                return None
+            # Under the lock, so close() cannot post its sentinel ahead of this image
+            future = Future()
+            self._worker.get().put((image, future))
+            return future
+
+    def _start_worker(self):
+        queue = Queue()
+        threading.Thread(target=self._run, args=(queue,), name=f"batch-{self.name}", daemon=True).start()
+        return queue
+
+    def _run(self, queue):
+        while True:
+            image, future = queue.get()
+            if future is None:
+                break
+
+            batch = [(image, future)]
+            stopping = False
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    image, future = queue.get(timeout=remaining)
+                except Empty:
+                    break
+                if future is None:
+                    stopping = True
+                    break
+                batch.append((image, future))
+
+            self._execute(batch)
+            if stopping:
+                break
+        self._drain(queue)
+
+    def _drain(self, queue):
+        # Run anything left behind the sentinel rather than strand its caller
+        leftover = []
+        while True:
+            try:
+                image, future = queue.get_nowait()
+            except Empty:
+                break
+            if future is not None:
+                leftover.append((image, future))
+        for start in range(0, len(leftover), self.max_batch_size):
+            self._execute(leftover[start:start + self.max_batch_size])
+
+    def _execute(self, batch):
+        batch = [(image, future) for image, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        images = [image for image, _ in batch]
+        try:
+            with self.scheduler.slot(self.name), self._capturing() as capture:
+                outputs = self.pipe(images, batch_size=len(images))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        features = capture.features(len(images))
+        for i, ((_, future), predictions) in enumerate(zip(batch, outputs)):
+            future.set_result((predictions, None if features is None else features[i]))
+
+    @contextmanager
+    def _capturing(self):
+        capture = _FeatureCapture()
+        if self._install_hook():
+            self._local.capture = capture
+        try:
+            yield capture
+        finally:
+            self._local.capture = None
+
+    def _install_hook(self):
+        with self._lock:
+            if self._hooked is None:
+                head = getattr(getattr(self.pipe, 'model', None), 'classifier', None)
+                self._hooked = isinstance(head, torch.nn.Module)
+                if self._hooked:
+                    head.register_forward_pre_hook(self._capture_features)
+            return self._hooked
+
+    def _capture_features(self, module, args):
+        capture = getattr(self._local, 'capture', None)
+        if capture is not None and args:
+            capture.rows.append(args[0].detach().flatten(1).float().cpu().numpy())
+
+
+class _FeatureCapture:
+    """Classifier head inputs seen during one pipeline call"""
+
+    def __init__(self):
+        self.rows = []
+
+    def features(self, count):
+        # Only trusted if there is exactly one row per image
+        if not self.rows:
+            return None
+        features = np.concatenate(self.rows)
+        return features if len(features) == count else None
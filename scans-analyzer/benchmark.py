@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the scan analyzers on synthetic images.
+
+    python benchmark.py                              # every scan type, default resolutions
+    python benchmark.py chest skin --iterations 50   # selected scan types
+    python benchmark.py --output bench.json          # keep the report for comparison
+
+Tiny randomly initialised classifiers stand in for the Hugging Face
+checkpoints, so nothing is downloaded and numbers are comparable across
+commits. The JSON report holds per-stage latency percentiles, end-to-end
+throughput and peak memory for every scan type and resolution.
+"""
+
+import os
+
+# Never reach the Hub, and leave model loading to the stand-ins below
+os.environ['HF_HUB_OFFLINE'] = '1'
+os.environ['TRANSFORMERS_OFFLINE'] = '1'
+os.environ['SCANS_PRELOAD_MODELS'] = ''
+os.environ['SCANS_WARMUP'] = 'off'
+os.environ['SCANS_RESULT_CACHE_DB'] = ''
+os.environ['SCANS_SIMILARITY_DIR'] = ''
+
+import argparse
+import contextlib
+import datetime
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+import torch
+import transformers
+from transformers import ViTConfig, ViTForImageClassification, ViTImageProcessor
+
+SCAN_TYPES = ['mri', 'xray', 'chest', 'kidney', 'heart', 'skin', 'liver']
+
+# Labels chosen so the analyzers' label checks (pneumonia, melanoma...) are exercised
+STAND_IN_LABELS = {
+    'chest': ['NORMAL', 'PNEUMONIA'],
+    'skin': ['melanoma', 'nevus', 'basal cell carcinoma', 'benign keratosis'],
+    'mri': ['glioma', 'meningioma', 'no tumor', 'pituitary']
+}
+
+DEFAULT_RESOLUTIONS = ['256x256', '512x512', '1024x1024', '2048x1536']
+
+
+def build_stand_in_models(directory, seed=0):
+    """Save a tiny random ViT classifier per AI scan type; returns model specs"""
+    specs = {}
+    for scan_type, labels in STAND_IN_LABELS.items():
+        torch.manual_seed(seed)
+        config = ViTConfig(
+            image_size=64,
+            patch_size=16,
+            hidden_size=32,
+            num_hidden_layers=2,
+            num_attention_heads=2,
+            intermediate_size=64,
+            id2label=dict(enumerate(labels)),
+            label2id={label: i for i, label in enumerate(labels)}
+        )
+        path = os.path.join(directory, scan_type)
+        ViTForImageClassification(config).eval().save_pretrained(path)
+        ViTImageProcessor(size={'height': 64, 'width': 64}).save_pretrained(path)
+        specs[scan_type] = [path]
+    return specs
+
+
+def synthetic_scan(width, height, rng):
+    """Grayscale-looking BGR image with soft anatomy-like structure and noise"""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = 60 + 80 * np.exp(-(((x - width / 2) / (0.35 * width)) ** 2 + ((y - height / 2) / (0.4 * height)) ** 2))
+    for _ in range(3):
+        cx, cy = rng.uniform(0.2, 0.8) * width, rng.uniform(0.2, 0.8) * height
+        radius = rng.uniform(0.05, 0.15) * min(width, height)
+        image += 90 * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * radius ** 2))
+    image += rng.normal(0, 8, image.shape)
+    gray = np.clip(image, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def encode(image, image_format):
+    params = [cv2.IMWRITE_JPEG_QUALITY, 95] if image_format == 'jpeg' else []
+    ok, buffer = cv2.imencode('.jpg' if image_format == 'jpeg' else '.png', image, params)
+    if not ok:
+        raise RuntimeError(f"Could not encode synthetic {image_format}")
+    return buffer.tobytes()
+
+
+def parse_resolution(value):
+    try:
+        width, height = (int(side) for side in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"resolution must look like 512x512, got '{value}'")
+    return width, height
+
+
+def summarize(samples_ms):
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+    return {
+        'n': len(samples),
+        'mean_ms': round(float(samples.mean()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p90_ms': round(float(p90), 3),
+        'p99_ms': round(float(p99), 3),
+        'min_ms': round(float(samples.min()), 3),
+        'max_ms': round(float(samples.max()), 3)
+    }
+
+
+def timed(stages, name, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    stages.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+    return result
+
+
+def run_once(analyzer, data, scan_type, validation_mode, stages):
+    """One upload through every stage in isolation, then end to end"""
+    from decoding import decode_image
+    from scan_context import ScanContext
+
+    image = timed(stages, 'decode', decode_image, data, scan_type)
+    context = ScanContext(image, scan_type)
+    timed(stages, 'preprocess', lambda: context.processed)
+    timed(stages, 'validate', analyzer.validate_scan_type, context, scan_type)
+    if scan_type in analyzer.models:
+        with analyzer.models.lease(scan_type) as model:
+            timed(stages, 'inference', model, context.rgb_pil)
+    # Reuses the context's derived images, like analyze_scan does after validation
+    timed(stages, 'analyze', getattr(analyzer, f"analyze_{scan_type}"), context)
+
+    start = time.perf_counter()
+    analyzer.analyze_scan(decode_image(data, scan_type), scan_type, validation_mode)
+    stages.setdefault('end_to_end', []).append((time.perf_counter() - start) * 1000)
+
+
+def peak_traced_mb(analyzer, data, scan_type, validation_mode):
+    """Peak Python/numpy allocation of one end-to-end run (torch allocations not included)"""
+    from decoding import decode_image
+
+    tracemalloc.start()
+    try:
+        analyzer.analyze_scan(decode_image(data, scan_type), scan_type, validation_mode)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / (1024 * 1024), 3)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def max_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def benchmark(args, log):
+    from app import ScansAnalyzer
+    from result_cache import ResultCache
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory(prefix='scans-benchmark-') as model_dir:
+        analyzer = ScansAnalyzer(model_specs=build_stand_in_models(model_dir, args.seed))
+        # Every iteration must do the full work, not hit the result cache
+        analyzer.result_cache = ResultCache(max_entries=0, db_path='')
+
+        results = {}
+        for scan_type in args.scan_types:
+            results[scan_type] = {}
+            for width, height in args.resolutions:
+                uploads = [encode(synthetic_scan(width, height, rng), args.format) for _ in range(args.images)]
+
+                for i in range(args.warmup):
+                    run_once(analyzer, uploads[i % len(uploads)], scan_type, args.validation, {})
+
+                stages = {}
+                for i in range(args.iterations):
+                    run_once(analyzer, uploads[i % len(uploads)], scan_type, args.validation, stages)
+
+                total_s = sum(stages['end_to_end']) / 1000
+                results[scan_type][f"{width}x{height}"] = {
+                    'upload_bytes': int(np.mean([len(data) for data in uploads])),
+                    'stages': {name: summarize(samples) for name, samples in stages.items()},
+                    'throughput_per_s': round(args.iterations / total_s, 3) if total_s else None,
+                    'peak_traced_mb': peak_traced_mb(analyzer, uploads[0], scan_type, args.validation)
+                }
+                end_to_end = results[scan_type][f"{width}x{height}"]['stages']['end_to_end']
+                log(f"⏱️ {scan_type} {width}x{height}: p50 {end_to_end['p50_ms']:.1f} ms, "
+                    f"p99 {end_to_end['p99_ms']:.1f} ms")
+
+        return {
+            'meta': {
+                'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'git_commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'torch_threads': torch.get_num_threads(),
+                'numpy': np.__version__,
+                'opencv': cv2.__version__,
+                'torch': torch.__version__,
+                'transformers': transformers.__version__,
+                'inference_backend': analyzer.models.backend
+            },
+            'config': {
+                'scan_types': args.scan_types,
+                'resolutions': [f"{w}x{h}" for w, h in args.resolutions],
+                'iterations': args.iterations,
+                'warmup': args.warmup,
+                'images': args.images,
+                'format': args.format,
+                'validation': args.validation,
+                'seed': args.seed
+            },
+            'results': results,
+            'max_rss_mb': max_rss_mb()
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scan analyzers offline on synthetic images")
+    parser.add_argument('scan_types', nargs='*', default=SCAN_TYPES, help="scan types to benchmark")
+    parser.add_argument('--resolutions', nargs='+', type=parse_resolution,
+                        default=[parse_resolution(r) for r in DEFAULT_RESOLUTIONS], help="WIDTHxHEIGHT of the uploads")
+    parser.add_argument('--iterations', type=int, default=20, help="timed runs per scan type and resolution")
+    parser.add_argument('--warmup', type=int, default=2, help="untimed runs before timing")
+    parser.add_argument('--images', type=int, default=4, help="distinct synthetic images per resolution")
+    parser.add_argument('--format', choices=['jpeg', 'png'], default='jpeg', help="upload encoding")
+    parser.add_argument('--validation', choices=['parallel', 'async', 'serial', 'skip'], default='parallel',
+                        help="validation mode for the end-to-end stage")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    unknown = [t for t in args.scan_types if t not in SCAN_TYPES]
+    if unknown:
+        parser.error(f"unknown scan types: {', '.join(unknown)}")
+    if args.iterations < 1 or args.images < 1:
+        parser.error("--iterations and --images must be at least 1")
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    # The analyzer logs to stdout; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = benchmark(args, log)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        log(f"✅ Benchmark report written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import io
+import os
+import cv2
+import numpy as np
+from scan_context import WORKING_SIZE
+from sniffing import is_dicom, sniff_header
+
+try:
+    import pydicom
+except ImportError:  # DICOM uploads are rejected as invalid images
+    pydicom = None
+
+# Longest side DICOM pixel data is reduced to before any float conversion
+DICOM_MAX_SIDE = int(os.environ.get('SCANS_DICOM_MAX_SIDE', 1024))
+
+# Longest side worth decoding for raster uploads; OCR downscales to 1024 and
+# the largest model input is 384, so anything beyond is wasted (0 = full size)
+DECODE_MIN_SIDE = int(os.environ.get('SCANS_DECODE_MIN_SIDE', 1024))
+
+# Per scan type overrides, e.g. "skin:1536,heart:512"
+DECODE_MIN_SIDE_BY_TYPE = {
+    scan_type.strip(): int(side)
+    for scan_type, side in (
+        entry.split(':') for entry in os.environ.get('SCANS_DECODE_MIN_SIDE_BY_TYPE', '').split(',') if ':' in entry
+    )
+}
+
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+)
+
+PIXEL_DATA = 0x7FE00010
+
+# Transfer syntaxes whose pixel data sits in the file as plain samples:
+# Implicit and Explicit VR Little Endian, and Explicit VR Big Endian.
+# Deflated and encapsulated syntaxes go through pydicom's decoders.
+NATIVE_TRANSFER_SYNTAXES = {'1.2.840.10008.1.2', '1.2.840.10008.1.2.1', '1.2.840.10008.1.2.2'}
+
+
+def decode_image(image_bytes, scan_type=None, min_side=None):
+    """Decode uploaded bytes to a BGR image, or None if they are not an image"""
+    if is_dicom(image_bytes):
+        return decode_dicom(image_bytes, DICOM_MAX_SIDE if min_side is None else min_side)
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    return cv2.imdecode(nparr, decode_flag(image_bytes, scan_type, min_side))
+
+
+def decode_flag(image_bytes, scan_type=None, min_side=None):
+    """Pick the strongest reduced-resolution decode that still satisfies every consumer.
+
+    JPEGs are then decoded at 1/2, 1/4 or 1/8 scale directly in the DCT
+    domain. Other formats are left at full size: OpenCV would decode them
+    fully and then resize, which saves nothing and changes the pixels.
+    """
+    target = min_side if min_side is not None else DECODE_MIN_SIDE_BY_TYPE.get(scan_type, DECODE_MIN_SIDE)
+    if target <= 0:
+        return cv2.IMREAD_COLOR
+    header = sniff_header(image_bytes)
+    if header is None or header.format != 'jpeg':
+        return cv2.IMREAD_COLOR
+
+    longest, shortest = max(header.width, header.height), min(header.width, header.height)
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        # Keep the longest side for OCR and the shortest above the analyzers' working size
+        if longest // factor >= target and shortest // factor >= min(WORKING_SIZE):
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_dicom(data, max_side=DICOM_MAX_SIDE):
+    """Decode a DICOM upload to an 8-bit BGR image no larger than max_side.
+
+    Uncompressed pixel data is viewed in place in the upload buffer and
+    decimated by striding before it is copied, so a 16-bit 4k x 4k image is
+    never materialised as a full-size float array. The modality LUT and
+    VOI window (or, for colour, the stored bit range) are then applied to
+    the small copy only.
+    """
+    if pydicom is None:
+        print("DICOM upload received but pydicom is not installed")
+        return None
+    try:
+        ds = pydicom.dcmread(io.BytesIO(data), defer_size=1024)
+        pixels = _pixel_view(ds, data)
+        if pixels is None:
+            # Compressed and deflated transfer syntaxes need pydicom's decoders
+            ds = pydicom.dcmread(io.BytesIO(data))
+            pixels = _middle_frame(ds, ds.pixel_array)
+
+        samples = int(ds.get('SamplesPerPixel', 1))
+        step = _decimation_step(pixels.shape[:2], max_side)
+        small = pixels[::step, ::step]
+
+        if samples == 3:
+            image = cv2.cvtColor(_scale_color(ds, small), cv2.COLOR_RGB2BGR)
+        else:
+            image = cv2.cvtColor(_window(ds, small), cv2.COLOR_GRAY2BGR)
+        return _fit(image, max_side)
+    except Exception as e:
+        print(f"DICOM decode error: {e}")
+        return None
+
+
+def _pixel_view(ds, data):
+    """Zero-copy view of native pixel data, or None if it must be decoded by pydicom"""
+    if ds.file_meta.get('TransferSyntaxUID') not in NATIVE_TRANSFER_SYNTAXES:
+        return None
+    element = ds.get_item(PIXEL_DATA, keep_deferred=True)
+    offset = getattr(element, 'value_tell', None)
+    if offset is None:
+        return None
+
+    rows, cols = int(ds.Rows), int(ds.Columns)
+    samples = int(ds.get('SamplesPerPixel', 1))
+    frames = int(ds.get('NumberOfFrames', 1) or 1)
+    bits = int(ds.BitsAllocated)
+    if bits not in (8, 16, 32):
+        return None
+    kind = 'i' if int(ds.get('PixelRepresentation', 0)) == 1 else 'u'
+    byteorder = '<' if ds.file_meta.TransferSyntaxUID.is_little_endian else '>'
+    dtype = np.dtype(f"{byteorder}{kind}{bits // 8}")
+
+    count = frames * rows * cols * samples
+    if offset + count * dtype.itemsize > len(data):
+        # Pixel data shorter than the image it describes; let pydicom judge it
+        return None
+    pixels = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+    if samples == 1:
+        pixels = pixels.reshape(frames, rows, cols)
+    elif int(ds.get('PlanarConfiguration', 0)) == 1:
+        pixels = pixels.reshape(frames, samples, rows, cols).transpose(0, 2, 3, 1)
+    else:
+        pixels = pixels.reshape(frames, rows, cols, samples)
+    return pixels[frames // 2]
+
+
+def _middle_frame(ds, pixels):
+    frames = int(ds.get('NumberOfFrames', 1) or 1)
+    return pixels[frames // 2] if frames > 1 else pixels
+
+
+def _decimation_step(shape, max_side):
+    # Largest stride that keeps the image at or above the target; the final
+    # area resize averages the remainder
+    if max_side <= 0:
+        return 1
+    return max(1, max(shape) // max_side)
+
+
+def _scale_color(ds, pixels):
+    """Scale colour samples from their stored bit range to 8 bits"""
+    if pixels.dtype == np.uint8:
+        return np.ascontiguousarray(pixels)
+    bits = int(ds.get('BitsStored', pixels.dtype.itemsize * 8) or 8)
+    values = pixels.astype(np.float32)
+    values *= 255 / max(2 ** bits - 1, 1)
+    return np.clip(values, 0, 255, out=values).astype(np.uint8)
+
+
+def _window(ds, pixels):
+    """Apply the modality LUT and VOI window, returning an 8-bit image"""
+    values = pixels.astype(np.float32)
+    slope = float(ds.get('RescaleSlope', 1) or 1)
+    intercept = float(ds.get('RescaleIntercept', 0) or 0)
+    values *= slope
+    values += intercept
+
+    center, width = ds.get('WindowCenter'), ds.get('WindowWidth')
+    if center is not None and width is not None:
+        center = float(center[0] if isinstance(center, pydicom.multival.MultiValue) else center)
+        width = max(float(width[0] if isinstance(width, pydicom.multival.MultiValue) else width), 1.0)
+        low, high = center - width / 2, center + width / 2
+    else:
+        low, high = float(values.min()), float(values.max())
+
+    values -= low
+    values *= 255 / max(high - low, 1e-6)
+    image = np.clip(values, 0, 255, out=values).astype(np.uint8)
+    if ds.get('PhotometricInterpretation') == 'MONOCHROME1':
+        image = 255 - image
+    return image
+
+
+def _fit(image, max_side):
+    height, width = image.shape[:2]
+    if max_side <= 0 or max(height, width) <= max_side:
+        return image
+    scale = max_side / max(height, width)
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Download the scan classifiers into the local model store as pinned
+safetensors snapshots, so the service starts without the Hub.
+
+    python download_models.py              # every checkpoint in models.json
+    python download_models.py skin        # only the skin checkpoints
+    python download_models.py --pin       # resolve branches to commits and pin them in models.json
+    python download_models.py --verify    # re-hash the stored snapshots
+
+Then serve with SCANS_MODELS_OFFLINE=1 to forbid any Hub access.
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+from huggingface_hub import HfApi
+from transformers import AutoImageProcessor, AutoModelForImageClassification
+from model_store import store, load_manifest, is_commit_hash, MODEL_MANIFEST
+
+
+def resolve_revision(model_name, revision):
+    """Commit hash a branch or tag currently points at"""
+    if is_commit_hash(revision):
+        return revision
+    return HfApi().model_info(model_name, revision=revision or 'main').sha
+
+
+def download(model_name, revision):
+    # Download into a throwaway cache; the store keeps the only copy
+    with tempfile.TemporaryDirectory(prefix='scans-download-') as cache_dir:
+        model = AutoModelForImageClassification.from_pretrained(model_name, revision=revision, cache_dir=cache_dir)
+        processor = AutoImageProcessor.from_pretrained(model_name, revision=revision, cache_dir=cache_dir)
+        return store.write(model_name, revision, model, processor)
+
+
+def pin(resolved):
+    with open(MODEL_MANIFEST) as f:
+        manifest = json.load(f)
+    for model_name, revision in resolved.items():
+        manifest['models'][model_name]['revision'] = revision
+    with open(MODEL_MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    print(f"📌 Pinned {len(resolved)} checkpoint(s) in {MODEL_MANIFEST}")
+
+
+def main():
+    manifest = load_manifest()
+    parser = argparse.ArgumentParser(description="Download pinned model snapshots into the local store")
+    parser.add_argument('scan_types', nargs='*', help="only checkpoints serving these scan types")
+    parser.add_argument('--pin', action='store_true', help="write the resolved commit hashes to models.json")
+    parser.add_argument('--verify', action='store_true', help="check stored snapshots against their hashes")
+    args = parser.parse_args()
+
+    selected = [
+        name for name, entry in manifest.items()
+        if not args.scan_types or set(entry.get('scan_types', [])) & set(args.scan_types)
+    ]
+    if not selected:
+        print("❌ No checkpoints selected (check models.json and the scan types given)")
+        sys.exit(1)
+
+    all_ok = True
+    if args.verify:
+        for model_name in selected:
+            if model_name not in store.entries():
+                print(f"❌ {model_name}: not in the store")
+                all_ok = False
+                continue
+            mismatched = store.verify(model_name)
+            all_ok &= not mismatched
+            print(f"{'❌' if mismatched else '✅'} {model_name}" + (f": {', '.join(mismatched)} changed" if mismatched else ""))
+        sys.exit(0 if all_ok else 1)
+
+    resolved = {}
+    for model_name in selected:
+        try:
+            revision = resolve_revision(model_name, manifest[model_name].get('revision'))
+            print(f"⬇️ {model_name} @ {revision[:12]}...")
+            path = download(model_name, revision)
+            resolved[model_name] = revision
+            print(f"✅ {model_name} -> {path}")
+        except Exception as e:
+            print(f"❌ {model_name}: FAILED - {e}")
+            all_ok = False
+
+    if args.pin and resolved:
+        pin(resolved)
+    if not all_ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Export the scan classifiers to ONNX, optionally quantize them to int8,
+and check the exports against the PyTorch pipeline.
+
+    python export_onnx.py                  # every scan type with a model
+    python export_onnx.py skin --quantize  # fp32 + int8 export of the skin model
+
+Serve the exports with SCANS_INFERENCE_BACKEND=onnx or onnx-int8.
+"""
+
+import argparse
+import os
+import sys
+import numpy as np
+import torch
+from PIL import Image
+from transformers import AutoImageProcessor, AutoModelForImageClassification
+from backends import OnnxClassifier, load_backend, onnx_export_dir, onnx_model_path
+from model_store import store, checked_revision
+from model_registry import MODEL_SPECS
+
+
+class LogitsOnly(torch.nn.Module):
+    """Expose just the logits so the exported graph has a single output"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values).logits
+
+
+def export_model(model_name):
+    """Export a checkpoint to ONNX alongside its processor and config"""
+    export_dir = onnx_export_dir(model_name)
+    os.makedirs(export_dir, exist_ok=True)
+
+    # The same weights the torch backend serves: the pinned snapshot, else the pinned Hub commit
+    snapshot = store.snapshot(model_name)
+    source, revision = (snapshot, None) if snapshot else (model_name, checked_revision(model_name))
+    processor = AutoImageProcessor.from_pretrained(source, revision=revision)
+    model = AutoModelForImageClassification.from_pretrained(source, revision=revision).eval()
+    sample = processor(images=sample_images(1)[0], return_tensors='pt')['pixel_values']
+
+    torch.onnx.export(
+        LogitsOnly(model),
+        (sample,),
+        onnx_model_path(model_name),
+        input_names=['pixel_values'],
+        output_names=['logits'],
+        dynamic_axes={'pixel_values': {0: 'batch'}, 'logits': {0: 'batch'}},
+        opset_version=17,
+        dynamo=False
+    )
+    processor.save_pretrained(export_dir)
+    model.config.save_pretrained(export_dir)
+    print(f"✅ Exported {model_name} -> {onnx_model_path(model_name)}")
+
+
+def quantize_model(model_name):
+    """Dynamically quantize the exported weights to int8"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(
+        onnx_model_path(model_name),
+        onnx_model_path(model_name, quantized=True),
+        weight_type=QuantType.QInt8
+    )
+    print(f"✅ Quantized {model_name} -> {onnx_model_path(model_name, quantized=True)}")
+
+
+def sample_images(count, seed=0):
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        height, width = rng.integers(160, 640, size=2)
+        pixels = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        images.append(Image.fromarray(pixels))
+    return images
+
+
+def check_parity(model_name, quantized, samples, tolerance):
+    """Compare an export against the PyTorch pipeline on random images"""
+    reference, _ = load_backend(model_name, 'torch')
+    candidate = OnnxClassifier(model_name, onnx_model_path(model_name, quantized))
+    images = sample_images(samples, seed=1)
+
+    expected = reference(images, top_k=len(candidate.id2label))
+    actual = candidate(images, top_k=len(candidate.id2label))
+
+    top1_agree = 0
+    max_diff = 0.0
+    for want, got in zip(expected, actual):
+        top1_agree += want[0]['label'] == got[0]['label']
+        got_scores = {p['label']: p['score'] for p in got}
+        max_diff = max(max_diff, max(abs(p['score'] - got_scores[p['label']]) for p in want))
+
+    agreement = top1_agree / len(images)
+    passed = max_diff <= tolerance
+    label = 'int8' if quantized else 'fp32'
+    print(f"{'✅' if passed else '❌'} {model_name} [{label}] top-1 agreement {agreement:.0%}, "
+          f"max score difference {max_diff:.5f} (tolerance {tolerance})")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export scan classifiers to ONNX")
+    parser.add_argument('scan_types', nargs='*', default=list(MODEL_SPECS), help="scan types to export")
+    parser.add_argument('--quantize', action='store_true', help="also write a dynamically quantized int8 model")
+    parser.add_argument('--samples', type=int, default=16, help="random images for the parity check")
+    parser.add_argument('--tolerance', type=float, default=1e-3, help="max fp32 score difference")
+    parser.add_argument('--int8-tolerance', type=float, default=0.05, help="max int8 score difference")
+    args = parser.parse_args()
+
+    all_passed = True
+    for scan_type in args.scan_types:
+        if scan_type not in MODEL_SPECS:
+            print(f"❌ No AI model configured for '{scan_type}'")
+            all_passed = False
+            continue
+
+        # Same candidate order as the model registry
+        for model_name in MODEL_SPECS[scan_type]:
+            try:
+                export_model(model_name)
+            except Exception as e:
+                print(f"❌ Export of {model_name} FAILED - {e}")
+                continue
+
+            all_passed &= check_parity(model_name, False, args.samples, args.tolerance)
+            if args.quantize:
+                quantize_model(model_name)
+                all_passed &= check_parity(model_name, True, args.samples, args.int8_tolerance)
+            break
+
+    if not all_passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Pre-fork production serving for the scans analyzer:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app (and with it every scan model) is loaded once in the master and
+the workers are forked from it, so model weights are shared copy-on-write
+instead of being loaded per worker. Each worker gets an equal share of the
+CPU cores for torch/OpenCV so workers don't oversubscribe the node.
+"""
+
+import gc
+import os
+
+cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+bind = os.environ.get('SCANS_BIND', f"0.0.0.0:{os.environ.get('PORT', 5003)}")
+workers = int(os.environ.get('SCANS_WORKERS', max(1, cores // 2)))
+worker_class = 'gthread'
+threads = int(os.environ.get('SCANS_WORKER_THREADS', 4))
+timeout = int(os.environ.get('SCANS_WORKER_TIMEOUT', 120))
+preload_app = True
+
+# Compute threads per worker; defaults to an even split of the cores
+worker_compute_threads = int(os.environ.get('SCANS_WORKER_COMPUTE_THREADS', max(1, cores // workers)))
+
+# Load every model in the master so workers inherit them rather than loading on first use
+os.environ.setdefault('SCANS_PRELOAD_MODELS', 'chest,skin,mri')
+
+# Warm up in the master before forking; a background thread would not survive fork()
+os.environ.setdefault('SCANS_WARMUP', 'sync')
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the collector's reach; otherwise GC
+    # passes in the workers write to those objects and un-share their pages
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import cv2
+    import torch
+
+    os.environ['SCANS_WORKER_COMPUTE_THREADS'] = str(worker_compute_threads)
+    torch.set_num_threads(worker_compute_threads)
+    cv2.setNumThreads(worker_compute_threads)
+    server.log.info(f"Worker {worker.pid}: {worker_compute_threads} compute threads of {cores} cores")
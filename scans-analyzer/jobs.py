@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decoding import decode_image
+from per_process import PerProcess
+from tiling import TILE_DECODE_MIN_SIDE
+
+# Analyses running at once for the job API; inference releases the GIL and
+# the models are shared, so threads are used rather than processes
+JOB_WORKERS = int(os.environ.get('SCANS_JOB_WORKERS', 2))
+JOB_QUEUE_SIZE = int(os.environ.get('SCANS_JOB_QUEUE_SIZE', 64))  # queued jobs before submissions are refused
+JOB_STORE_SIZE = int(os.environ.get('SCANS_JOB_STORE_SIZE', 1000))  # finished jobs kept for polling
+JOB_TTL = float(os.environ.get('SCANS_JOB_TTL', 3600))  # seconds a finished job stays pollable, 0 = until evicted
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue is at capacity"""
+
+
+class JobManager:
+    """Queue of scan analyses drained by a bounded worker pool.
+
+    Submitting returns a job id straight away; the upload is decoded and
+    analyzed on a worker thread and the outcome is kept in a bounded store
+    for polling. Finished jobs are evicted oldest first once the store is
+    full or their TTL has passed; queued and running jobs never are.
+    """
+
+    def __init__(self, analyzer, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE,
+                 store_size=JOB_STORE_SIZE, ttl=JOB_TTL):
+        self.analyzer = analyzer
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.store_size = store_size
+        self.ttl = ttl
+        self._jobs = OrderedDict()  # job id -> job dict, in submission order
+        self._queued = 0
+        self._running = 0
+        self._lock = threading.Lock()
+        self._executor = PerProcess(
+            lambda: ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scan-job')
+        )
+
+    def submit(self, image_bytes, filename, scan_type, validation_mode=None, analysis_mode=None):
+        """Enqueue an analysis and return its job id"""
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'status': QUEUED,
+            'scan_type': scan_type,
+            'analysis_mode': analysis_mode or 'standard',
+            'filename': filename,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None
+        }
+        with self._lock:
+            if self._queued >= self.queue_size:
+                raise JobQueueFull(f"Job queue is full ({self.queue_size} jobs waiting)")
+            self._queued += 1
+            self._jobs[job_id] = job
+            self._evict(time.time())
+            executor = self._executor.get()
+        executor.submit(self._run, job_id, image_bytes, validation_mode)
+        return job_id
+
+    def get(self, job_id):
+        """Snapshot of a job, or None if unknown or evicted"""
+        with self._lock:
+            self._evict(time.time())
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = dict(job)
+            if job['status'] == QUEUED:
+                snapshot['queue_position'] = sum(
+                    1 for other in self._jobs.values()
+                    if other['status'] == QUEUED and other['created_at'] <= job['created_at']
+                )
+            return snapshot
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queued,
+                'running': self._running,
+                'stored': len(self._jobs),
+                'workers': self.workers,
+                'queue_size': self.queue_size
+            }
+
+    def _run(self, job_id, image_bytes, validation_mode):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = RUNNING
+            job['started_at'] = time.time()
+            self._queued -= 1
+            self._running += 1
+
+        status, result, error = FAILED, None, None
+        try:
+            tiled = job['analysis_mode'] == 'tiled'
+            image = decode_image(image_bytes, job['scan_type'], TILE_DECODE_MIN_SIDE if tiled else None)
+            if image is None:
+                error = 'Invalid image format'
+            else:
+                result = self.analyzer.analyze_scan(
+                    image, job['scan_type'], validation_mode, analysis_mode=job['analysis_mode']
+                )
+                if 'error' in result:
+                    error = result['error']
+                else:
+                    status = DONE
+                    result = {'success': True, 'filename': job['filename'], **result}
+        except Exception as e:
+            error = str(e)
+
+        with self._lock:
+            job['status'] = status
+            job['result'] = result if status == DONE else None
+            job['error'] = error
+            job['finished_at'] = time.time()
+            self._running -= 1
+            self._evict(job['finished_at'])
+
+    def _evict(self, now):
+        # Called with self._lock held
+        finished = [job_id for job_id, job in self._jobs.items() if job['finished_at'] is not None]
+        overflow = len(self._jobs) - self.store_size
+        for job_id in finished:
+            expired = self.ttl > 0 and now - self._jobs[job_id]['finished_at'] > self.ttl
+            if overflow <= 0 and not expired:
+                continue
+            del self._jobs[job_id]
+            overflow -= 1
+
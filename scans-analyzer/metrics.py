@@ -0,0 +1,173 @@
+import bisect
+import os
+import threading
+
+# Histogram buckets in seconds, from sub-millisecond CV stages to cold model loads
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Attach a per-stage "timings" object to every /analyze response (also per request: timings=1)
+RESPONSE_TIMINGS = os.environ.get('SCANS_RESPONSE_TIMINGS', '').lower() in ('1', 'true', 'yes')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._snapshot().items()):
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(float(total))}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+    def _snapshot(self):
+        # Copy under the lock; counts lists are mutated in place by observe()
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text exposition format.
+
+    Each gunicorn worker keeps its own registry, so a scrape reflects the
+    worker that answered it; label the targets per worker or scrape through
+    a sidecar that aggregates them.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+REQUESTS = registry.counter(
+    'scans_analyses_total', "Scan analyses by scan type and outcome", ('scan_type', 'outcome'))
+STAGE_SECONDS = registry.histogram(
+    'scans_stage_duration_seconds', "Time spent per analysis stage", ('scan_type', 'stage'))
+RESULT_CACHE = registry.counter(
+    'scans_result_cache_total', "Result cache lookups by scan type and result", ('scan_type', 'result'))
+MODEL_LOOKUPS = registry.counter(
+    'scans_model_lookups_total', "Model registry lookups: hit (loaded), miss (loaded now) or failed",
+    ('scan_type', 'result'))
+MODEL_LOAD_SECONDS = registry.histogram(
+    'scans_model_load_duration_seconds', "Time to load a scan model", ('scan_type',))
+ERRORS = registry.counter(
+    'scans_errors_total', "Errors by scan type and where they happened", ('scan_type', 'stage'))
+MODELS_LOADED = registry.gauge(
+    'scans_models_loaded', "AI models currently loaded")
+MODEL_MEMORY = registry.gauge(
+    'scans_model_memory_bytes', "Estimated memory of the loaded AI models")
+INFERENCES_RUNNING = registry.gauge(
+    'scans_inferences_running', "Model executions currently running")
+INFERENCES_WAITING = registry.gauge(
+    'scans_inferences_waiting', "Model executions waiting for a scheduler slot")
+ADMISSIONS = registry.counter(
+    'scans_admissions_total', "Synchronous analyses admitted or refused by admission control",
+    ('scan_type', 'result'))
+ADMISSION_QUEUED = registry.gauge(
+    'scans_admission_queued', "Synchronous analyses waiting for an admission slot", ('scan_type',))
+
+
+def observe_timings(scan_type, timings):
+    """Record a request's per-stage milliseconds into the stage histogram"""
+    for stage, elapsed_ms in timings.items():
+        STAGE_SECONDS.observe(elapsed_ms / 1000, scan_type=scan_type, stage=stage)
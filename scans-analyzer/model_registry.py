@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from metrics import MODEL_LOOKUPS, MODEL_LOAD_SECONDS
+from backends import load_backend, INFERENCE_BACKEND
+from batching import BatchedPipeline
+
+# Candidate checkpoints per scan type, tried in order until one loads
+MODEL_SPECS = {
+    'chest': ["Borjamg/pneumonia_model"],
+    'skin': ["actavkid/vit-large-patch32-384-finetuned-skin-lesion-classification"],
+    'mri': [
+        "microsoft/resnet-50",  # General vision model for brain analysis
+        "google/vit-base-patch16-224"  # Vision transformer
+    ]
+}
+
+# Total parameter memory allowed for loaded models (0 = unlimited)
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get('SCANS_MODEL_MEMORY_MB', 0))
+
+# Scan types loaded at startup instead of on first use, e.g. "chest,skin"
+PRELOAD_MODELS = [t.strip() for t in os.environ.get('SCANS_PRELOAD_MODELS', '').split(',') if t.strip()]
+
+
+def model_memory_bytes(pipe):
+    """Estimate the resident size of a pipeline from its parameters and buffers"""
+    if hasattr(pipe, 'model_bytes'):
+        return pipe.model_bytes
+    try:
+        model = pipe.model
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return 0
+
+
+class ModelRegistry:
+    """Scan-type keyed model store that loads pipelines on first use.
+
+    ``'chest' in registry`` is true while a model is configured for the scan
+    type and has not failed to load; ``registry['chest']`` loads it if needed.
+    When the memory budget is exceeded the least recently used pipelines are
+    evicted and reloaded on their next use.
+
+    Callers that run a model hold it with ``with registry.lease('chest') as
+    model:``. An evicted pipeline leaves the registry at once but is only
+    closed when its last lease ends, so eviction never pulls a model out
+    from under a request that is using it.
+    """
+
+    def __init__(self, specs=None, memory_budget_mb=MODEL_MEMORY_BUDGET_MB, backend=INFERENCE_BACKEND):
+        self.specs = MODEL_SPECS if specs is None else specs
+        self.backend = backend
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._loaded = OrderedDict()  # scan_type -> (pipeline, size in bytes)
+        self._resolved = {}  # scan_type -> checkpoint that loaded
+        self._backends = {}  # scan_type -> backend it loaded on, if not the configured one
+        self._failed = set()
+        self._leases = {}  # pipeline -> callers holding it
+        self._retired = set()  # evicted pipelines waiting for their leases to end
+        self._lock = threading.Lock()
+        self._load_locks = {scan_type: threading.Lock() for scan_type in self.specs}
+        self._local = threading.local()
+
+    def __contains__(self, scan_type):
+        if getattr(self._local, 'cv_only', False):
+            return False
+        if getattr(self._local, 'loaded_only', False):
+            return scan_type in self._loaded
+        return scan_type in self.specs and scan_type not in self._failed
+
+    def __getitem__(self, scan_type):
+        return self._acquire(scan_type, lease=False)
+
+    def _acquire(self, scan_type, lease):
+        model = self._lookup(scan_type, lease)
+        if model is not None:
+            MODEL_LOOKUPS.inc(scan_type=scan_type, result='hit')
+            return model
+        if scan_type not in self:
+            raise KeyError(scan_type)
+
+        # One loader per scan type; other types keep serving meanwhile
+        with self._load_locks[scan_type]:
+            model = self._lookup(scan_type, lease)
+            if model is not None:
+                MODEL_LOOKUPS.inc(scan_type=scan_type, result='hit')
+                return model
+
+            start = time.perf_counter()
+            model, model_name = self._load(scan_type)
+            if model is None:
+                MODEL_LOOKUPS.inc(scan_type=scan_type, result='failed')
+                self._failed.add(scan_type)
+                raise KeyError(scan_type)
+            MODEL_LOOKUPS.inc(scan_type=scan_type, result='miss')
+            MODEL_LOAD_SECONDS.observe(time.perf_counter() - start, scan_type=scan_type)
+
+            with self._lock:
+                self._resolved[scan_type] = model_name
+                self._loaded[scan_type] = (model, model_memory_bytes(model.pipe))
+                if lease:
+                    self._leases[model] = self._leases.get(model, 0) + 1
+                self._evict_over_budget(keep=scan_type)
+            return model
+
+    @contextmanager
+    def lease(self, scan_type):
+        """Hold the scan type's pipeline for the block, loading it if needed; None like get().
+
+        Eviction during the block unloads the model only once the block ends.
+        """
+        try:
+            model = self._acquire(scan_type, lease=True)
+        except KeyError:
+            model = None
+        try:
+            yield model
+        finally:
+            if model is not None:
+                self._release(model)
+
+    def __len__(self):
+        return len(self._loaded)
+
+    def get(self, scan_type, default=None):
+        try:
+            return self[scan_type]
+        except KeyError:
+            return default
+
+    def keys(self):
+        """Scan types whose models are currently loaded"""
+        with self._lock:
+            return list(self._loaded.keys())
+
+    def model_name(self, scan_type):
+        """Checkpoint serving a scan type, or the first candidate if not loaded yet"""
+        if scan_type in self._resolved:
+            return self._resolved[scan_type]
+        candidates = self.specs.get(scan_type)
+        return candidates[0] if candidates else None
+
+    def model_id(self, scan_type):
+        """Checkpoint plus the inference backend it loaded on, identifying what produces a result"""
+        return f"{self.model_name(scan_type)}@{self._backends.get(scan_type, self.backend)}"
+
+    def resolved_id(self, scan_type):
+        """model_id of the checkpoint that serves a scan type, loading it if needed; None if none loads"""
+        if scan_type not in self:
+            return None
+        with self.lease(scan_type) as model:
+            return None if model is None else self.model_id(scan_type)
+
+    def take_embedding(self, scan_type):
+        """Pooled features of the calling thread's last inference for scan_type, or None"""
+        with self._lock:
+            entry = self._loaded.get(scan_type)
+        return None if entry is None else entry[0].take_embedding()
+
+    def memory_usage_mb(self):
+        with self._lock:
+            return sum(size for _, size in self._loaded.values()) / (1024 * 1024)
+
+    @contextmanager
+    def loaded_only(self):
+        """Within the block the calling thread sees only loaded models, so none load lazily"""
+        self._local.loaded_only = True
+        try:
+            yield
+        finally:
+            self._local.loaded_only = False
+
+    @contextmanager
+    def cv_only(self):
+        """Within the block the calling thread sees no models, so analyzers take their CV path only"""
+        self._local.cv_only = True
+        try:
+            yield
+        finally:
+            self._local.cv_only = False
+
+    def preload(self, scan_types):
+        for scan_type in scan_types:
+            if scan_type not in self.specs:
+                print(f"⚠️ Preload skipped: no AI model configured for '{scan_type}'")
+                continue
+            self.get(scan_type)
+
+    def evict(self, scan_type):
+        with self._lock:
+            entry = self._loaded.pop(scan_type, None)
+            if entry is not None:
+                self._retire(entry[0])
+        if entry is not None:
+            print(f"♻️ Unloaded {scan_type} model ({entry[1] / (1024 * 1024):.0f} MB)")
+
+    def _lookup(self, scan_type, lease=False):
+        with self._lock:
+            if scan_type in self._loaded:
+                self._loaded.move_to_end(scan_type)
+                model = self._loaded[scan_type][0]
+                if lease:
+                    self._leases[model] = self._leases.get(model, 0) + 1
+                return model
+        return None
+
+    def _release(self, model):
+        with self._lock:
+            self._leases[model] -= 1
+            if self._leases[model] > 0:
+                return
+            del self._leases[model]
+            if model not in self._retired:
+                return
+            self._retired.discard(model)
+        model.close()
+
+    def _retire(self, model):
+        # Called with self._lock held; closing only posts the worker's sentinel
+        if self._leases.get(model):
+            self._retired.add(model)
+        else:
+            model.close()
+
+    def _load(self, scan_type):
+        for model_name in self.specs[scan_type]:
+            try:
+                print(f"🤖 Loading {scan_type} model: {model_name} [{self.backend}]...")
+                pipe, backend = load_backend(model_name, self.backend)
+                self._backends[scan_type] = backend
+                print(f"✅ {scan_type} model: LOADED ({model_name} [{backend}])")
+                return BatchedPipeline(pipe, scan_type), model_name
+            except Exception as e:
+                print(f"❌ {scan_type} model {model_name}: FAILED - {e}")
+        return None, None
+
+    def _evict_over_budget(self, keep):
+        # Called with self._lock held
+        if self.memory_budget <= 0:
+            return
+        while sum(size for _, size in self._loaded.values()) > self.memory_budget:
+            victim = next((t for t in self._loaded if t != keep), None)
+            if victim is None:
+                break
+            model, size = self._loaded.pop(victim)
+            self._retire(model)
+            print(f"♻️ Evicted {victim} model ({size / (1024 * 1024):.0f} MB) to stay within memory budget")
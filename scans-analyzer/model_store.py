@@ -0,0 +1,243 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import warnings
+import torch
+from transformers import pipeline, AutoConfig, AutoImageProcessor, AutoModelForImageClassification
+
+SCANS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Checked-in manifest of the checkpoints the service may load and their pinned revisions
+MODEL_MANIFEST = os.environ.get('SCANS_MODEL_MANIFEST', os.path.join(SCANS_DIR, 'models.json'))
+
+# Local snapshot store written by download_models.py; it keeps its own manifest.json
+MODEL_STORE_DIR = os.environ.get('SCANS_MODEL_STORE', os.path.join(SCANS_DIR, 'model_store'))
+
+# Never fall back to the Hub; a checkpoint without a local snapshot fails to load
+MODELS_OFFLINE = os.environ.get('SCANS_MODELS_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+# Refuse checkpoints whose manifest revision is a branch or tag rather than
+# warning about them (download_models.py --pin resolves them to commits)
+REQUIRE_PINNED_MODELS = os.environ.get('SCANS_REQUIRE_PINNED_MODELS', '').lower() in ('1', 'true', 'yes')
+
+WEIGHTS_FILE = 'model.safetensors'
+
+SAFETENSORS_DTYPES = {
+    'F64': torch.float64, 'F32': torch.float32, 'F16': torch.float16, 'BF16': torch.bfloat16,
+    'I64': torch.int64, 'I32': torch.int32, 'I16': torch.int16, 'I8': torch.int8,
+    'U8': torch.uint8, 'BOOL': torch.bool
+}
+
+
+def is_commit_hash(revision):
+    return isinstance(revision, str) and len(revision) == 40 and all(c in '0123456789abcdef' for c in revision)
+
+
+def load_manifest(path=MODEL_MANIFEST):
+    """{model name: {'revision': ...}} from the checked-in manifest, or {} if there is none"""
+    try:
+        with open(path) as f:
+            return json.load(f).get('models', {})
+    except FileNotFoundError:
+        return {}
+
+
+def pinned_revision(model_name):
+    return load_manifest().get(model_name, {}).get('revision')
+
+
+_unpinned_warned = set()
+
+
+def checked_revision(model_name, require_pinned=None):
+    """The manifest revision of a checkpoint, checked to be a commit hash.
+
+    A branch such as "main" moves whenever the checkpoint is re-uploaded,
+    so what loads is not reproducible; that is warned about once per
+    checkpoint, or refused with SCANS_REQUIRE_PINNED_MODELS.
+    """
+    revision = pinned_revision(model_name)
+    if is_commit_hash(revision):
+        return revision
+    if REQUIRE_PINNED_MODELS if require_pinned is None else require_pinned:
+        raise ValueError(f"{model_name} is not pinned to a commit in {MODEL_MANIFEST} "
+                         f"(revision {revision!r}; run download_models.py --pin)")
+    if model_name not in _unpinned_warned:
+        _unpinned_warned.add(model_name)
+        print(f"⚠️ {model_name} is not pinned to a commit (revision {revision!r}); run download_models.py --pin")
+    return revision
+
+
+class ModelStore:
+    """Directory of pinned, safetensors-only model snapshots.
+
+    Every snapshot lives in ``<store>/<org>__<name>/<revision>/`` with its
+    config, image processor and a single model.safetensors. The store's
+    manifest.json records which revision of each checkpoint is present and
+    the SHA-256 of every file.
+    """
+
+    def __init__(self, root=MODEL_STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._entries = None
+        self._entries_mtime = None
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, 'manifest.json')
+
+    def entries(self):
+        # Re-read when download_models.py has rewritten the manifest
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.manifest_path)
+            except OSError:
+                return {}
+            if mtime != self._entries_mtime:
+                with open(self.manifest_path) as f:
+                    self._entries = json.load(f).get('models', {})
+                self._entries_mtime = mtime
+            return self._entries
+
+    def snapshot(self, model_name):
+        """Path of the local snapshot matching the pinned revision, or None"""
+        entry = self.entries().get(model_name)
+        if entry is None:
+            return None
+        pinned = pinned_revision(model_name)
+        if is_commit_hash(pinned) and entry['revision'] != pinned:
+            print(f"⚠️ Local snapshot of {model_name} is {entry['revision'][:12]}, manifest pins {pinned[:12]}")
+            return None
+        path = os.path.join(self.root, entry['path'])
+        return path if os.path.exists(os.path.join(path, WEIGHTS_FILE)) else None
+
+    def write(self, model_name, revision, model, processor):
+        """Save a loaded checkpoint as a safetensors snapshot and record it"""
+        relative = os.path.join(model_name.strip('/').replace('/', '__'), revision)
+        target = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        # Build next to the target and swap it in, so readers never see half a snapshot
+        staging = tempfile.mkdtemp(dir=os.path.dirname(target), prefix='.staging-')
+        try:
+            model.save_pretrained(staging, safe_serialization=True)
+            processor.save_pretrained(staging)
+            if not os.path.exists(os.path.join(staging, WEIGHTS_FILE)):
+                raise RuntimeError(f"{model_name} did not save as a single {WEIGHTS_FILE}")
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.replace(staging, target)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        self._record(model_name, {
+            'revision': revision,
+            'path': relative,
+            'files': {name: file_sha256(os.path.join(target, name)) for name in sorted(os.listdir(target))},
+            'stored_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        })
+        return target
+
+    def verify(self, model_name):
+        """Re-hash a snapshot's files against the store manifest; returns mismatched names"""
+        entry = self.entries()[model_name]
+        path = os.path.join(self.root, entry['path'])
+        return [
+            name for name, digest in entry['files'].items()
+            if not os.path.exists(os.path.join(path, name)) or file_sha256(os.path.join(path, name)) != digest
+        ]
+
+    def _record(self, model_name, entry):
+        os.makedirs(self.root, exist_ok=True)
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {'models': {}}
+        manifest['models'][model_name] = entry
+        staging = self.manifest_path + '.tmp'
+        with open(staging, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(staging, self.manifest_path)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def mmap_safetensors(path):
+    """Tensors of a safetensors file as zero-copy views of a read-only shared mapping.
+
+    The pages belong to the page cache rather than to the process, so every
+    process serving the same snapshot shares one copy of the weights and a
+    restart finds them already resident.
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header_size = struct.unpack('<Q', mapped[:8])[0]
+    header = json.loads(mapped[8:8 + header_size])
+    data_start = 8 + header_size
+
+    tensors = {}
+    with warnings.catch_warnings():
+        # The mapping is read-only; inference never writes to weights
+        warnings.filterwarnings('ignore', message='The given buffer is not writable')
+        for name, info in header.items():
+            if name == '__metadata__':
+                continue
+            dtype = SAFETENSORS_DTYPES[info['dtype']]
+            start, end = info['data_offsets']
+            if end == start:
+                tensors[name] = torch.empty(info['shape'], dtype=dtype)
+                continue
+            count = (end - start) // torch.tensor([], dtype=dtype).element_size()
+            tensors[name] = torch.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + start).view(info['shape'])
+    return tensors
+
+
+def load_snapshot_model(path):
+    """Build a classifier whose parameters are the mapped safetensors weights.
+
+    The module is created on the meta device, so nothing is allocated or
+    randomly initialised, and the mapped tensors are assigned as its
+    parameters. Checkpoints stored in a different layout than the module
+    (older key names that transformers converts on load) go through
+    from_pretrained instead, which maps the file itself in recent versions.
+    """
+    config = AutoConfig.from_pretrained(path)
+    with torch.device('meta'):
+        model = AutoModelForImageClassification.from_config(config)
+
+    weights = mmap_safetensors(os.path.join(path, WEIGHTS_FILE))
+    if set(weights) == set(model.state_dict()):
+        model.load_state_dict(weights, strict=True, assign=True)
+        tensors = list(model.parameters()) + list(model.buffers())
+        if not any(t.is_meta for t in tensors):
+            return model.eval()
+
+    return AutoModelForImageClassification.from_pretrained(path).eval()
+
+
+def load_snapshot_pipeline(path):
+    return pipeline(
+        "image-classification",
+        model=load_snapshot_model(path),
+        image_processor=AutoImageProcessor.from_pretrained(path),
+        device=-1
+    )
+
+
+store = ModelStore()
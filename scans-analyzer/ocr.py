@@ -0,0 +1,78 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import cv2
+import pytesseract
+from PIL import Image
+from per_process import PerProcess
+
+try:
+    import tesserocr
+except ImportError:  # falls back to the pytesseract subprocess
+    tesserocr = None
+
+OCR_WORKERS = int(os.environ.get('SCANS_OCR_WORKERS', 2))
+OCR_MAX_SIDE = int(os.environ.get('SCANS_OCR_MAX_SIDE', 1024))  # 0 = OCR at full resolution
+OCR_TIMEOUT = float(os.environ.get('SCANS_OCR_TIMEOUT', 5))  # seconds, 0 = no timeout
+OCR_LANG = os.environ.get('SCANS_OCR_LANG', 'eng')
+
+
+def downscale_for_ocr(gray, max_side=OCR_MAX_SIDE):
+    """Shrink a grayscale image so its longest side is at most max_side"""
+    height, width = gray.shape[:2]
+    if max_side <= 0 or max(height, width) <= max_side:
+        return gray
+    scale = max_side / max(height, width)
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+class OCREngine:
+    """Persistent in-process OCR.
+
+    Each worker thread keeps its own long-lived tesseract API handle, so
+    language data is loaded once per thread instead of once per request.
+    Without tesserocr the workers run pytesseract instead, which still gets
+    the downscaling and timeout.
+    """
+
+    def __init__(self, workers=OCR_WORKERS, max_side=OCR_MAX_SIDE, timeout=OCR_TIMEOUT, lang=OCR_LANG):
+        self.workers = max(1, workers)
+        self.max_side = max_side
+        self.timeout = timeout
+        self.lang = lang
+        self._local = threading.local()
+        self._executor = PerProcess(
+            lambda: ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ocr')
+        )
+        self._api_unavailable = tesserocr is None
+
+    def image_to_string(self, gray):
+        small = downscale_for_ocr(gray, self.max_side)
+        future = self._executor.get().submit(self._recognize, small)
+        try:
+            return future.result(timeout=self.timeout if self.timeout > 0 else None)
+        except FutureTimeout:
+            future.cancel()
+            raise TimeoutError(f"OCR timed out after {self.timeout:g}s")
+
+    def _recognize(self, gray):
+        api = self._api()
+        if api is None:
+            return pytesseract.image_to_string(gray, timeout=self.timeout)
+        api.SetImage(Image.fromarray(gray))
+        return api.GetUTF8Text()
+
+    def _api(self):
+        if self._api_unavailable:
+            return None
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            try:
+                api = tesserocr.PyTessBaseAPI(lang=self.lang)
+            except RuntimeError as e:
+                print(f"⚠️ tesserocr unavailable, using pytesseract: {e}")
+                self._api_unavailable = True
+                return None
+            self._local.api = api
+        return api
@@ -0,0 +1,41 @@
+import os
+import threading
+
+
+class PerProcess:
+    """A lazily created resource owned by the process that created it.
+
+    Threads, executors and connections do not survive fork(), so after
+    gunicorn forks its workers (gunicorn.conf.py) each worker must build
+    its own instead of using the one inherited from the master. ``get()``
+    creates the resource on first use in every process.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._value = self._factory()
+                self._pid = os.getpid()
+            return self._value
+
+    def current(self):
+        """The resource if this process has created one, else None"""
+        with self._lock:
+            return self._own()
+
+    def reset(self):
+        """Forget the resource so the next get() creates a new one; returns this process's old one"""
+        with self._lock:
+            value = self._own()
+            self._value = None
+            self._pid = None
+            return value
+
+    def _own(self):
+        return self._value if self._pid == os.getpid() else None
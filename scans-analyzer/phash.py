@@ -0,0 +1,120 @@
+import os
+import threading
+import cv2
+import numpy as np
+
+# Serve a cached result for a near-duplicate of an earlier scan (re-saved,
+# re-compressed, resized); requests can override with near_duplicates=0/1
+NEAR_DUPLICATE_CACHE = os.environ.get('SCANS_NEAR_DUPLICATE_CACHE', '').lower() in ('1', 'true', 'yes')
+
+# Largest Hamming distance, in bits of each 64-bit hash, still treated as the same scan.
+# Kept tight: re-encodes and resizes land within it, distinct scans far outside,
+# and a false match would serve another patient's findings.
+NEAR_DUPLICATE_THRESHOLD = int(os.environ.get('SCANS_NEAR_DUPLICATE_THRESHOLD', 4))
+
+# Recent scans remembered per scan type and model
+NEAR_DUPLICATE_INDEX_SIZE = int(os.environ.get('SCANS_NEAR_DUPLICATE_INDEX_SIZE', 4096))
+
+
+def _pack(bits):
+    return int(np.packbits(bits.ravel()).view('>u8')[0])
+
+
+def phash(processed):
+    """64-bit DCT hash: low frequencies of a 32x32 reduction against their median"""
+    small = cv2.resize(processed.astype(np.float32), (32, 32), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(small)[:8, :8]
+    # The DC term only carries overall brightness
+    return _pack(low > np.median(low.ravel()[1:]))
+
+
+def dhash(processed):
+    """64-bit gradient hash: sign of horizontal differences on a 9x8 reduction"""
+    small = cv2.resize(processed.astype(np.float32), (9, 8), interpolation=cv2.INTER_AREA)
+    return _pack(small[:, 1:] > small[:, :-1])
+
+
+def image_hashes(processed):
+    """(pHash, dHash) of a preprocessed scan"""
+    return phash(processed), dhash(processed)
+
+
+def hamming(hashes, value):
+    """Bit distance from value to every uint64 in hashes"""
+    xor = hashes ^ np.uint64(value)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(xor)
+    # NumPy < 2.0
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class _HashRing:
+    """Fixed-size ring of hash pairs and the result cache keys they point to"""
+
+    def __init__(self, size):
+        self.phashes = np.zeros(size, dtype=np.uint64)
+        self.dhashes = np.zeros(size, dtype=np.uint64)
+        self.keys = [None] * size
+        self.count = 0
+        self.next = 0
+
+    def add(self, hashes, key):
+        self.phashes[self.next], self.dhashes[self.next] = hashes
+        self.keys[self.next] = key
+        self.next = (self.next + 1) % len(self.keys)
+        self.count = min(self.count + 1, len(self.keys))
+
+
+class NearDuplicateIndex:
+    """Perceptual hashes of recently analyzed scans, searched by Hamming distance.
+
+    Each namespace (scan type and model) keeps a ring of its most recent
+    (pHash, dHash) pairs, each pointing at a result cache key. A lookup
+    compares the new scan against the whole ring in one vectorized pass
+    and matches only if both hashes are within the threshold, which keeps
+    structurally similar but different scans apart. The results themselves
+    stay in the ResultCache, so its TTL and eviction still apply.
+    """
+
+    def __init__(self, size=NEAR_DUPLICATE_INDEX_SIZE, threshold=NEAR_DUPLICATE_THRESHOLD):
+        self.size = size
+        self.threshold = threshold
+        self.lookups = 0
+        self.matches = 0
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def add(self, namespace, hashes, key):
+        if self.size <= 0:
+            return
+        with self._lock:
+            ring = self._rings.get(namespace)
+            if ring is None:
+                ring = self._rings[namespace] = _HashRing(self.size)
+            ring.add(hashes, key)
+
+    def find(self, namespace, hashes):
+        """(result cache key, distance) of the closest near-duplicate, or None"""
+        with self._lock:
+            self.lookups += 1
+            ring = self._rings.get(namespace)
+            if ring is None or ring.count == 0:
+                return None
+            p_distance = hamming(ring.phashes[:ring.count], hashes[0])
+            d_distance = hamming(ring.dhashes[:ring.count], hashes[1])
+            within = (p_distance <= self.threshold) & (d_distance <= self.threshold)
+            if not within.any():
+                return None
+            distance = np.where(within, p_distance.astype(np.int64) + d_distance, np.iinfo(np.int64).max)
+            best = int(np.argmin(distance))
+            self.matches += 1
+            return ring.keys[best], int(max(p_distance[best], d_distance[best]))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'matches': self.matches,
+                'threshold_bits': self.threshold,
+                'entries': {namespace: ring.count for namespace, ring in self._rings.items()}
+            }
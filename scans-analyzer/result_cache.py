@@ -0,0 +1,131 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from per_process import PerProcess
+
+RESULT_CACHE_SIZE = int(os.environ.get('SCANS_RESULT_CACHE_SIZE', 256))
+RESULT_CACHE_TTL = float(os.environ.get('SCANS_RESULT_CACHE_TTL', 3600))  # seconds, 0 = never expire
+RESULT_CACHE_DB = os.environ.get('SCANS_RESULT_CACHE_DB', '')  # SQLite file for the on-disk tier
+
+
+def image_digest(image):
+    """Content hash of a decoded image array"""
+    digest = hashlib.sha256(f"{image.shape}:{image.dtype}".encode())
+    digest.update(memoryview(image if image.flags['C_CONTIGUOUS'] else image.copy()))
+    return digest.hexdigest()
+
+
+def result_cache_key(digest, scan_type, model_id):
+    return hashlib.sha256(f"{digest}:{scan_type}:{model_id}".encode()).hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache of analysis results: an in-memory LRU and optional SQLite"""
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, db_path=RESULT_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (stored_at, result)
+        self._lock = threading.Lock()
+        self._db = PerProcess(self._connect)
+
+    def get(self, key):
+        return self._lookup(key, count=True)
+
+    def peek(self, key):
+        """Like get, without counting towards the hit rate (secondary lookups)"""
+        return self._lookup(key, count=False)
+
+    def _lookup(self, key, count):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._expired(entry[0], now):
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += count
+                return copy.deepcopy(entry[1])
+
+            result = self._disk_get(key, now)
+            if result is not None:
+                self._memory_put(key, result, now)
+                self.hits += count
+                self.disk_hits += count
+                return copy.deepcopy(result)
+
+            self.misses += count
+            return None
+
+    def put(self, key, result):
+        now = time.time()
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._memory_put(key, result, now)
+            db = self._connection()
+            if db is not None:
+                try:
+                    db.execute(
+                        "INSERT OR REPLACE INTO results (key, stored_at, result) VALUES (?, ?, ?)",
+                        (key, now, json.dumps(result, default=float))
+                    )
+                except sqlite3.Error as e:
+                    print(f"Result cache write error: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_enabled': bool(self.db_path)
+            }
+
+    def _expired(self, stored_at, now):
+        return self.ttl > 0 and now - stored_at > self.ttl
+
+    def _memory_put(self, key, result, now):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (now, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key, now):
+        db = self._connection()
+        if db is None:
+            return None
+        try:
+            row = db.execute("SELECT stored_at, result FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[0], now):
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            return json.loads(row[1])
+        except sqlite3.Error as e:
+            print(f"Result cache read error: {e}")
+            return None
+
+    def _connection(self):
+        return self._db.get() if self.db_path else None
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, stored_at REAL, result TEXT)")
+        return db
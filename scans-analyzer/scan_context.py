@@ -0,0 +1,161 @@
+import time
+from contextlib import contextmanager
+import cv2
+import numpy as np
+from PIL import Image
+from vectorized import batch_features
+from phash import image_hashes
+
+WORKING_SIZE = (224, 224)
+
+
+def preprocess_gray(gray, scan_type):
+    """Preprocess a grayscale image based on scan type"""
+    if scan_type in ['chest', 'xray']:
+        # CLAHE for chest/xray contrast enhancement
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        gray = clahe.apply(gray)
+
+    # Resize to standard size
+    resized = cv2.resize(gray, WORKING_SIZE)
+
+    # Normalize
+    normalized = resized / 255.0
+
+    return normalized
+
+
+class memoized_property:
+    """Compute an attribute on first access and store it on the instance.
+
+    Like functools.cached_property, minus the class-wide lock it takes on
+    Python < 3.12, which would serialize unrelated requests.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.name] = self.func(obj)
+        return value
+
+
+class ScanContext:
+    """A decoded scan plus the derived artifacts analyzers share.
+
+    Every artifact is computed on first use and memoized, so grayscale
+    conversion, preprocessing, edge maps, contours and global statistics
+    are built at most once per request however many consumers need them.
+    ``timings`` accumulates milliseconds per stage for the request.
+    """
+
+    def __init__(self, image, scan_type):
+        self.image = image
+        self.scan_type = scan_type
+        self.timings = {}
+        self._edges = {}
+        self._edge_contours = {}
+
+    @classmethod
+    def of(cls, image, scan_type):
+        """Return a context for scan_type, reusing image if it already is one"""
+        if isinstance(image, ScanContext):
+            if image.scan_type == scan_type:
+                return image
+            context = cls(image.image, scan_type)
+            context.timings = image.timings
+            if 'gray' in image.__dict__:
+                context.gray = image.gray
+            return context
+        return cls(image, scan_type)
+
+    @contextmanager
+    def stage(self, name):
+        """Add the wall time of the enclosed block to timings[name]"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed_ms
+
+    @memoized_property
+    def gray(self):
+        with self.stage('grayscale'):
+            return cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+
+    @memoized_property
+    def processed(self):
+        """Preprocessed 224x224 float image in [0, 1]"""
+        gray = self.gray
+        with self.stage('preprocess'):
+            return preprocess_gray(gray, self.scan_type)
+
+    @memoized_property
+    def processed_u8(self):
+        return (self.processed * 255).astype(np.uint8)
+
+    @memoized_property
+    def mean(self):
+        return np.mean(self.processed)
+
+    @memoized_property
+    def std(self):
+        return np.std(self.processed)
+
+    @memoized_property
+    def var(self):
+        return np.var(self.processed)
+
+    @memoized_property
+    def contours(self):
+        """External contours of the 8-bit preprocessed image"""
+        processed_u8 = self.processed_u8
+        with self.stage('contours'):
+            contours, _ = cv2.findContours(processed_u8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return contours
+
+    @memoized_property
+    def features(self):
+        """Region statistics for this scan type's CV heuristics, or None"""
+        return batch_features(self.scan_type, self.processed[None])[0]
+
+    @memoized_property
+    def perceptual_hash(self):
+        """(pHash, dHash) of the preprocessed image, for near-duplicate lookups"""
+        processed = self.processed
+        with self.stage('phash'):
+            return image_hashes(processed)
+
+    @memoized_property
+    def rgb_pil(self):
+        """Original image as an RGB PIL image"""
+        return Image.fromarray(cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB))
+
+    @memoized_property
+    def processed_pil(self):
+        """Preprocessed image as an RGB PIL image"""
+        return Image.fromarray(self.processed_u8).convert('RGB')
+
+    def edges(self, low, high):
+        """Canny edges of the 8-bit preprocessed image"""
+        key = (low, high)
+        if key not in self._edges:
+            processed_u8 = self.processed_u8
+            with self.stage('edges'):
+                self._edges[key] = cv2.Canny(processed_u8, low, high)
+        return self._edges[key]
+
+    def edge_contours(self, low, high):
+        """External contours of the Canny edge map"""
+        key = (low, high)
+        if key not in self._edge_contours:
+            edges = self.edges(low, high)
+            with self.stage('contours'):
+                contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            self._edge_contours[key] = contours
+        return self._edge_contours[key]
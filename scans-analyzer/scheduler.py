@@ -0,0 +1,100 @@
+import os
+import threading
+from contextlib import contextmanager
+import torch
+from per_process import PerProcess
+
+# Scheduling policy for model executions:
+#   SCANS_MAX_CONCURRENT_PER_TYPE     - concurrent forward passes per scan type
+#   SCANS_MAX_CONCURRENT_INFERENCES   - concurrent forward passes overall (0 = no limit)
+#   SCANS_MIN_INFERENCE_THREADS       - floor for a single inference's thread budget
+# The thread pool being shared is SCANS_WORKER_COMPUTE_THREADS (set per
+# gunicorn worker) or every core available to the process.
+MAX_CONCURRENT_PER_TYPE = int(os.environ.get('SCANS_MAX_CONCURRENT_PER_TYPE', 1))
+MAX_CONCURRENT_INFERENCES = int(os.environ.get('SCANS_MAX_CONCURRENT_INFERENCES', 0))
+MIN_INFERENCE_THREADS = int(os.environ.get('SCANS_MIN_INFERENCE_THREADS', 1))
+
+
+def available_threads():
+    configured = os.environ.get('SCANS_WORKER_COMPUTE_THREADS')
+    if configured:
+        return max(1, int(configured))
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class InferenceScheduler:
+    """Admit model executions and give each one a share of the CPU threads.
+
+    An inference waits while its scan type (or the process) is at its
+    concurrency limit. Once admitted, its budget is the thread pool divided
+    by everything running or queued at that moment, so a lone request uses
+    every core while a burst splits them instead of thrashing.
+
+    torch's intra-op thread count is process-wide, not per thread, so it
+    cannot differ between concurrent inferences. The scheduler sets it to
+    the current share whenever an inference starts or finishes, and every
+    running inference uses that value for its next parallel region.
+    """
+
+    def __init__(self, per_type=MAX_CONCURRENT_PER_TYPE, total=MAX_CONCURRENT_INFERENCES,
+                 min_threads=MIN_INFERENCE_THREADS):
+        self.per_type = max(1, per_type)
+        self.total = total
+        self.min_threads = max(1, min_threads)
+        self._cond = threading.Condition()
+        self._running = {}
+        self._waiting = 0
+        # Re-read after fork(): gunicorn sets each worker's share in post_fork
+        self._threads = PerProcess(available_threads)
+
+    @contextmanager
+    def slot(self, scan_type):
+        """Block until the inference may run; yields its thread budget"""
+        with self._cond:
+            self._waiting += 1
+            while not self._can_run(scan_type):
+                self._cond.wait()
+            self._waiting -= 1
+            self._running[scan_type] = self._running.get(scan_type, 0) + 1
+            threads = self._budget()
+            self._apply(threads)
+
+        try:
+            yield threads
+        finally:
+            with self._cond:
+                self._running[scan_type] -= 1
+                self._apply(self._budget())
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'running': {t: n for t, n in self._running.items() if n},
+                'waiting': self._waiting,
+                'compute_threads': self._total_threads(),
+                'max_concurrent_per_type': self.per_type,
+                'max_concurrent_inferences': self.total
+            }
+
+    def _can_run(self, scan_type):
+        if self._running.get(scan_type, 0) >= self.per_type:
+            return False
+        return self.total <= 0 or sum(self._running.values()) < self.total
+
+    def _budget(self):
+        demand = sum(self._running.values()) + self._waiting
+        return max(self.min_threads, self._total_threads() // max(1, demand))
+
+    def _apply(self, threads):
+        # Called with self._cond held; process-wide, see the class docstring
+        if torch.get_num_threads() != threads:
+            torch.set_num_threads(threads)
+
+    def _total_threads(self):
+        return self._threads.get()
+
+
+scheduler = InferenceScheduler()
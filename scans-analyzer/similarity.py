@@ -0,0 +1,457 @@
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from queue import Full, Queue
+import cv2
+import numpy as np
+from per_process import PerProcess
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: indexes are then only shared between threads of one process
+    fcntl = None
+
+# Root of the on-disk vector indexes, one directory per scan type and embedder.
+# Off unless set: the indexes hold embeddings of patient scans.
+SIMILARITY_DIR = os.environ.get('SCANS_SIMILARITY_DIR', '')
+
+# Scans kept per index; past it the oldest quarter is dropped (0 = no limit)
+SIMILARITY_MAX_SCANS = int(os.environ.get('SCANS_SIMILARITY_MAX_SCANS', 100000))
+
+# Scans waiting for the background writer; beyond it new scans are not indexed
+SIMILARITY_QUEUE_SIZE = int(os.environ.get('SCANS_SIMILARITY_QUEUE_SIZE', 1024))
+
+# Below this many scans a search is exact; above it the IVF structure is trained and used
+IVF_MIN_VECTORS = int(os.environ.get('SCANS_SIMILARITY_IVF_MIN', 20000))
+
+# Inverted lists searched per query; more is slower and closer to exact
+IVF_PROBES = int(os.environ.get('SCANS_SIMILARITY_PROBES', 16))
+
+SIMILAR_DEFAULT_K = 10
+SIMILAR_MAX_K = 100
+
+# Every embedder is projected to this size and stored as float16 (512 bytes per scan)
+EMBEDDING_DIM = 256
+
+# Rows appended since the inverted lists were built that are searched exhaustively
+# until there are this many, when they are bucketed into the lists
+IVF_TAIL_ROWS = 4096
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLES_PER_LIST = 64
+
+_projections = {}
+_projections_lock = threading.Lock()
+
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """Exclusive lock on path shared by every process; yields False if non-blocking and already held"""
+    if fcntl is None:
+        with _thread_locks_lock:
+            lock = _thread_locks.setdefault(path, threading.Lock())
+        acquired = lock.acquire(blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                lock.release()
+        return
+
+    with open(path, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def projection(dim):
+    """Fixed Gaussian random projection from dim to EMBEDDING_DIM; preserves cosine similarity"""
+    with _projections_lock:
+        if dim not in _projections:
+            rng = np.random.default_rng(dim)
+            _projections[dim] = rng.standard_normal((dim, EMBEDDING_DIM), dtype=np.float32) / np.sqrt(EMBEDDING_DIM)
+        return _projections[dim]
+
+
+def model_embedding(features):
+    """Compact embedding of a model's pooled backbone features"""
+    features = np.asarray(features, dtype=np.float32).ravel()
+    return normalize(features @ projection(len(features)))
+
+
+def cv_embedding(processed):
+    """Fixed CV feature vector: the preprocessed scan reduced to 16x16, centred and normalised"""
+    side = int(np.sqrt(EMBEDDING_DIM))
+    small = cv2.resize(processed.astype(np.float32), (side, side), interpolation=cv2.INTER_AREA).ravel()
+    return normalize(small - small.mean())
+
+
+def new_scan_id():
+    return uuid.uuid4().hex
+
+
+def _nearest(vectors, centroids, chunk=16384):
+    """Index of the most similar centroid for every row"""
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        assign[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def spherical_kmeans(sample, lists, iterations=KMEANS_ITERATIONS, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=lists)
+        # Empty lists restart from random scans
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids.astype(np.float32)
+
+
+class VectorIndex:
+    """Append-only float16 embeddings of one scan type and embedder, with an IVF search structure.
+
+    vectors.f16 and ids.bin grow by one row per scan, appended under an
+    exclusive file lock so every process serving the index sees the same
+    rows, and are memory-mapped for search. At ``max_scans`` rows both files
+    are rewritten without their oldest quarter. Once there are IVF_MIN_VECTORS
+    scans a spherical k-means coarse quantizer is trained (and retrained
+    whenever the index has doubled); a query then scores only the scans in
+    its IVF_PROBES closest lists plus the recently added tail.
+    """
+
+    def __init__(self, directory, dim=EMBEDDING_DIM, max_scans=SIMILARITY_MAX_SCANS):
+        self.directory = directory
+        self.dim = dim
+        self.max_scans = max_scans
+        self.row_bytes = dim * 2
+        self.vectors_path = os.path.join(directory, 'vectors.f16')
+        self.ids_path = os.path.join(directory, 'ids.bin')
+        self.ivf_path = os.path.join(directory, 'ivf.npz')
+        self.lock_path = os.path.join(directory, '.lock')
+        self._lock = threading.RLock()
+        self._vectors = None
+        self._ids = None
+        self._count = 0
+        self._files = (None, None)  # (inode, size) of vectors.f16 and ids.bin when last mapped
+        self._ivf_mtime = None
+        self._centroids = None
+        self._trained_count = 0
+        self._assign = np.empty(0, dtype=np.int32)  # list of rows [0, len(_assign))
+        self._order = None
+        self._bounds = None
+        self._training = False
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._count
+
+    def add(self, scan_id, vector):
+        row = np.asarray(vector, dtype=np.float16).reshape(self.dim)
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(self.lock_path):
+            # A previous writer may have died between the two appends
+            count = min(self._file_rows(self.vectors_path, self.row_bytes), self._file_rows(self.ids_path, 16))
+            if self.max_scans > 0 and count >= self.max_scans:
+                count = self._drop_oldest(count, self.max_scans * 3 // 4)
+            with open(self.vectors_path, 'r+b' if os.path.exists(self.vectors_path) else 'wb') as f:
+                f.truncate(count * self.row_bytes)
+                f.seek(0, os.SEEK_END)
+                f.write(row.tobytes())
+            with open(self.ids_path, 'r+b' if os.path.exists(self.ids_path) else 'wb') as f:
+                f.truncate(count * 16)
+                f.seek(0, os.SEEK_END)
+                f.write(uuid.UUID(hex=scan_id).bytes)
+
+        with self._lock:
+            self._refresh()
+            retrain = self._count >= IVF_MIN_VECTORS and self._count >= 2 * self._trained_count
+        if retrain:
+            self._train_in_background()
+
+    def _drop_oldest(self, count, keep):
+        # Called with the file lock held. The files are replaced rather than
+        # rewritten in place, so other processes' memory maps stay valid until
+        # they remap; the IVF lists refer to the old rows and are discarded.
+        drop = count - keep
+        for path, row_bytes in ((self.vectors_path, self.row_bytes), (self.ids_path, 16)):
+            with open(path, 'rb') as f:
+                f.seek(drop * row_bytes)
+                rows = f.read(keep * row_bytes)
+            staging = path + '.tmp'
+            with open(staging, 'wb') as f:
+                f.write(rows)
+            os.replace(staging, path)
+        try:
+            os.remove(self.ivf_path)
+        except FileNotFoundError:
+            pass
+        print(f"🧹 Similarity index {os.path.basename(self.directory)}: dropped the oldest {drop} scans")
+        return keep
+
+    def vector_of(self, scan_id):
+        """Stored embedding of a scan, or None if it is not in this index"""
+        with self._lock:
+            self._refresh()
+            if self._count == 0:
+                return None
+            key = np.frombuffer(uuid.UUID(hex=scan_id).bytes, dtype=np.uint64)
+            ids = self._ids[:self._count]
+            rows = np.flatnonzero((ids[:, 0] == key[0]) & (ids[:, 1] == key[1]))
+            if len(rows) == 0:
+                return None
+            return np.asarray(self._vectors[rows[0]], dtype=np.float32)
+
+    def search(self, vector, k=SIMILAR_DEFAULT_K, exclude=None):
+        """[(scan_id, cosine similarity)] of the k most similar scans"""
+        query = normalize(np.asarray(vector, dtype=np.float32).reshape(self.dim))
+        with self._lock:
+            self._refresh()
+            if self._count == 0:
+                return []
+            candidates = self._candidates(query)
+            scores = np.asarray(self._vectors[candidates], dtype=np.float32) @ query
+            ids = self._ids[candidates]
+
+        if exclude is not None:
+            key = np.frombuffer(uuid.UUID(hex=exclude).bytes, dtype=np.uint64)
+            keep = ~((ids[:, 0] == key[0]) & (ids[:, 1] == key[1]))
+            candidates, scores, ids = candidates[keep], scores[keep], ids[keep]
+
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(uuid.UUID(bytes=ids[i].tobytes()).hex, round(float(scores[i]), 4)) for i in top]
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {
+                'scans': self._count,
+                'max_scans': self.max_scans,
+                'ivf_lists': 0 if self._centroids is None else len(self._centroids),
+                'ivf_trained_on': self._trained_count,
+                'disk_mb': round(self._count * (self.row_bytes + 16) / (1024 * 1024), 2)
+            }
+
+    def _candidates(self, query):
+        # Called with self._lock held
+        if self._order is None:
+            return np.arange(self._count)
+        probes = min(IVF_PROBES, len(self._centroids))
+        nearest = np.argpartition(-(self._centroids @ query), probes - 1)[:probes]
+        rows = [self._order[self._bounds[p]:self._bounds[p + 1]] for p in nearest]
+        rows.append(np.arange(len(self._assign), self._count))
+        return np.sort(np.concatenate(rows))
+
+    def _refresh(self):
+        # Called with self._lock held; picks up rows, compaction and training from other processes
+        if self._file_states() != self._files:
+            # Under the writers' lock, so both files are mapped from the same compaction
+            with file_lock(self.lock_path):
+                files = self._file_states()
+                count = min(self._file_rows(self.vectors_path, self.row_bytes), self._file_rows(self.ids_path, 16))
+                self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r', shape=(count, self.dim)) if count else None
+                self._ids = np.memmap(self.ids_path, dtype=np.uint64, mode='r', shape=(count, 2)) if count else None
+                self._count = count
+            if self._inodes(files) != self._inodes(self._files):
+                self._ivf_mtime = ()  # rows have moved; reload (or drop) the IVF lists below
+            self._files = files
+
+        try:
+            mtime = os.path.getmtime(self.ivf_path)
+        except OSError:
+            mtime = None
+        if mtime != self._ivf_mtime:
+            self._ivf_mtime = mtime
+            self._centroids, self._trained_count, self._assign = None, 0, np.empty(0, dtype=np.int32)
+            if mtime is not None:
+                with np.load(self.ivf_path) as ivf:
+                    self._centroids = ivf['centroids']
+                    self._trained_count = int(ivf['trained_count'])
+                    self._assign = ivf['assign'][:self._count]
+            self._order = None
+
+        if self._centroids is not None and (self._order is None or self._count - len(self._assign) >= IVF_TAIL_ROWS):
+            tail = _nearest(self._vectors[len(self._assign):self._count], self._centroids)
+            self._assign = np.concatenate([self._assign, tail])
+            self._order = np.argsort(self._assign, kind='stable')
+            self._bounds = np.searchsorted(self._assign[self._order], np.arange(len(self._centroids) + 1))
+
+    def _train_in_background(self):
+        with self._lock:
+            if self._training:
+                return
+            self._training = True
+        threading.Thread(target=self.train, name='similarity-train', daemon=True).start()
+
+    def train(self):
+        """Fit the coarse quantizer on a sample of the index and assign every scan to a list"""
+        try:
+            with file_lock(os.path.join(self.directory, '.train.lock'), blocking=False) as locked:
+                if not locked:
+                    return  # another process is training this index
+                started = time.perf_counter()
+                with self._lock:
+                    self._refresh()
+                    count, vectors, files = self._count, self._vectors, self._files
+                lists = int(np.clip(np.sqrt(count), 16, 4096))
+                rng = np.random.default_rng(count)
+                sample_rows = np.sort(rng.choice(count, min(count, lists * KMEANS_SAMPLES_PER_LIST), replace=False))
+                centroids = spherical_kmeans(np.asarray(vectors[sample_rows], dtype=np.float32), lists)
+                assign = _nearest(vectors[:count], centroids)
+
+                staging = self.ivf_path + '.tmp.npz'
+                np.savez(staging, centroids=centroids, assign=assign, trained_count=count)
+                with file_lock(self.lock_path):
+                    if self._inodes(self._file_states()) != self._inodes(files):
+                        os.remove(staging)
+                        return  # the oldest scans were dropped meanwhile, so these lists are stale
+                    os.replace(staging, self.ivf_path)
+                with self._lock:
+                    self._refresh()
+                print(f"🧭 Similarity index {os.path.basename(self.directory)}: {lists} lists over {count} scans "
+                      f"in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            print(f"Similarity index training error: {e}")
+        finally:
+            with self._lock:
+                self._training = False
+
+    def _file_states(self):
+        return self._file_state(self.vectors_path), self._file_state(self.ids_path)
+
+    @staticmethod
+    def _file_state(path):
+        try:
+            stat = os.stat(path)
+            return stat.st_ino, stat.st_size
+        except OSError:
+            return None
+
+    @staticmethod
+    def _inodes(files):
+        return [state and state[0] for state in files]
+
+    @staticmethod
+    def _file_rows(path, row_bytes):
+        try:
+            return os.path.getsize(path) // row_bytes
+        except OSError:
+            return 0
+
+
+class SimilarityIndex:
+    """Per-scan-type vector indexes of analyzed scans for similar-case retrieval.
+
+    Scans are embedded by whatever produced their result (the model's
+    pooled backbone features, or a CV vector when no model ran), and each
+    scan type and embedder gets its own index, since their vectors are not
+    comparable. Scans are written by a background thread, so indexing adds
+    no disk I/O to the request; a scan can be queried once it is written.
+    """
+
+    def __init__(self, root=SIMILARITY_DIR, max_scans=SIMILARITY_MAX_SCANS, queue_size=SIMILARITY_QUEUE_SIZE):
+        self.root = root
+        self.max_scans = max_scans
+        self.queue_size = queue_size
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._writer = PerProcess(self._start_writer)  # the writer's queue
+
+    @property
+    def enabled(self):
+        return bool(self.root)
+
+    def index(self, scan_type, embedder):
+        directory = os.path.join(self.root, scan_type, re.sub(r'[^A-Za-z0-9_.-]+', '_', embedder))
+        with self._lock:
+            if directory not in self._indexes:
+                self._indexes[directory] = VectorIndex(directory, max_scans=self.max_scans)
+            return self._indexes[directory]
+
+    def add(self, scan_type, embedder, scan_id, vector):
+        """Queue a scan for the background writer"""
+        if not self.enabled:
+            return
+        try:
+            self._writer.get().put_nowait((scan_type, embedder, scan_id, vector))
+        except Full:
+            # Retrieval is secondary; never hold up an analysis for it
+            print(f"Similarity index queue full, scan {scan_id} not indexed")
+
+    def flush(self):
+        """Wait until every queued scan has been written"""
+        queue = self._writer.current()
+        if queue is not None:
+            queue.join()
+
+    def similar(self, scan_type, scan_id, k=SIMILAR_DEFAULT_K):
+        """(embedder, [(scan_id, similarity)]) for a stored scan, or None if it is unknown"""
+        try:
+            uuid.UUID(hex=scan_id)
+        except ValueError:
+            return None
+        for embedder in self._embedders(scan_type):
+            index = self.index(scan_type, embedder)
+            vector = index.vector_of(scan_id)
+            if vector is not None:
+                return embedder, index.search(vector, k, exclude=scan_id)
+        return None
+
+    def stats(self):
+        if not self.enabled:
+            return {'enabled': False}
+        indexes = {}
+        for scan_type in sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []:
+            for embedder in self._embedders(scan_type):
+                indexes[f"{scan_type}/{embedder}"] = self.index(scan_type, embedder).stats()
+        queue = self._writer.current()
+        return {'enabled': True, 'queued': 0 if queue is None else queue.qsize(), 'indexes': indexes}
+
+    def _start_writer(self):
+        queue = Queue(maxsize=max(1, self.queue_size))
+        threading.Thread(target=self._write, args=(queue,), name='similarity-writer', daemon=True).start()
+        return queue
+
+    def _write(self, queue):
+        while True:
+            scan_type, embedder, scan_id, vector = queue.get()
+            try:
+                self.index(scan_type, embedder).add(scan_id, vector)
+            except Exception as e:
+                print(f"Similarity index write error: {e}")
+            finally:
+                queue.task_done()
+
+    def _embedders(self, scan_type):
+        directory = os.path.join(self.root, scan_type)
+        if not self.enabled or not os.path.isdir(directory):
+            return []
+        return sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
@@ -0,0 +1,302 @@
+import io
+import os
+import struct
+from collections import namedtuple
+
+try:
+    import pydicom
+except ImportError:  # DICOM uploads are then sniffed without their dimensions
+    pydicom = None
+
+# Largest single upload read into memory; the rest of the stream is never read
+MAX_UPLOAD_BYTES = int(os.environ.get('SCANS_MAX_UPLOAD_BYTES', 64 * 1024 * 1024))
+
+# Largest image a header may declare, in pixels (frames included for DICOM).
+# Compressed formats can declare far more pixels than their size suggests,
+# so this is what bounds decode memory against decompression bombs.
+MAX_IMAGE_PIXELS = int(os.environ.get('SCANS_MAX_IMAGE_PIXELS', 64 * 1024 * 1024))
+
+# Largest decoded size the header implies (pixels x channels x bytes per sample)
+MAX_DECODED_BYTES = int(os.environ.get('SCANS_MAX_DECODED_MB', 512)) * 1024 * 1024
+
+# Bytes read before the first check; enough for the headers of typical uploads
+SNIFF_BYTES = 64 * 1024
+
+READ_CHUNK_BYTES = 1024 * 1024
+
+ImageHeader = namedtuple('ImageHeader', ['format', 'width', 'height', 'bit_depth', 'channels', 'frames'])
+
+# Bits per sample each format allows
+VALID_BIT_DEPTHS = {
+    'png': (1, 2, 4, 8, 16),
+    'jpeg': (8, 12, 16),
+    'bmp': (1, 4, 5, 8),
+    'tiff': (1, 2, 4, 8, 16, 32, 64),
+    'webp': (8,),
+    'gif': (1, 2, 3, 4, 5, 6, 7, 8),
+    'jpeg2000': tuple(range(1, 39)),
+    'dicom': (1, 8, 16, 32)
+}
+
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# Start-of-frame markers carrying the dimensions (not DHT, JPG or DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class UploadRejected(Exception):
+    """Raised when an upload is refused before decoding; carries the HTTP status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _Incomplete(Exception):
+    """The header runs past the bytes read so far"""
+
+
+def is_dicom(data):
+    """DICOM Part 10 files carry 'DICM' after a 128-byte preamble"""
+    return len(data) > 132 and data[128:132] == b'DICM'
+
+
+def sniff_header(data):
+    """ImageHeader from the magic bytes and header fields, or None if unrecognised or malformed"""
+    try:
+        return _sniff(data, complete=True)
+    except UploadRejected:
+        return None
+
+
+def check_upload(data, header=None, max_bytes=MAX_UPLOAD_BYTES):
+    """Validate a complete upload without decoding pixels; returns its ImageHeader.
+
+    Rejects empty, unrecognised, malformed and truncated uploads, those over
+    max_bytes and those declaring more pixels or decoded bytes than the
+    limits allow.
+    """
+    if not data:
+        raise UploadRejected("Empty upload")
+    if len(data) > max_bytes:
+        raise UploadRejected(f"Upload exceeds {max_bytes // (1024 * 1024)} MB", 413)
+    header = header or _sniff(data, complete=True)
+    check_limits(header)
+    if _truncated(header.format, data):
+        raise UploadRejected(f"Truncated {header.format.upper()} upload")
+    return header
+
+
+def check_limits(header):
+    if header.width is None:
+        # DICOM without pydicom; the decoder rejects it
+        return
+    if header.width <= 0 or header.height <= 0:
+        raise UploadRejected(f"Image declares invalid dimensions {header.width}x{header.height}")
+    if header.bit_depth not in VALID_BIT_DEPTHS[header.format]:
+        raise UploadRejected(f"Unsupported {header.format.upper()} bit depth {header.bit_depth}")
+    pixels = header.width * header.height * header.frames
+    if pixels > MAX_IMAGE_PIXELS:
+        raise UploadRejected(
+            f"Image declares {header.width}x{header.height}"
+            + (f"x{header.frames} frames" if header.frames > 1 else "")
+            + f" pixels, over the {MAX_IMAGE_PIXELS} pixel limit", 413
+        )
+    decoded = pixels * header.channels * max(1, (header.bit_depth + 7) // 8)
+    if decoded > MAX_DECODED_BYTES:
+        raise UploadRejected(f"Image would decode to {decoded // (1024 * 1024)} MB, over the limit", 413)
+
+
+def read_upload(file, max_bytes=MAX_UPLOAD_BYTES):
+    """Read an uploaded file with a size cap, checking its header before the body.
+
+    Bad formats and decompression bombs are refused from the first chunk, so
+    their bodies are never read into memory; uploads over max_bytes are
+    refused as soon as the cap is passed.
+    """
+    stream = getattr(file, 'stream', file)
+    head = stream.read(SNIFF_BYTES)
+    if not head:
+        raise UploadRejected("Empty upload")
+    if len(head) > max_bytes:
+        raise UploadRejected(f"Upload exceeds {max_bytes // (1024 * 1024)} MB", 413)
+    try:
+        header = _sniff(head, complete=False)
+        check_limits(header)
+    except _Incomplete:
+        # Large metadata segments; checked once the whole upload is read
+        header = None
+
+    chunks = [head]
+    total = len(head)
+    while True:
+        chunk = stream.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadRejected(f"Upload exceeds {max_bytes // (1024 * 1024)} MB", 413)
+        chunks.append(chunk)
+
+    data = b''.join(chunks)
+    return data, check_upload(data, header, max_bytes)
+
+
+def _sniff(data, complete):
+    try:
+        for sniffer in (_sniff_jpeg, _sniff_png, _sniff_dicom, _sniff_tiff, _sniff_webp, _sniff_bmp,
+                        _sniff_gif, _sniff_jpeg2000):
+            header = sniffer(data)
+            if header is not None:
+                return header
+    except (IndexError, struct.error):
+        if not complete:
+            raise _Incomplete()
+        raise UploadRejected("Malformed image header")
+    if not complete and len(data) <= 132:
+        raise _Incomplete()
+    raise UploadRejected("Unsupported image format", 415)
+
+
+def _sniff_png(data):
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        return None
+    if data[12:16] != b'IHDR':
+        raise UploadRejected("Malformed PNG header")
+    width, height, bit_depth, color_type = struct.unpack('>IIBB', data[16:26])
+    if color_type not in PNG_CHANNELS:
+        raise UploadRejected(f"Unsupported PNG color type {color_type}")
+    return ImageHeader('png', width, height, bit_depth, PNG_CHANNELS[color_type], 1)
+
+
+def _sniff_jpeg(data):
+    if data[:3] != b'\xff\xd8\xff':
+        return None
+    offset = 2
+    while True:
+        if data[offset] != 0xFF:
+            raise UploadRejected("Malformed JPEG header")
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            offset += 1
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            precision, height, width, components = struct.unpack('>BHHB', data[offset + 4:offset + 10])
+            return ImageHeader('jpeg', width, height, precision, components, 1)
+        if marker == 0xDA or marker == 0xD9:
+            raise UploadRejected("JPEG has no frame header")
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            # Markers without a length
+            offset += 2
+            continue
+        offset += 2 + struct.unpack('>H', data[offset + 2:offset + 4])[0]
+
+
+def _sniff_bmp(data):
+    if data[:2] != b'BM':
+        return None
+    dib_size = struct.unpack('<I', data[14:18])[0]
+    if dib_size == 12:
+        width, height, _, bits = struct.unpack('<HHHH', data[18:26])
+    else:
+        width, height, _, bits = struct.unpack('<iiHH', data[18:30])
+    # Bits per pixel as (bits per sample, samples); palette images have one index sample
+    bit_depth, channels = {16: (5, 3), 24: (8, 3), 32: (8, 4)}.get(bits, (bits, 1))
+    return ImageHeader('bmp', width, abs(height), bit_depth, channels, 1)
+
+
+def _sniff_tiff(data):
+    if data[:4] == b'II*\x00':
+        order = '<'
+    elif data[:4] == b'MM\x00*':
+        order = '>'
+    else:
+        return None
+    ifd = struct.unpack(order + 'I', data[4:8])[0]
+    count = struct.unpack(order + 'H', data[ifd:ifd + 2])[0]
+    tags = {}
+    for i in range(count):
+        entry = ifd + 2 + 12 * i
+        tag, kind, values = struct.unpack(order + 'HHI', data[entry:entry + 8])
+        if tag not in (256, 257, 258, 277):
+            continue
+        value_format = order + ('H' if kind == 3 else 'I')
+        # Several values live elsewhere in the file; the first one is enough
+        where = entry + 8 if values * struct.calcsize(value_format[1]) <= 4 else struct.unpack(
+            order + 'I', data[entry + 8:entry + 12])[0]
+        tags[tag] = struct.unpack(value_format, data[where:where + struct.calcsize(value_format[1])])[0]
+    if 256 not in tags or 257 not in tags:
+        raise UploadRejected("TIFF has no image dimensions")
+    return ImageHeader('tiff', tags[256], tags[257], tags.get(258, 1), tags.get(277, 1), 1)
+
+
+def _sniff_webp(data):
+    if data[:4] != b'RIFF' or data[8:12] != b'WEBP':
+        return None
+    chunk = data[12:16]
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', data[26:30])
+        width, height = width & 0x3FFF, height & 0x3FFF
+    elif chunk == b'VP8L':
+        bits = struct.unpack('<I', data[21:25])[0]
+        width, height = 1 + (bits & 0x3FFF), 1 + ((bits >> 14) & 0x3FFF)
+    elif chunk == b'VP8X':
+        if len(data) < 30:
+            raise IndexError
+        width = 1 + int.from_bytes(data[24:27], 'little')
+        height = 1 + int.from_bytes(data[27:30], 'little')
+    else:
+        raise UploadRejected("Malformed WebP header")
+    return ImageHeader('webp', width, height, 8, 4, 1)
+
+
+def _sniff_gif(data):
+    if data[:6] not in (b'GIF87a', b'GIF89a'):
+        return None
+    width, height, flags = struct.unpack('<HHB', data[6:11])
+    return ImageHeader('gif', width, height, (flags & 0x07) + 1, 3, 1)
+
+
+def _sniff_jpeg2000(data):
+    if data[:12] != b'\x00\x00\x00\x0cjP  \r\n\x87\n':
+        return None
+    box = data.find(b'ihdr', 0, 1024)
+    if box < 0:
+        raise IndexError
+    height, width, components, depth = struct.unpack('>IIHB', data[box + 4:box + 15])
+    return ImageHeader('jpeg2000', width, height, (depth & 0x7F) + 1, components, 1)
+
+
+def _sniff_dicom(data):
+    if len(data) <= 132 or data[128:132] != b'DICM':
+        return None
+    if pydicom is None:
+        return ImageHeader('dicom', None, None, None, None, None)
+    try:
+        ds = pydicom.dcmread(io.BytesIO(data), stop_before_pixels=True)
+        return ImageHeader(
+            'dicom', int(ds.Columns), int(ds.Rows), int(ds.BitsAllocated),
+            int(ds.get('SamplesPerPixel', 1)), int(ds.get('NumberOfFrames', 1) or 1)
+        )
+    except Exception:
+        # The image description is past the bytes read, missing or corrupt
+        raise IndexError
+
+
+def _truncated(image_format, data):
+    """Whether a format with an end marker or declared length stops early"""
+    if image_format == 'png':
+        return data.rfind(b'IEND', max(0, len(data) - 64)) < 0
+    if image_format == 'jpeg':
+        # No scan may start after the last end of image (an embedded thumbnail
+        # has its own); byte stuffing keeps both markers out of scan data
+        end = data.rfind(b'\xff\xd9')
+        return end < 0 or data.find(b'\xff\xda', end) >= 0
+    if image_format == 'webp':
+        return struct.unpack('<I', data[4:8])[0] + 8 > len(data)
+    if image_format == 'bmp':
+        return struct.unpack('<I', data[2:6])[0] > len(data)
+    if image_format == 'gif':
+        return not data.rstrip(b'\x00').endswith(b';')
+    return False
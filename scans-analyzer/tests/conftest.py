@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The service modules are flat siblings imported by name, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing app builds the service; keep it offline, cold and in memory
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+os.environ.setdefault('SCANS_PRELOAD_MODELS', '')
+os.environ.setdefault('SCANS_WARMUP', 'off')
+os.environ.setdefault('SCANS_RESULT_CACHE_DB', '')
+os.environ.setdefault('SCANS_SIMILARITY_DIR', '')
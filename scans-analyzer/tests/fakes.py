@@ -0,0 +1,49 @@
+import time
+
+
+class FakePipe:
+    """Stands in for an image-classification pipeline; echoes each image back as its label, or a fixed label"""
+
+    def __init__(self, delay=0.0, model_bytes=0, label=None):
+        self.delay = delay
+        self.model_bytes = model_bytes
+        self.label = label
+        self.calls = []
+
+    def __call__(self, images, batch_size=None):
+        time.sleep(self.delay)
+        if not isinstance(images, list):
+            return [{'label': images if self.label is None else self.label, 'score': 1.0}]
+        self.calls.append(len(images))
+        return [[{'label': image if self.label is None else self.label, 'score': 1.0}] for image in images]
+
+
+class FakeTessAPI:
+    """Stands in for tesserocr.PyTessBaseAPI; records the size of each image it is given"""
+
+    def __init__(self, lang='eng', delay=0.0, fail=False):
+        if fail:
+            raise RuntimeError("Failed to init API, possibly an invalid tessdata path")
+        self.lang = lang
+        self.delay = delay
+        self.sizes = []
+
+    def SetImage(self, image):
+        self.sizes.append(image.size)
+
+    def GetUTF8Text(self):
+        time.sleep(self.delay)
+        return 'FAKE TEXT'
+
+
+class FakeTesseract:
+    """Stands in for pytesseract's image_to_string; records each image's shape and the timeout it was given"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def image_to_string(self, image, timeout=0):
+        self.calls.append((image.shape, timeout))
+        time.sleep(self.delay)
+        return 'FAKE TEXT'
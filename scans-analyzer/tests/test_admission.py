@@ -0,0 +1,131 @@
+import threading
+import time
+import pytest
+import admission
+from admission import AdmissionController, Overloaded, per_type_limits
+
+
+def hold(controller, scan_type, started, release):
+    with controller.admit(scan_type):
+        started.set()
+        release.wait(5)
+
+
+def queue_behind(controller, scan_type, outcomes):
+    try:
+        with controller.admit(scan_type):
+            outcomes.append('admitted')
+    except Overloaded as e:
+        outcomes.append(e.status)
+
+
+def test_per_type_limits():
+    assert per_type_limits("2,skin=1", int) == (2, {'skin': 1})
+    assert per_type_limits("", float) == (None, {})
+
+
+def test_full_queue_gets_429(monkeypatch):
+    monkeypatch.setattr(admission, 'INITIAL_SERVICE_SECONDS', 0.01)
+    controller = AdmissionController(['chest'], concurrency='1', queue_size='1', deadline='5')
+    started, release = threading.Event(), threading.Event()
+    running = threading.Thread(target=hold, args=(controller, 'chest', started, release))
+    running.start()
+    started.wait(5)
+
+    outcomes = []
+    waiting = threading.Thread(target=queue_behind, args=(controller, 'chest', outcomes))
+    waiting.start()
+    while controller.queue_depth() < 1:
+        time.sleep(0.01)
+    assert controller.saturated() == ['chest']
+
+    with pytest.raises(Overloaded) as refused:
+        with controller.admit('chest'):
+            pass
+    assert refused.value.status == 429 and refused.value.reason == 'queue_full'
+    assert refused.value.retry_after >= 1
+
+    release.set()
+    running.join(5)
+    waiting.join(5)
+    assert outcomes == ['admitted']
+    assert controller.stats()['chest']['rejected'] == {'queue_full': 1, 'deadline': 0}
+
+
+def test_wait_past_deadline_gets_503(monkeypatch):
+    monkeypatch.setattr(admission, 'INITIAL_SERVICE_SECONDS', 0.01)
+    controller = AdmissionController(['chest'], concurrency='1', queue_size='4', deadline='0.2')
+    started, release = threading.Event(), threading.Event()
+    running = threading.Thread(target=hold, args=(controller, 'chest', started, release))
+    running.start()
+    started.wait(5)
+
+    outcomes = []
+    queue_behind(controller, 'chest', outcomes)
+    release.set()
+    running.join(5)
+    assert outcomes == [503]
+    assert controller.queue_depth() == 0
+
+
+def test_expected_wait_past_deadline_gets_503_at_once():
+    # Service times above the deadline refuse queued requests without waiting
+    controller = AdmissionController(['chest'], concurrency='1', queue_size='4', deadline='0.5')
+    started, release = threading.Event(), threading.Event()
+    running = threading.Thread(target=hold, args=(controller, 'chest', started, release))
+    running.start()
+    started.wait(5)
+
+    began = time.monotonic()
+    with pytest.raises(Overloaded) as refused:
+        with controller.admit('chest'):
+            pass
+    assert refused.value.status == 503 and refused.value.reason == 'deadline'
+    assert time.monotonic() - began < 0.2
+    release.set()
+    running.join(5)
+
+
+def test_other_scan_types_are_not_held_up():
+    controller = AdmissionController(['chest', 'skin'], concurrency='1,skin=2', queue_size='0', deadline='1')
+    started, release = threading.Event(), threading.Event()
+    running = threading.Thread(target=hold, args=(controller, 'chest', started, release))
+    running.start()
+    started.wait(5)
+    with controller.admit('skin'), controller.admit('skin'):
+        pass
+    with pytest.raises(Overloaded):
+        with controller.admit('chest'):
+            pass
+    release.set()
+    running.join(5)
+
+
+def test_zero_concurrency_disables_admission():
+    controller = AdmissionController(['chest'], concurrency='0')
+    with controller.admit('chest'), controller.admit('chest'):
+        assert controller.stats() == {}
+
+
+def test_analyze_reports_overload_with_retry_after(monkeypatch):
+    import io
+    import cv2
+    import numpy as np
+    import app
+
+    controller = AdmissionController(['kidney'], concurrency='1', queue_size='0', deadline='1')
+    monkeypatch.setattr(app, 'admission', controller)
+    started, release = threading.Event(), threading.Event()
+    running = threading.Thread(target=hold, args=(controller, 'kidney', started, release))
+    running.start()
+    started.wait(5)
+
+    _, png = cv2.imencode('.png', np.zeros((64, 64, 3), dtype=np.uint8))
+    response = app.app.test_client().post('/analyze', data={
+        'scan_type': 'kidney',
+        'file': (io.BytesIO(png.tobytes()), 'scan.png')
+    })
+    release.set()
+    running.join(5)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
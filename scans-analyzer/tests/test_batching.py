@@ -0,0 +1,76 @@
+import threading
+from concurrent.futures import Future
+from queue import Queue
+import pytest
+from batching import BatchedPipeline, PipelineClosed
+from fakes import FakePipe
+
+
+def test_concurrent_calls_are_batched_and_fanned_out():
+    pipe = FakePipe(delay=0.01)
+    batched = BatchedPipeline(pipe, 'chest', window_ms=50, max_batch_size=8)
+    results = {}
+
+    def call(i):
+        results[i] = batched(i)[0]['label']
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == {i: i for i in range(6)}
+    assert max(pipe.calls) > 1
+    batched.close()
+
+
+def test_calls_after_close_raise():
+    batched = BatchedPipeline(FakePipe(), 'chest', window_ms=5)
+    assert batched('a')[0]['label'] == 'a'
+    batched.close()
+    with pytest.raises(PipelineClosed):
+        batched('b')
+    with pytest.raises(PipelineClosed):
+        batched.predict_batch(['c'])
+
+
+def test_close_racing_calls_never_strands_a_caller():
+    # Every call either completes or is refused; none may hang past close()
+    for _ in range(20):
+        batched = BatchedPipeline(FakePipe(), 'chest', window_ms=1, timeout=5)
+        outcomes = []
+
+        def call(i):
+            try:
+                outcomes.append(batched(i)[0]['label'] == i)
+            except PipelineClosed:
+                outcomes.append(True)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        batched.close()
+        for thread in threads:
+            thread.join(5)
+            assert not thread.is_alive()
+        assert outcomes == [True] * 8
+
+
+def test_worker_runs_calls_left_behind_the_sentinel():
+    batched = BatchedPipeline(FakePipe(), 'chest', window_ms=1)
+    queue = Queue()
+    futures = [Future() for _ in range(3)]
+    queue.put(('a', futures[0]))
+    queue.put((None, None))
+    queue.put(('b', futures[1]))
+    queue.put(('c', futures[2]))
+    batched._run(queue)
+    assert [future.result(0)[0][0]['label'] for future in futures] == ['a', 'b', 'c']
+
+
+def test_batched_call_times_out():
+    batched = BatchedPipeline(FakePipe(delay=1.0), 'chest', window_ms=1, timeout=0.1)
+    with pytest.raises(TimeoutError):
+        batched('a')
+    batched.close()
@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+import pytest
+import decoding
+from decoding import decode_flag, decode_image
+
+
+def encoded(extension, width, height):
+    # Smooth content, so the encodes stay small
+    y, x = np.mgrid[0:height, 0:width]
+    gray = ((x + y) * 255 // (width + height)).astype(np.uint8)
+    return cv2.imencode(extension, cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))[1].tobytes()
+
+
+def test_large_jpeg_decodes_at_reduced_size():
+    data = encoded('.jpg', 4000, 3000)
+    # Half size keeps the longest side at or above the 1024px default
+    assert decode_flag(data) == cv2.IMREAD_REDUCED_COLOR_2
+    assert decode_image(data).shape == (1500, 2000, 3)
+
+
+def test_small_jpeg_decodes_at_full_size():
+    data = encoded('.jpg', 1600, 1200)
+    assert decode_flag(data) == cv2.IMREAD_COLOR
+    assert decode_image(data).shape == (1200, 1600, 3)
+
+
+def test_png_decodes_at_full_size():
+    data = encoded('.png', 4000, 3000)
+    assert decode_flag(data) == cv2.IMREAD_COLOR
+    assert decode_image(data).shape == (3000, 4000, 3)
+
+
+def test_shortest_side_stays_above_the_working_size():
+    data = encoded('.jpg', 8000, 1000)
+    assert decode_flag(data) == cv2.IMREAD_REDUCED_COLOR_4
+    assert min(decode_image(data).shape[:2]) >= 224
+
+
+def test_target_side_per_scan_type_and_override(monkeypatch):
+    data = encoded('.jpg', 4000, 3000)
+    monkeypatch.setattr(decoding, 'DECODE_MIN_SIDE_BY_TYPE', {'heart': 600})
+    assert decode_flag(data, 'heart') == cv2.IMREAD_REDUCED_COLOR_4
+    assert decode_flag(data, 'skin') == cv2.IMREAD_REDUCED_COLOR_2
+    # Tiled analysis asks for more pixels; 0 turns reduction off
+    assert decode_flag(data, min_side=4096) == cv2.IMREAD_COLOR
+    assert decode_flag(data, min_side=0) == cv2.IMREAD_COLOR
+
+
+@pytest.mark.parametrize('data', [b'not an image', b'\xff\xd8\xff' + b'\0' * 64])
+def test_undecodable_bytes_decode_to_none(data):
+    assert decode_image(data) is None
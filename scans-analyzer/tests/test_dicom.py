@@ -0,0 +1,97 @@
+import io
+import numpy as np
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import (DeflatedExplicitVRLittleEndian, ExplicitVRBigEndian, ExplicitVRLittleEndian,
+                         ImplicitVRLittleEndian, SecondaryCaptureImageStorage, generate_uid)
+from decoding import decode_image
+
+
+def dicom_bytes(pixels, photometric='MONOCHROME2', transfer_syntax=ExplicitVRLittleEndian, bits=16, **elements):
+    """A DICOM Part 10 file holding pixels, shaped (rows, cols[, 3]) or (frames, rows, cols)"""
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = SecondaryCaptureImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = transfer_syntax
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = SecondaryCaptureImageStorage
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    color = photometric == 'RGB'
+    if not color and pixels.ndim == 3:
+        ds.NumberOfFrames = pixels.shape[0]
+    ds.Rows, ds.Columns = pixels.shape[-3:-1] if color else pixels.shape[-2:]
+    ds.SamplesPerPixel = 3 if color else 1
+    if color:
+        ds.PlanarConfiguration = 0
+    ds.PhotometricInterpretation = photometric
+    ds.BitsAllocated = bits
+    ds.BitsStored = bits
+    ds.HighBit = bits - 1
+    ds.PixelRepresentation = 0
+    for keyword, value in elements.items():
+        setattr(ds, keyword, value)
+    ds.PixelData = pixels.astype(f"{'>' if transfer_syntax == ExplicitVRBigEndian else '<'}u{bits // 8}").tobytes()
+
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+def gradient(rows=64, cols=96, maximum=4095):
+    return np.tile(np.linspace(0, maximum, cols), (rows, 1)).astype(np.uint16)
+
+
+@pytest.mark.parametrize('transfer_syntax', [
+    ImplicitVRLittleEndian, ExplicitVRLittleEndian, ExplicitVRBigEndian, DeflatedExplicitVRLittleEndian
+])
+def test_monochrome2_decodes_in_every_uncompressed_syntax(transfer_syntax):
+    image = decode_image(dicom_bytes(gradient(), transfer_syntax=transfer_syntax))
+    assert image is not None
+    assert image.shape == (64, 96, 3)
+    # Without a VOI window the full range maps to 0..255, dark on the left
+    assert image[:, 0].max() == 0 and image[:, -1].min() == 255
+
+
+def test_monochrome1_is_inverted():
+    image = decode_image(dicom_bytes(gradient(), photometric='MONOCHROME1'))
+    assert image[:, 0].min() == 255 and image[:, -1].max() == 0
+
+
+def test_voi_window_is_applied():
+    image = decode_image(dicom_bytes(gradient(), WindowCenter=1000, WindowWidth=200))
+    values = gradient()[0]
+    assert (image[0, values <= 900, 0] == 0).all()
+    assert (image[0, values >= 1100, 0] == 255).all()
+
+
+@pytest.mark.parametrize('bits', [8, 16])
+def test_rgb_is_scaled_from_its_stored_range(bits):
+    maximum = 2 ** bits - 1
+    rgb = np.zeros((32, 32, 3), dtype=np.uint16)
+    rgb[..., 0] = maximum  # pure red
+    rgb[..., 2] = maximum // 2
+    image = decode_image(dicom_bytes(rgb, photometric='RGB', bits=bits))
+    blue, green, red = image[0, 0]
+    assert red == 255 and green == 0
+    assert abs(int(blue) - 127) <= 1
+
+
+def test_multi_frame_decodes_the_middle_frame():
+    frames = np.stack([np.full((40, 40), value, dtype=np.uint16) for value in (0, 2000, 4000)])
+    frames[:, :, :20] = 0  # a range to window over in every frame
+    image = decode_image(dicom_bytes(frames))
+    assert image.shape == (40, 40, 3)
+    assert image[0, -1, 0] == 255 and image[0, 0, 0] == 0
+    assert decode_image(dicom_bytes(frames[:1]))[0, -1, 0] == 0
+
+
+def test_large_dicom_is_reduced_to_the_max_side():
+    image = decode_image(dicom_bytes(gradient(rows=2048, cols=3072)), min_side=512)
+    assert max(image.shape[:2]) == 512
+
+
+def test_truncated_pixel_data_is_rejected():
+    data = dicom_bytes(gradient())
+    assert decode_image(data[:-1000]) is None
@@ -0,0 +1,114 @@
+import threading
+import cv2
+import numpy as np
+import pytest
+import jobs
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobManager, JobQueueFull
+
+
+class GatedAnalyzer:
+    """Holds every analysis until released, so jobs can be seen queued and running"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Semaphore(0)
+
+    def analyze_scan(self, image, scan_type, validation_mode=None, analysis_mode=None):
+        self.started.release()
+        self.release.wait(5)
+        if scan_type == 'broken':
+            raise RuntimeError("analyzer crashed")
+        return {'scan_type': scan_type, 'status': 'Normal', 'shape': list(image.shape)}
+
+
+def png(size=32):
+    return cv2.imencode('.png', np.zeros((size, size, 3), np.uint8))[1].tobytes()
+
+
+def wait_for(manager, job_id, status):
+    for _ in range(500):
+        job = manager.get(job_id)
+        if job['status'] == status:
+            return job
+        threading.Event().wait(0.01)
+    raise AssertionError(f"job never reached {status}: {manager.get(job_id)}")
+
+
+@pytest.fixture
+def analyzer():
+    analyzer = GatedAnalyzer()
+    yield analyzer
+    analyzer.release.set()
+
+
+def test_job_lifecycle(analyzer):
+    manager = JobManager(analyzer, workers=1)
+    first = manager.submit(png(), 'scan.png', 'kidney')
+    second = manager.submit(png(), 'other.png', 'kidney')
+    assert analyzer.started.acquire(timeout=5)
+
+    assert manager.get(first)['status'] == RUNNING
+    queued = manager.get(second)
+    assert queued['status'] == QUEUED and queued['queue_position'] == 1
+    assert manager.stats()['queued'] == 1 and manager.stats()['running'] == 1
+
+    analyzer.release.set()
+    done = wait_for(manager, first, DONE)
+    assert done['result'] == {'success': True, 'filename': 'scan.png', 'scan_type': 'kidney',
+                              'status': 'Normal', 'shape': [32, 32, 3]}
+    assert done['error'] is None and done['finished_at'] >= done['started_at'] >= done['created_at']
+    wait_for(manager, second, DONE)
+    assert manager.get('unknown') is None
+
+
+def test_failures_are_reported_on_the_job(analyzer):
+    analyzer.release.set()
+    manager = JobManager(analyzer, workers=1)
+    undecodable = manager.submit(b'not an image', 'scan.png', 'kidney')
+    crashed = manager.submit(png(), 'scan.png', 'broken')
+    assert wait_for(manager, undecodable, FAILED)['error'] == 'Invalid image format'
+    job = wait_for(manager, crashed, FAILED)
+    assert job['error'] == "analyzer crashed" and job['result'] is None
+
+
+def test_full_queue_refuses_submissions(analyzer):
+    manager = JobManager(analyzer, workers=1, queue_size=2)
+    running = manager.submit(png(), 'scan.png', 'kidney')
+    assert analyzer.started.acquire(timeout=5)  # one running, no longer queued
+    manager.submit(png(), 'scan.png', 'kidney')
+    manager.submit(png(), 'scan.png', 'kidney')
+    with pytest.raises(JobQueueFull):
+        manager.submit(png(), 'scan.png', 'kidney')
+
+    # Draining the queue makes room again
+    analyzer.release.set()
+    wait_for(manager, running, DONE)
+    for _ in range(500):
+        if manager.stats()['queued'] == 0:
+            break
+        threading.Event().wait(0.01)
+    manager.submit(png(), 'scan.png', 'kidney')
+
+
+def test_finished_jobs_expire_after_their_ttl(analyzer, monkeypatch):
+    analyzer.release.set()
+    manager = JobManager(analyzer, workers=1, ttl=60)
+    job_id = manager.submit(png(), 'scan.png', 'kidney')
+    finished_at = wait_for(manager, job_id, DONE)['finished_at']
+
+    monkeypatch.setattr(jobs.time, 'time', lambda: finished_at + 59)
+    assert manager.get(job_id) is not None
+    monkeypatch.setattr(jobs.time, 'time', lambda: finished_at + 61)
+    assert manager.get(job_id) is None
+    assert manager.stats()['stored'] == 0
+
+
+def test_store_keeps_only_the_newest_finished_jobs(analyzer):
+    analyzer.release.set()
+    manager = JobManager(analyzer, workers=1, store_size=2, ttl=0)
+    job_ids = [manager.submit(png(), 'scan.png', 'kidney') for _ in range(3)]
+    for job_id in job_ids:
+        while manager.get(job_id) is not None and manager.get(job_id)['status'] != DONE:
+            threading.Event().wait(0.01)
+    assert manager.get(job_ids[0]) is None
+    assert manager.get(job_ids[2])['status'] == DONE
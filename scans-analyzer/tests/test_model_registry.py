@@ -0,0 +1,117 @@
+import threading
+import numpy as np
+import pytest
+import backends
+import model_registry
+from app import ScansAnalyzer
+from batching import BatchedPipeline, PipelineClosed
+from fakes import FakePipe
+from model_registry import ModelRegistry
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # Room for one 1 MB model at a time
+    registry = ModelRegistry(specs={'chest': ['fake/chest'], 'skin': ['fake/skin']}, memory_budget_mb=1.5)
+
+    def load(scan_type):
+        return BatchedPipeline(FakePipe(model_bytes=MB), scan_type, window_ms=1), f"fake/{scan_type}"
+
+    monkeypatch.setattr(registry, '_load', load)
+    return registry
+
+
+def test_loads_on_first_use_and_evicts_least_recently_used(registry):
+    assert registry.keys() == []
+    chest = registry['chest']
+    assert chest('a')[0]['label'] == 'a'
+    registry['skin']
+    assert registry.keys() == ['skin']
+    with pytest.raises(PipelineClosed):
+        chest('b')
+
+
+def test_eviction_waits_for_leases(registry):
+    with registry.lease('chest') as chest:
+        registry['skin']
+        assert registry.keys() == ['skin']
+        # Evicted but still held: keeps serving until the lease ends
+        assert chest('a')[0]['label'] == 'a'
+    with pytest.raises(PipelineClosed):
+        chest('b')
+    assert registry._leases == {} and registry._retired == set()
+
+
+def test_explicit_evict_waits_for_leases(registry):
+    with registry.lease('chest') as chest:
+        registry.evict('chest')
+        assert 'chest' not in registry.keys()
+        assert chest('a')[0]['label'] == 'a'
+    with pytest.raises(PipelineClosed):
+        chest('b')
+
+
+def test_concurrent_leases_survive_eviction_pressure(registry):
+    errors = []
+
+    def work(scan_type):
+        for i in range(30):
+            try:
+                with registry.lease(scan_type) as model:
+                    assert model(i)[0]['label'] == i
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(t,)) for t in ('chest', 'skin') * 3]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+        assert not thread.is_alive()
+    assert errors == []
+    assert registry._leases == {}
+
+
+def test_lease_of_unavailable_model_is_none(registry):
+    with registry.lease('xray') as model:
+        assert model is None
+
+
+def failing_first_candidate(model_name, backend):
+    if model_name.startswith('broken/'):
+        raise OSError(f"{model_name} is unavailable")
+    return FakePipe(), 'torch'
+
+
+def test_resolved_id_names_the_candidate_that_loaded(monkeypatch):
+    monkeypatch.setattr(model_registry, 'load_backend', failing_first_candidate)
+    registry = ModelRegistry(specs={'mri': ['broken/first', 'fake/second']}, backend='torch')
+    assert registry.resolved_id('mri') == 'fake/second@torch'
+    assert registry.model_id('mri') == 'fake/second@torch'
+
+
+def test_analyzers_fall_back_to_cv_when_no_model_loads(monkeypatch, capsys):
+    monkeypatch.setattr(model_registry, 'load_backend', failing_first_candidate)
+    analyzer = ScansAnalyzer(model_specs={'chest': ['broken/only']})
+    scan = np.random.default_rng(0).integers(0, 255, (96, 96, 3), dtype=np.uint8)
+    # The analyzer sees a configured model, but its lease comes back empty
+    result = analyzer.analyze_chest(scan)
+    assert result['status'] in ('Normal', 'Abnormal')
+    assert 'model error' not in capsys.readouterr().out
+
+    # Results are then keyed as CV-only, not under the configured checkpoint
+    assert analyzer.models.resolved_id('chest') is None
+    assert analyzer.analyze_scan(scan, 'chest', validation_mode='skip')['status'] == result['status']
+
+
+def test_model_id_reports_the_backend_that_loaded(monkeypatch):
+    # An onnx registry whose export is missing serves, and is keyed, as torch
+    monkeypatch.setattr(backends, 'onnx_model_path', lambda model_name, quantized=False: '/nonexistent/model.onnx')
+    monkeypatch.setattr(backends, 'checked_revision', lambda model_name: None)
+    monkeypatch.setattr(backends.store, 'snapshot', lambda model_name: '/snapshots/fake')
+    monkeypatch.setattr(backends, 'load_snapshot_pipeline', lambda path: FakePipe())
+    registry = ModelRegistry(specs={'skin': ['fake/skin']}, backend='onnx')
+    assert registry.model_id('skin') == 'fake/skin@onnx'
+    assert registry.resolved_id('skin') == 'fake/skin@torch'
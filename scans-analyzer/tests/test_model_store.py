@@ -0,0 +1,37 @@
+import pytest
+import model_store
+from model_store import checked_revision, is_commit_hash
+
+COMMIT = '0123456789abcdef0123456789abcdef01234567'
+
+
+@pytest.fixture
+def manifest(monkeypatch):
+    models = {'org/pinned': {'revision': COMMIT}, 'org/branch': {'revision': 'main'}}
+    monkeypatch.setattr(model_store, 'load_manifest', lambda: models)
+    monkeypatch.setattr(model_store, '_unpinned_warned', set())
+    return models
+
+
+def test_commit_hashes():
+    assert is_commit_hash(COMMIT)
+    assert not is_commit_hash('main')
+    assert not is_commit_hash(COMMIT.upper())
+    assert not is_commit_hash(None)
+
+
+def test_pinned_revision_passes(manifest):
+    assert checked_revision('org/pinned', require_pinned=True) == COMMIT
+
+
+def test_branch_revision_warns_once(manifest, capsys):
+    assert checked_revision('org/branch') == 'main'
+    assert checked_revision('org/branch') == 'main'
+    assert capsys.readouterr().out.count('not pinned to a commit') == 1
+
+
+def test_branch_revision_is_refused_when_pins_are_required(manifest):
+    with pytest.raises(ValueError, match='not pinned'):
+        checked_revision('org/branch', require_pinned=True)
+    with pytest.raises(ValueError):
+        checked_revision('org/unlisted', require_pinned=True)
@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+import pytest
+from app import ScansAnalyzer
+
+
+def scan(seed):
+    noise = np.random.default_rng(seed).integers(0, 255, (512, 512, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (31, 31), 0)
+
+
+def reencoded(image, quality=70):
+    return cv2.imdecode(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1], cv2.IMREAD_COLOR)
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    analyzer = ScansAnalyzer(model_specs={})
+    monkeypatch.setattr(analyzer.ocr, 'image_to_string', lambda gray: 'kidney')
+    return analyzer
+
+
+def test_near_duplicate_hit_is_marked_with_its_source(analyzer):
+    original = analyzer.analyze_scan(scan(0), 'kidney', validation_mode='serial', near_duplicates=True)
+    copy = analyzer.analyze_scan(reencoded(scan(0)), 'kidney', validation_mode='serial', near_duplicates=True)
+    assert 'near_duplicate' not in original
+    assert 'scan_id' not in copy
+    assert copy['near_duplicate']['matched'] is True
+    assert copy['near_duplicate']['source_scan_id'] == original['scan_id']
+    assert copy['near_duplicate']['distance_bits'] <= copy['near_duplicate']['threshold_bits']
+
+
+def test_distinct_scans_are_analyzed(analyzer):
+    analyzer.analyze_scan(scan(0), 'kidney', validation_mode='serial', near_duplicates=True)
+    other = analyzer.analyze_scan(scan(1), 'kidney', validation_mode='serial', near_duplicates=True)
+    assert 'near_duplicate' not in other
+    assert other['scan_id']
+
+
+def test_near_duplicates_are_off_unless_requested(analyzer):
+    analyzer.analyze_scan(scan(0), 'kidney', validation_mode='serial')
+    copy = analyzer.analyze_scan(reencoded(scan(0)), 'kidney', validation_mode='serial')
+    assert 'near_duplicate' not in copy
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import ocr
+from fakes import FakeTessAPI, FakeTesseract
+from ocr import OCREngine
+
+
+class FakeTesserocr:
+    """Module-shaped stand-in for tesserocr whose API handles are FakeTessAPI instances"""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.apis = []
+
+    def PyTessBaseAPI(self, lang):
+        api = FakeTessAPI(lang, **self.kwargs)
+        self.apis.append(api)
+        return api
+
+
+def page(height=3000, width=2000):
+    return np.full((height, width), 255, dtype=np.uint8)
+
+
+def use_engines(monkeypatch, tesserocr=None, tesseract_delay=0.0):
+    tesseract = FakeTesseract(delay=tesseract_delay)
+    monkeypatch.setattr(ocr, 'tesserocr', tesserocr)
+    monkeypatch.setattr(ocr.pytesseract, 'image_to_string', tesseract.image_to_string)
+    return tesseract
+
+
+def test_tesserocr_path_gets_the_downscaled_image(monkeypatch):
+    fake = FakeTesserocr()
+    tesseract = use_engines(monkeypatch, fake)
+    engine = OCREngine(workers=1, max_side=1024, timeout=5)
+
+    assert engine.image_to_string(page()) == 'FAKE TEXT'
+    assert engine.image_to_string(page(800, 600)) == 'FAKE TEXT'
+    # One long-lived handle per worker thread; PIL sizes are (width, height)
+    assert len(fake.apis) == 1
+    assert fake.apis[0].sizes == [(682, 1024), (600, 800)]
+    assert tesseract.calls == []
+
+
+def test_pytesseract_fallback_gets_the_downscaled_image_and_timeout(monkeypatch):
+    tesseract = use_engines(monkeypatch, tesserocr=None)
+    engine = OCREngine(workers=1, max_side=1024, timeout=5)
+
+    assert engine.image_to_string(page(2000, 4000)) == 'FAKE TEXT'
+    assert tesseract.calls == [((512, 1024), 5)]
+
+
+def test_tesserocr_init_failure_falls_back_to_pytesseract(monkeypatch):
+    tesseract = use_engines(monkeypatch, FakeTesserocr(fail=True))
+    engine = OCREngine(workers=1, max_side=1024, timeout=5)
+
+    assert engine.image_to_string(page()) == 'FAKE TEXT'
+    assert engine.image_to_string(page()) == 'FAKE TEXT'
+    assert tesseract.calls == [((1024, 682), 5)] * 2
+
+
+def test_full_resolution_when_downscaling_is_off(monkeypatch):
+    fake = FakeTesserocr()
+    use_engines(monkeypatch, fake)
+    engine = OCREngine(workers=1, max_side=0, timeout=5)
+
+    engine.image_to_string(page())
+    assert fake.apis[0].sizes == [(2000, 3000)]
+
+
+@pytest.mark.parametrize('tesserocr', [FakeTesserocr(delay=0.5), None], ids=['tesserocr', 'pytesseract'])
+def test_slow_ocr_times_out(monkeypatch, tesserocr):
+    use_engines(monkeypatch, tesserocr, tesseract_delay=0.5)
+    engine = OCREngine(workers=1, max_side=1024, timeout=0.05)
+
+    with pytest.raises(TimeoutError, match='timed out after 0.05s'):
+        engine.image_to_string(page())
@@ -0,0 +1,105 @@
+import io
+import struct
+import cv2
+import numpy as np
+import pytest
+import app
+from sniffing import SNIFF_BYTES, UploadRejected, check_upload, read_upload
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(app.app.config, 'MAX_CONTENT_LENGTH', 1024 * 1024)
+    monkeypatch.setattr(app, 'MAX_REQUEST_BYTES', 4 * 1024 * 1024)
+    return app.app.test_client()
+
+
+def upload(size):
+    return io.BytesIO(b'\0' * size), 'scan.png'
+
+
+@pytest.mark.parametrize('path', ['/analyze', '/jobs'])
+def test_single_upload_routes_refuse_bodies_over_one_upload(client, path):
+    response = client.post(path, data={'scan_type': 'kidney', 'file': upload(2 * 1024 * 1024)})
+    assert response.status_code == 413
+    assert response.get_json()['error'] == "Request exceeds 1 MB"
+
+
+def test_batch_route_keeps_the_large_limit(client):
+    response = client.post('/analyze-batch', data={'scan_type': 'kidney', 'files': upload(5 * 1024 * 1024)})
+    assert response.status_code == 413
+    assert response.get_json()['error'] == "Request exceeds 4 MB"
+
+
+def encoded(extension, width=40, height=30, channels=3):
+    image = np.random.default_rng(0).integers(0, 255, (height, width, channels), dtype=np.uint8)
+    return cv2.imencode(extension, image)[1].tobytes()
+
+
+def png_header(width, height, bit_depth=8, color_type=2):
+    ihdr = struct.pack('>IIBBBBB', width, height, bit_depth, color_type, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + ihdr + b'\0' * 4
+
+
+@pytest.mark.parametrize('extension, image_format', [
+    ('.png', 'png'), ('.jpg', 'jpeg'), ('.bmp', 'bmp'), ('.tiff', 'tiff'), ('.webp', 'webp')
+])
+def test_headers_are_read_without_decoding(extension, image_format):
+    header = check_upload(encoded(extension))
+    assert header.format == image_format
+    assert (header.width, header.height) == (40, 30)
+
+
+def test_gif_header():
+    gif = b'GIF89a' + struct.pack('<HHBBB', 40, 30, 0xF7, 0, 0) + b'\0' * 8 + b';'
+    header = check_upload(gif)
+    assert (header.format, header.width, header.height, header.bit_depth) == ('gif', 40, 30, 8)
+
+
+@pytest.mark.parametrize('extension', ['.png', '.jpg'])
+def test_truncated_uploads_are_rejected(extension):
+    data = encoded(extension, 200, 200)
+    with pytest.raises(UploadRejected, match='Truncated'):
+        check_upload(data[:len(data) // 2])
+
+
+def test_declared_dimensions_over_the_pixel_limit_are_refused():
+    with pytest.raises(UploadRejected) as rejected:
+        check_upload(png_header(100000, 100000) + b'IEND')
+    assert rejected.value.status == 413
+    assert 'pixel limit' in str(rejected.value)
+
+
+@pytest.mark.parametrize('data, message', [
+    (png_header(0, 30) + b'IEND', 'invalid dimensions'),
+    (png_header(40, 30, bit_depth=7) + b'IEND', 'bit depth'),
+    (png_header(40, 30, color_type=5) + b'IEND', 'color type'),
+    (b'\xff\xd8\xff\xd9', 'no frame header'),
+    (b'', 'Empty upload')
+])
+def test_malformed_headers_are_rejected(data, message):
+    with pytest.raises(UploadRejected, match=message):
+        check_upload(data)
+
+
+def test_unknown_formats_are_unsupported():
+    with pytest.raises(UploadRejected) as rejected:
+        check_upload(b'%PDF-1.7' + b'\0' * 200)
+    assert rejected.value.status == 415
+
+
+def test_bombs_are_refused_before_the_body_is_read():
+    stream = io.BytesIO(png_header(100000, 100000) + b'\0' * (8 * 1024 * 1024))
+    with pytest.raises(UploadRejected):
+        read_upload(stream)
+    assert stream.tell() == SNIFF_BYTES
+
+
+def test_a_smaller_limit_applies_to_every_check():
+    data = encoded('.png', 60, 60)  # one sniffed chunk
+    assert read_upload(io.BytesIO(data))[1].format == 'png'
+    for reject in (lambda: read_upload(io.BytesIO(data), max_bytes=1024),
+                   lambda: check_upload(data, max_bytes=1024)):
+        with pytest.raises(UploadRejected) as rejected:
+            reject()
+        assert rejected.value.status == 413
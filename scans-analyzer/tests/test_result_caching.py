@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from app import ScansAnalyzer
+
+
+@pytest.fixture
+def analyzer():
+    # CV-only scan types need no models
+    return ScansAnalyzer(model_specs={})
+
+
+@pytest.fixture
+def scan():
+    return np.random.default_rng(0).integers(0, 255, (96, 96, 3), dtype=np.uint8)
+
+
+def test_validated_results_are_cached(analyzer, scan, monkeypatch):
+    monkeypatch.setattr(analyzer.ocr, 'image_to_string', lambda gray: 'renal ultrasound')
+    first = analyzer.analyze_scan(scan, 'kidney', validation_mode='serial')
+    second = analyzer.analyze_scan(scan, 'kidney', validation_mode='serial')
+    assert first['image_validated'] is True
+    assert second['scan_id'] == first['scan_id']
+    assert analyzer.result_cache.stats()['hits'] == 1
+
+
+def test_validation_warnings_are_not_cached(analyzer, scan, monkeypatch):
+    def timeout(gray):
+        raise TimeoutError("OCR timed out after 5s")
+
+    monkeypatch.setattr(analyzer.ocr, 'image_to_string', timeout)
+    first = analyzer.analyze_scan(scan, 'kidney', validation_mode='serial')
+    assert first['validation_message'].startswith("Validation warning")
+    second = analyzer.analyze_scan(scan, 'kidney', validation_mode='serial')
+    assert second['scan_id'] != first['scan_id']
+    assert analyzer.result_cache.stats()['hits'] == 0
+
+    # Once OCR recovers the result is validated and cached as usual
+    monkeypatch.setattr(analyzer.ocr, 'image_to_string', lambda gray: 'kidney')
+    third = analyzer.analyze_scan(scan, 'kidney', validation_mode='serial')
+    assert third['image_validated'] is True
+    assert analyzer.analyze_scan(scan, 'kidney', validation_mode='serial')['scan_id'] == third['scan_id']
+
+
+def test_skipped_validation_is_not_cached(analyzer, scan):
+    first = analyzer.analyze_scan(scan, 'kidney', validation_mode='skip')
+    assert first['image_validated'] is None
+    assert analyzer.analyze_scan(scan, 'kidney', validation_mode='skip')['scan_id'] != first['scan_id']
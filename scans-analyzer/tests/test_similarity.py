@@ -0,0 +1,93 @@
+import threading
+import numpy as np
+import pytest
+import similarity
+from similarity import EMBEDDING_DIM, SimilarityIndex, VectorIndex, new_scan_id, normalize
+
+
+def vectors(count, seed=0):
+    return normalize(np.random.default_rng(seed).standard_normal((count, EMBEDDING_DIM), dtype=np.float32))
+
+
+def test_disabled_without_a_directory():
+    index = SimilarityIndex('')
+    assert not index.enabled
+    index.add('chest', 'cv', new_scan_id(), vectors(1)[0])
+    assert index.similar('chest', new_scan_id()) is None
+    assert index.stats() == {'enabled': False}
+
+
+def test_writes_off_the_calling_thread_and_finds_neighbours(tmp_path):
+    index = SimilarityIndex(str(tmp_path))
+    ids = [new_scan_id() for _ in range(20)]
+    rows = vectors(20)
+    for scan_id, row in zip(ids, rows):
+        index.add('chest', 'cv', scan_id, row)
+    index.flush()
+
+    # A slightly perturbed copy of scan 3 should be its nearest neighbour
+    copy_id = new_scan_id()
+    index.add('chest', 'cv', copy_id, normalize(rows[3] + 0.01 * vectors(1, seed=1)[0]))
+    index.flush()
+    embedder, matches = index.similar('chest', copy_id, k=3)
+    assert embedder == 'cv'
+    assert matches[0][0] == ids[3]
+    assert copy_id not in [match for match, _ in matches]
+    assert index.stats()['indexes']['chest/cv']['scans'] == 21
+
+
+def test_full_queue_skips_scans_instead_of_blocking(tmp_path, monkeypatch, capsys):
+    writing, release = threading.Event(), threading.Event()
+
+    def slow_add(self, scan_id, vector):
+        writing.set()
+        release.wait()
+
+    monkeypatch.setattr(VectorIndex, 'add', slow_add)
+    index = SimilarityIndex(str(tmp_path), queue_size=1)
+    index.add('chest', 'cv', new_scan_id(), vectors(1)[0])
+    writing.wait(5)
+    index.add('chest', 'cv', new_scan_id(), vectors(1)[0])
+    index.add('chest', 'cv', new_scan_id(), vectors(1)[0])  # returns at once
+    assert index.stats()['queued'] == 1
+    assert 'not indexed' in capsys.readouterr().out
+    release.set()
+    index.flush()
+
+
+def test_oldest_scans_are_dropped_at_the_cap(tmp_path):
+    index = VectorIndex(str(tmp_path), max_scans=8)
+    ids = [new_scan_id() for _ in range(9)]
+    for scan_id, row in zip(ids, vectors(9)):
+        index.add(scan_id, row)
+    # At 8 scans the oldest quarter goes before the ninth is written
+    assert len(index) == 7
+    assert index.vector_of(ids[0]) is None and index.vector_of(ids[1]) is None
+    assert index.vector_of(ids[2]) is not None
+    assert np.allclose(index.vector_of(ids[8]), vectors(9)[8], atol=1e-3)
+
+
+def test_other_processes_see_the_compacted_files(tmp_path):
+    writer, reader = VectorIndex(str(tmp_path), max_scans=4), VectorIndex(str(tmp_path), max_scans=4)
+    ids = [new_scan_id() for _ in range(5)]
+    rows = vectors(5)
+    for scan_id, row in zip(ids[:4], rows[:4]):
+        writer.add(scan_id, row)
+    assert len(reader) == 4
+    writer.add(ids[4], rows[4])
+    assert len(reader) == 4
+    assert [match for match, _ in reader.search(rows[4], k=4)][0] == ids[4]
+    assert reader.vector_of(ids[0]) is None
+
+
+@pytest.mark.parametrize('posix', [True, False])
+def test_locks_without_fcntl(tmp_path, monkeypatch, posix):
+    if not posix:
+        monkeypatch.setattr(similarity, 'fcntl', None)
+    path = str(tmp_path / '.lock')
+    with similarity.file_lock(path) as locked:
+        assert locked
+    index = VectorIndex(str(tmp_path))
+    scan_id = new_scan_id()
+    index.add(scan_id, vectors(1)[0])
+    assert index.search(vectors(1)[0], k=1)[0][0] == scan_id
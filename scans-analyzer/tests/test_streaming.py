@@ -0,0 +1,71 @@
+import io
+import json
+import cv2
+import numpy as np
+import pytest
+import app
+from batching import BatchedPipeline
+from fakes import FakePipe
+
+
+@pytest.fixture
+def client(monkeypatch):
+    models = app.analyzer.models
+    monkeypatch.setattr(models, '_failed', set())
+    monkeypatch.setattr(models, '_load', lambda scan_type: (
+        BatchedPipeline(FakePipe(label='PNEUMONIA'), scan_type, window_ms=0), f"fake/{scan_type}"
+    ))
+    yield app.app.test_client()
+    models.evict('chest')
+
+
+def upload():
+    gray = cv2.GaussianBlur(np.random.default_rng(0).integers(0, 255, (256, 256), dtype=np.uint8), (15, 15), 0)
+    return io.BytesIO(cv2.imencode('.png', gray)[1].tobytes()), 'chest.png'
+
+
+def analyze(client, stream=None):
+    query = f"?stream={stream}" if stream else ''
+    return client.post(f"/analyze{query}", data={'scan_type': 'chest', 'validation': 'skip', 'file': upload()})
+
+
+def ndjson_events(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+def comparable(result):
+    # Every analysis gets a fresh scan_id
+    return {key: value for key, value in result.items() if key != 'scan_id'}
+
+
+def test_heuristics_arrive_before_the_model_result(client):
+    events = ndjson_events(analyze(client, 'ndjson'))
+    assert [event['event'] for event in events] == ['start', 'heuristics', 'result']
+    heuristics, final = events[1], events[2]['result']
+    assert heuristics['ai_pending'] is True
+    assert 'Pneumonia' not in heuristics['result']['confidence_scores']
+    assert final['confidence_scores']['Pneumonia'] == 1.0
+
+
+def test_streamed_result_equals_the_plain_response(client):
+    plain = analyze(client).get_json()
+    streamed = ndjson_events(analyze(client, 'ndjson'))[-1]['result']
+    assert comparable(streamed) == comparable(plain)
+
+
+def test_sse_carries_the_same_events(client):
+    response = analyze(client, 'sse')
+    assert response.mimetype == 'text/event-stream'
+    names = [line[len('event: '):] for line in response.get_data(as_text=True).splitlines() if line.startswith('event: ')]
+    assert names == ['start', 'heuristics', 'result']
+
+
+def test_error_mid_stream_ends_with_an_error_event(client, monkeypatch):
+    def fail(scan_type):
+        raise RuntimeError("inference backend crashed")
+
+    # Raised after the heuristics event has been sent
+    monkeypatch.setattr(app.analyzer.models, 'take_embedding', fail)
+    events = ndjson_events(analyze(client, 'ndjson'))
+    assert [event['event'] for event in events] == ['start', 'heuristics', 'error']
+    assert events[-1]['error'] == "inference backend crashed"
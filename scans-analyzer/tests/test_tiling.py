@@ -0,0 +1,78 @@
+import functools
+import cv2
+import numpy as np
+import pytest
+import app
+from app import ScansAnalyzer
+from batching import BatchedPipeline
+from fakes import FakePipe
+from scan_context import ScanContext
+from tiling import analyze_tiled
+
+
+def xray(size=1200, objects=()):
+    gray = np.full((size, size), 40, np.uint8) + np.random.default_rng(0).integers(0, 20, (size, size), dtype=np.uint8)
+    for x, y in objects:
+        gray[y:y + 40, x:x + 40] = 255
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def standard_result():
+    return {'status': 'Normal', 'detected_conditions': ['No abnormalities'], 'confidence_scores': {}}
+
+
+def foreign_objects(result):
+    return [region for region in result['tiling']['regions'] if region['finding'] == 'Foreign Object']
+
+
+@pytest.fixture
+def analyzer():
+    return ScansAnalyzer(model_specs={})
+
+
+def test_large_scans_take_the_tiled_path(analyzer):
+    result = analyzer.analyze_scan(xray(), 'xray', validation_mode='skip', analysis_mode='tiled')
+    assert result['tiling']['applied'] is True
+    assert result['tiling']['tiles'] == 9
+    assert result['tiling']['complete'] is True
+
+    small = analyzer.analyze_scan(xray(400), 'xray', validation_mode='skip', analysis_mode='tiled')
+    assert small['tiling']['applied'] is False
+    assert 'tiling' not in analyzer.analyze_scan(xray(), 'xray', validation_mode='skip')
+
+
+def test_a_finding_in_the_overlap_of_two_tiles_is_merged_into_one(analyzer):
+    # Tiles start every 448px and span 512px, so x 465-505 is in both of the first two
+    result = analyze_tiled(ScanContext(xray(objects=[(465, 100)]), 'xray'), standard_result())
+    objects = foreign_objects(result)
+    assert len(objects) == 1
+    assert objects[0]['tiles'] == 2
+    x0, y0, x1, y1 = objects[0]['box']
+    # Within a pixel or two of the object, after scaling to tiles and back
+    assert abs(x0 - 465) <= 2 and abs(x1 - 505) <= 2 and abs(y0 - 100) <= 2 and abs(y1 - 140) <= 2
+    assert "foreign object or metal implant detected in 1 high-resolution region(s)" in result['detected_conditions'][0]
+    assert result['confidence_scores']['Foreign Object (tiled)'] == 0.85
+
+
+def test_separate_findings_stay_separate(analyzer):
+    result = analyze_tiled(ScanContext(xray(objects=[(100, 100), (1000, 1000)]), 'xray'), standard_result())
+    assert len(foreign_objects(result)) == 2
+
+
+def test_budget_cut_off_returns_a_partial_result():
+    model = BatchedPipeline(FakePipe(delay=0.05, label='NORMAL'), 'chest', window_ms=0)
+    result = analyze_tiled(ScanContext(xray(), 'chest'), standard_result(), model, budget_ms=60, batch_size=1)
+    tiling = result['tiling']
+    assert tiling['applied'] is True
+    assert tiling['complete'] is False
+    assert 0 < tiling['tiles_analyzed'] < tiling['tiles']
+
+
+def test_partial_tiled_results_are_not_cached(analyzer, monkeypatch):
+    monkeypatch.setattr(analyzer.ocr, 'image_to_string', lambda gray: 'xray radiograph')
+    # A budget that has run out before the first tile
+    monkeypatch.setattr(app, 'analyze_tiled', functools.partial(analyze_tiled, budget_ms=-1))
+    first = analyzer.analyze_scan(xray(), 'xray', validation_mode='serial', analysis_mode='tiled')
+    assert first['tiling']['complete'] is False
+    second = analyzer.analyze_scan(xray(), 'xray', validation_mode='serial', analysis_mode='tiled')
+    assert second['scan_id'] != first['scan_id']
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from scan_context import ScanContext
+from vectorized import attach_features, batch_features
+
+# The per-image statistics the analyzers computed before vectorization
+
+
+def reference_mri(processed):
+    height, width = processed.shape
+    left_half = processed[:, :width//2]
+    right_half = np.fliplr(processed[:, width//2:])
+    threshold = np.mean(processed) + 2 * np.std(processed)
+    return {
+        'symmetry_diff': np.mean(np.abs(left_half - right_half)),
+        'abnormal_pixels': len(np.where(processed > threshold)[0]),
+        'center_mean': np.mean(processed[height//3:2*height//3, width//3:2*width//3])
+    }
+
+
+def reference_chest(processed):
+    height, width = processed.shape
+    heart_region = processed[height//3:2*height//3, 2*width//5:3*width//5]
+    threshold = np.mean(processed) + 2 * np.std(processed)
+    return {
+        'left_opacity': np.mean(processed[height//4:3*height//4, width//8:width//2-width//8]),
+        'right_opacity': np.mean(processed[height//4:3*height//4, width//2+width//8:7*width//8]),
+        'consolidation_pixels': len(np.where(processed > threshold)[0]),
+        'heart_width': np.sum(np.max(heart_region, axis=0) > 0.6),
+        'lower_chest_mean': np.mean(processed[2*height//3:, :]),
+        'air_pixels': len(np.where(processed < 0.1)[0])
+    }
+
+
+def reference_kidney(processed):
+    return {'kidney_area': np.sum(processed > 0.3)}
+
+
+def reference_heart(processed):
+    heart_region = processed[80:144, 80:144]
+    return {
+        'heart_area': np.sum(heart_region > 0.4),
+        'wall_thickness': np.mean(heart_region[20:44, 20:44])
+    }
+
+
+def reference_liver(processed):
+    return {'density': np.mean(processed), 'texture_variance': np.var(processed)}
+
+
+REFERENCES = {
+    'mri': reference_mri,
+    'chest': reference_chest,
+    'kidney': reference_kidney,
+    'heart': reference_heart,
+    'liver': reference_liver
+}
+
+
+def scans(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 255, (300, 260, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def assert_same_features(actual, expected):
+    assert actual.keys() == expected.keys()
+    for name, value in expected.items():
+        np.testing.assert_allclose(actual[name], value, rtol=1e-6, err_msg=name)
+
+
+@pytest.mark.parametrize('scan_type', sorted(REFERENCES))
+def test_features_match_per_image_reference(scan_type):
+    contexts = [ScanContext(image, scan_type) for image in scans(4)]
+    stack = np.stack([context.processed for context in contexts])
+    for context, features in zip(contexts, batch_features(scan_type, stack)):
+        assert_same_features(features, REFERENCES[scan_type](context.processed))
+
+
+@pytest.mark.parametrize('scan_type', sorted(REFERENCES))
+def test_batched_features_equal_single_scan_features(scan_type):
+    images = scans(5, seed=1)
+    batched = [ScanContext(image, scan_type) for image in images]
+    attach_features(batched)
+    for image, context in zip(images, batched):
+        single = ScanContext(image, scan_type).features
+        for name, value in single.items():
+            assert context.features[name] == value, name
+
+
+def test_types_without_heuristics_have_no_features():
+    assert batch_features('skin', np.zeros((2, 224, 224), dtype=np.float32)) == [None, None]
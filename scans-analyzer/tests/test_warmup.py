@@ -0,0 +1,45 @@
+from app import ScansAnalyzer
+from batching import BatchedPipeline
+from fakes import FakePipe
+from warmup import WarmUp
+
+
+def fake_analyzer(monkeypatch, **kwargs):
+    analyzer = ScansAnalyzer(model_specs={'chest': ['fake/chest'], 'skin': ['fake/skin'], 'mri': ['fake/mri']},
+                             **kwargs)
+    monkeypatch.setattr(analyzer.models, '_load', lambda scan_type: (
+        BatchedPipeline(FakePipe(model_bytes=1024 * 1024), scan_type, window_ms=0), f"fake/{scan_type}"
+    ))
+    return analyzer
+
+
+def test_warmup_keeps_lazy_models_lazy_by_default(monkeypatch):
+    analyzer = fake_analyzer(monkeypatch)
+    warmup = WarmUp(analyzer)
+    warmup.start('sync')
+    assert warmup.status == 'done'
+    assert analyzer.models.keys() == []
+    assert warmup.report()['models'] == {}
+
+
+def test_warmup_warms_loaded_and_preloaded_models(monkeypatch):
+    analyzer = fake_analyzer(monkeypatch)
+    analyzer.models['skin']
+    warmup = WarmUp(analyzer, preload_models=['chest'])
+    assert not warmup.ready
+    warmup.start('sync')
+    assert warmup.ready and warmup.status == 'done'
+    assert sorted(analyzer.models.keys()) == ['chest', 'skin']
+    assert sorted(warmup.report()['models']) == ['chest', 'skin']
+
+
+def test_extra_models_are_opt_in_and_never_evict_hot_ones(monkeypatch):
+    analyzer = fake_analyzer(monkeypatch)
+    analyzer.models.memory_budget = 2.5 * 1024 * 1024  # room for two 1 MB models
+    analyzer.models['chest']
+    analyzer.models['skin']
+    warmup = WarmUp(analyzer, extra_models='mri')
+    warmup.start('sync')
+    assert warmup.status == 'done'
+    assert 'mri' in warmup.report()['models']
+    assert sorted(analyzer.models.keys()) == ['chest', 'skin']
@@ -0,0 +1,248 @@
+import os
+import time
+import cv2
+import numpy as np
+from PIL import Image
+from numpy.lib.stride_tricks import sliding_window_view
+from scan_context import WORKING_SIZE
+
+# Tiled high-resolution mode (analysis mode "tiled", xray and chest only):
+#   SCANS_TILE_SIZE             - tile side in original pixels; each tile is analyzed at 224x224
+#   SCANS_TILE_OVERLAP          - overlap between neighbouring tiles in original pixels
+#   SCANS_TILE_BUDGET_MS        - time allowed for per-tile line detection and inference
+#   SCANS_TILE_BATCH_SIZE       - tiles per model forward pass
+#   SCANS_TILE_DECODE_MIN_SIDE  - longest side worth decoding for tiled uploads (0 = full size)
+TILE_SIZE = int(os.environ.get('SCANS_TILE_SIZE', 512))
+TILE_OVERLAP = int(os.environ.get('SCANS_TILE_OVERLAP', 64))
+TILE_BUDGET_MS = float(os.environ.get('SCANS_TILE_BUDGET_MS', 2000))
+TILE_BATCH_SIZE = int(os.environ.get('SCANS_TILE_BATCH_SIZE', 8))
+TILE_DECODE_MIN_SIDE = int(os.environ.get('SCANS_TILE_DECODE_MIN_SIDE', 4096))
+
+TILED_SCAN_TYPES = ('xray', 'chest')
+ANALYSIS_MODES = ('standard', 'tiled')
+
+
+class TileSet:
+    """Overlapping tiles of a scan, each resampled to the working size.
+
+    The CLAHE-enhanced image is resized once so that a tile maps to exactly
+    224x224, then every tile is a window of that image, giving an (N, 224, 224)
+    stack the existing heuristics' thresholds apply to unchanged.
+    """
+
+    def __init__(self, gray, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+        window = WORKING_SIZE[0]
+        self.scale = window / tile_size
+        self.tile_size = tile_size
+
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        height, width = gray.shape
+        scaled_size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+        scaled = cv2.resize(clahe.apply(gray), scaled_size, interpolation=cv2.INTER_AREA)
+
+        # Very elongated scans can be thinner than one tile; mirror them out to a full tile
+        pad_y, pad_x = max(0, window - scaled.shape[0]), max(0, window - scaled.shape[1])
+        if pad_y or pad_x:
+            scaled = cv2.copyMakeBorder(scaled, 0, pad_y, 0, pad_x, cv2.BORDER_REFLECT)
+        self.scaled_u8 = scaled
+
+        stride = max(1, window - round(overlap * self.scale))
+        ys = _starts(scaled.shape[0], window, stride)
+        xs = _starts(scaled.shape[1], window, stride)
+        self.origins = np.array([(y, x) for y in ys for x in xs])
+        self.tiles_u8 = sliding_window_view(scaled, (window, window))[self.origins[:, 0], self.origins[:, 1]]
+        self.tiles = self.tiles_u8 / 255.0
+
+    def __len__(self):
+        return len(self.origins)
+
+    def box(self, index, within=None):
+        """Bounds [x0, y0, x1, y1] in original image pixels of a tile, or of a (x0, y0, x1, y1) area within it"""
+        y, x = self.origins[index]
+        x0, y0, x1, y1 = within if within is not None else (0, 0, WORKING_SIZE[1], WORKING_SIZE[0])
+        return [int((x + x0) / self.scale), int((y + y0) / self.scale),
+                int((x + x1) / self.scale), int((y + y1) / self.scale)]
+
+    def mask_box(self, index, mask):
+        """Bounds in original image pixels of the set pixels of a tile-sized mask"""
+        ys, xs = np.nonzero(mask)
+        return self.box(index, (xs.min(), ys.min(), xs.max() + 1, ys.max() + 1))
+
+    def priority(self):
+        """Tile indices, most structured (highest contrast) first"""
+        return np.argsort(-self.tiles.std(axis=(1, 2)), kind='stable')
+
+    def pil(self, index):
+        return Image.fromarray(self.tiles_u8[index]).convert('RGB')
+
+
+def _starts(length, window, stride):
+    if length <= window:
+        return [0]
+    return list(range(0, length - window, stride)) + [length - window]
+
+
+def tiling_applies(image, tile_size=TILE_SIZE):
+    return max(image.shape[:2]) > tile_size
+
+
+def analyze_tiled(context, result, model=None, budget_ms=TILE_BUDGET_MS,
+                  tile_size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=TILE_BATCH_SIZE):
+    """Refine a standard xray/chest result with findings from high-resolution tiles.
+
+    Intensity heuristics run over the whole tile stack at once. Line
+    detection and model inference then visit tiles most-structured first
+    until the time budget runs out, so a slow scan returns a partial
+    refinement rather than a late one. Adds a "tiling" section to result.
+
+    Neighbouring tiles overlap, so one finding in the shared band is seen
+    by both; regions of the same kind whose boxes intersect are merged.
+    """
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000
+
+    if not tiling_applies(context.image, tile_size):
+        result['tiling'] = {'applied': False, 'reason': f"Scan is not larger than one {tile_size}px tile"}
+        return result
+
+    tiles = TileSet(context.gray, tile_size, overlap)
+    order = tiles.priority()
+    if context.scan_type == 'xray':
+        regions, analyzed = _xray_regions(tiles, order, deadline)
+    else:
+        regions, analyzed = _chest_regions(context, tiles, order, model, deadline, batch_size)
+
+    regions = _merge_overlapping(regions)
+    _merge(result, context.scan_type, regions)
+    result['tiling'] = {
+        'applied': True,
+        'tile_size': tile_size,
+        'overlap': overlap,
+        'tiles': len(tiles),
+        'tiles_analyzed': analyzed,
+        'complete': analyzed == len(tiles),
+        'budget_ms': budget_ms,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+        'regions': regions
+    }
+    return result
+
+
+def _xray_regions(tiles, order, deadline):
+    regions = []
+
+    # Foreign objects: very bright spots, counted per tile in one pass
+    bright = (tiles.tiles > 0.95).sum(axis=(1, 2))
+    for i in np.flatnonzero(bright > 10):
+        regions.append({'finding': 'Foreign Object', 'box': tiles.mask_box(i, tiles.tiles[i] > 0.95), 'score': 0.85})
+
+    # Fracture lines: edge maps built once for the whole scaled image, Hough per tile
+    blurred = cv2.GaussianBlur(tiles.scaled_u8, (5, 5), 0)
+    edges_canny = cv2.Canny(blurred, 50, 150)
+    edges_sobel = np.uint8(np.absolute(cv2.Sobel(blurred, cv2.CV_64F, 1, 1, ksize=3)))
+    combined_edges = cv2.bitwise_or(edges_canny, edges_sobel)
+    size = WORKING_SIZE[0]
+
+    analyzed = 0
+    for i in order:
+        if time.perf_counter() > deadline:
+            break
+        y, x = tiles.origins[i]
+        tile_edges = np.ascontiguousarray(combined_edges[y:y + size, x:x + size])
+        lines = cv2.HoughLinesP(tile_edges, 1, np.pi/180, threshold=50, minLineLength=30, maxLineGap=10)
+        if lines is not None and len(lines) > 5:
+            ends = lines.reshape(-1, 4)
+            within = (ends[:, [0, 2]].min(), ends[:, [1, 3]].min(), ends[:, [0, 2]].max() + 1, ends[:, [1, 3]].max() + 1)
+            regions.append({'finding': 'Fracture Lines', 'box': tiles.box(i, within), 'score': min(0.95, len(lines) * 0.1)})
+        analyzed += 1
+    return regions, analyzed
+
+
+def _chest_regions(context, tiles, order, model, deadline, batch_size):
+    regions = []
+
+    # Consolidation is judged against the whole scan's statistics, as in the standard analysis
+    dense = tiles.tiles > context.mean + 2 * context.std
+    for i in np.flatnonzero(dense.sum(axis=(1, 2)) > 200):
+        regions.append({'finding': 'Consolidation', 'box': tiles.mask_box(i, dense[i]), 'score': 0.82})
+
+    air = tiles.tiles < 0.1
+    for i in np.flatnonzero(air.sum(axis=(1, 2)) > 500):
+        regions.append({'finding': 'Pneumothorax', 'box': tiles.mask_box(i, air[i]), 'score': 0.69})
+
+    if model is None:
+        return regions, len(tiles)
+
+    analyzed = 0
+    for start in range(0, len(order), max(1, batch_size)):
+        if time.perf_counter() > deadline:
+            break
+        batch = order[start:start + batch_size]
+        predictions = model.predict_batch([tiles.pil(i) for i in batch])
+        for i, preds in zip(batch, predictions):
+            for pred in preds:
+                if pred['score'] > 0.5 and 'pneumonia' in pred['label'].lower():
+                    regions.append({'finding': 'Pneumonia', 'box': tiles.box(i), 'score': pred['score']})
+        analyzed += len(batch)
+    return regions, analyzed
+
+
+def _merge_overlapping(regions):
+    """Merge same-kind regions whose boxes intersect into one region covering both.
+
+    Mask and line findings have tight boxes, so only the same structure seen
+    from two tiles merges; model findings cover their whole tile, so
+    neighbouring positive tiles become one contiguous region.
+    """
+    merged = []
+    for region in regions:
+        region = {**region, 'box': list(region['box']), 'tiles': region.get('tiles', 1)}
+        # Absorb every earlier region it touches, which may chain several together
+        while True:
+            other = next((m for m in merged if m['finding'] == region['finding'] and _intersects(m['box'], region['box'])), None)
+            if other is None:
+                break
+            merged.remove(other)
+            region['box'] = [min(other['box'][0], region['box'][0]), min(other['box'][1], region['box'][1]),
+                             max(other['box'][2], region['box'][2]), max(other['box'][3], region['box'][3])]
+            region['score'] = max(other['score'], region['score'])
+            region['tiles'] += other['tiles']
+        merged.append(region)
+    return merged
+
+
+def _intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+TILED_FINDINGS = {
+    'Foreign Object': "Possible foreign object or metal implant detected in {n} high-resolution region(s)",
+    'Fracture Lines': "Potential fracture lines detected in {n} high-resolution region(s)",
+    'Consolidation': "Pulmonary consolidation detected in {n} high-resolution region(s)",
+    'Pneumothorax': "Possible pneumothorax in {n} high-resolution region(s)",
+    'Pneumonia': "Pneumonia detected in {n} high-resolution region(s)"
+}
+
+
+def _merge(result, scan_type, regions):
+    """Fold tile regions into the result's findings, one finding per kind"""
+    findings = [] if result['status'] == 'Normal' else list(result['detected_conditions'])
+    confidence_scores = result['confidence_scores']
+
+    for kind, message in TILED_FINDINGS.items():
+        matches = [r for r in regions if r['finding'] == kind]
+        if not matches:
+            continue
+        findings.append(message.format(n=len(matches)))
+        key = f"{kind} (tiled)"
+        confidence_scores[key] = max(r['score'] for r in matches)
+
+    if not findings:
+        return
+    result['status'] = 'Abnormal'
+    result['detected_conditions'] = findings
+    # Same recommendation rules as the standard analyzers
+    if scan_type == 'xray':
+        result['recommendations'] = ["Orthopedic consultation recommended"] if any("fracture" in f.lower() for f in findings) else ["Radiologist review recommended"]
+    else:
+        result['recommendations'] = ["Urgent pulmonologist consultation"] if any("pneumonia" in f.lower() for f in findings) else ["Pulmonologist consultation recommended"]
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from model_registry import PRELOAD_MODELS
+from scan_context import ScanContext
+
+# When to warm up after startup:
+#   background - in a thread; /ready reports 503 until it finishes (default)
+#   sync       - before the app serves anything (used under gunicorn, before fork)
+#   off        - never; /ready reports ready immediately
+WARMUP_MODES = ('background', 'sync', 'off')
+WARMUP_MODE = os.environ.get('SCANS_WARMUP', 'background')
+
+# Dummy scan sizes run through every path; the first is also the model batch
+WARMUP_SIZES = [(512, 512), (768, 1024)]
+
+# Models already loaded (SCANS_PRELOAD_MODELS) are always warmed. Scan types
+# listed here, e.g. "mri,skin", are also loaded before the service reports
+# ready; every other model stays lazy, within the memory budget
+WARMUP_MODELS = os.environ.get('SCANS_WARMUP_MODELS', '')
+
+
+def warmup_image(width, height, seed=0):
+    """Synthetic scan with soft structure, so contours and thresholds do real work"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    blob = np.exp(-(((x - width / 2) / (0.3 * width)) ** 2 + ((y - height / 2) / (0.35 * height)) ** 2))
+    gray = np.clip(50 + 150 * blob + rng.normal(0, 10, blob.shape), 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+class WarmUp:
+    """Runs dummy scans through the loaded models and every analyze_* path.
+
+    The first real request then finds its model loaded, lazy allocations
+    made, kernels selected and image processors initialised. Analyzers are
+    called directly rather than through analyze_scan, so nothing is cached
+    or counted as a served analysis. Only models named in ``extra_models``
+    are loaded for it; the rest keep their lazy loading.
+    """
+
+    def __init__(self, analyzer, extra_models=WARMUP_MODELS, preload_models=PRELOAD_MODELS):
+        self.analyzer = analyzer
+        self.extra_models = [t.strip() for t in extra_models.split(',') if t.strip()]
+        self.preload_models = list(preload_models)
+        self.status = 'pending'
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.model_timings = {}
+        self.analyzer_timings = {}
+        self._lock = threading.Lock()
+
+    def start(self, mode=WARMUP_MODE):
+        if mode not in WARMUP_MODES:
+            print(f"⚠️ Unknown SCANS_WARMUP '{mode}', warming up in the background")
+            mode = 'background'
+        if mode == 'off':
+            self.status = 'skipped'
+            return
+        if mode == 'sync':
+            self.run()
+            return
+        threading.Thread(target=self.run, name='warmup', daemon=True).start()
+
+    @property
+    def ready(self):
+        return self.status in ('done', 'skipped', 'failed')
+
+    def run(self):
+        with self._lock:
+            if self.status == 'running':
+                return
+            self.status = 'running'
+            self.started_at = time.time()
+
+        print("🔥 Warming up models and analyzers...")
+        try:
+            images = [warmup_image(w, h, seed=i) for i, (w, h) in enumerate(WARMUP_SIZES)]
+            self._warm_models(images)
+            self._warm_analyzers(images)
+            self.status = 'done'
+            print(f"🔥 Warm-up complete in {self.elapsed_ms():.0f} ms")
+        except Exception as e:
+            # A failed warm-up only costs latency, so the service still becomes ready
+            self.error = str(e)
+            self.status = 'failed'
+            print(f"⚠️ Warm-up failed after {self.elapsed_ms():.0f} ms: {e}")
+        finally:
+            self.finished_at = time.time()
+
+    def model_types(self):
+        """Opted-in extras first, then the loaded and preloaded models, without repeats"""
+        # Warmed last, the hot models are the most recently used and outlast
+        # the extras if the memory budget has to evict
+        candidates = self.extra_models + self.analyzer.models.keys() + self.preload_models
+        return [t for t in dict.fromkeys(candidates) if t in self.analyzer.models.specs]
+
+    def _warm_models(self, images):
+        for scan_type in self.model_types():
+            with self.analyzer.models.lease(scan_type) as model:
+                if model is None:
+                    print(f"⚠️ Warm-up skipped {scan_type}: no model could be loaded")
+                    continue
+                self._warm_model(scan_type, model, images)
+
+    def _warm_model(self, scan_type, model, images):
+        context = ScanContext(images[0], scan_type)
+        started = time.perf_counter()
+        model(context.rgb_pil)
+        single_ms = (time.perf_counter() - started) * 1000
+
+        # Batched shapes take their own kernel paths
+        started = time.perf_counter()
+        model.predict_batch([ScanContext(image, scan_type).rgb_pil for image in images])
+        batch_ms = (time.perf_counter() - started) * 1000
+
+        self.model_timings[scan_type] = {
+            'model': self.analyzer.models.model_name(scan_type),
+            'single_ms': round(single_ms, 2),
+            'batch_ms': round(batch_ms, 2)
+        }
+
+    def _warm_analyzers(self, images):
+        for scan_type in self.analyzer.scan_types:
+            analyze = getattr(self.analyzer, f"analyze_{scan_type}")
+            started = time.perf_counter()
+            # Models left out of warm-up stay unloaded; their types warm the CV path only
+            with self.analyzer.models.loaded_only():
+                for image in images:
+                    context = ScanContext(image, scan_type)
+                    self.analyzer.validate_scan_type(context, scan_type)
+                    analyze(context)
+                    context.perceptual_hash
+            self.analyzer_timings[scan_type] = round((time.perf_counter() - started) * 1000, 2)
+
+    def elapsed_ms(self):
+        if self.started_at is None:
+            return 0.0
+        return ((self.finished_at or time.time()) - self.started_at) * 1000
+
+    def report(self):
+        return {
+            'ready': self.ready,
+            'status': self.status,
+            'error': self.error,
+            'elapsed_ms': round(self.elapsed_ms(), 2),
+            'models': self.model_timings,
+            'analyzers': self.analyzer_timings
+        }